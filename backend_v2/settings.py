@@ -30,6 +30,8 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    # Trigram lookups for instrument search
+    "django.contrib.postgres",
     "corsheaders",
     "rest_framework",
     "rest_framework_simplejwt",
@@ -137,6 +139,22 @@ SIMPLE_JWT = {
     # ... other settings
 }
 
+# Shared by every worker so the data version and cached responses are the same whichever worker answers
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": env("CACHE_DIR", default="/tmp/django_cache"),
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+    # Data versions and response cache counters every worker must agree on. Only a few keys live here, so they
+    # are never culled to make room for cached responses
+    "state": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": env("STATE_CACHE_DIR", default="/tmp/django_state"),
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    },
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -181,6 +199,15 @@ AWS_SECRET_ACCESS_KEY = env("AWS_SECRET_ACCESS_KEY")
 AWS_DEFAULT_REGION = env("AWS_DEFAULT_REGION")
 AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")
 
+# Downloaded London Stock Exchange reports, kept for conditional refetches
+LSE_REPORT_CACHE_DIR = env("LSE_REPORT_CACHE_DIR", default=os.path.join(BASE_DIR, ".report_cache"))
+
+# Memory-mapped screener snapshot shared by the workers on this host
+SCREENER_SNAPSHOT_DIR = env("SCREENER_SNAPSHOT_DIR", default=os.path.join(BASE_DIR, ".screener_snapshot"))
+
+# Lock files that let one worker on this host render a response while the others wait for it
+SINGLE_FLIGHT_LOCK_DIR = env("SINGLE_FLIGHT_LOCK_DIR", default="/tmp/django_single_flight")
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -1,13 +1,33 @@
 from django.contrib import admin
 from .models import (
     Equity, Etp, Bond, MonthlyVolume, WeeklyVolume, Region, SubRegion, Country,
-    ManualMeta, TradingView, Watchlist, Book, CurrentInvestment, Portfolio, Currency
+    ManualMeta, TradingView, Watchlist, Book, CurrentInvestment, Portfolio, Currency, Instrument,
+    Trade, PositionSnapshot
 )
 
+
+
+class LedgerAdmin(admin.ModelAdmin):
+    """
+    Read only, as positions and the trade ledger are only written through record_trade and import_trades,
+    which keep the two in step.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 # Register your models here.
 admin.site.register(Equity)
 admin.site.register(Etp)
 admin.site.register(Bond)
+admin.site.register(Instrument)
 admin.site.register(MonthlyVolume)
 admin.site.register(WeeklyVolume)
 admin.site.register(Region)
@@ -17,7 +37,9 @@ admin.site.register(ManualMeta)
 admin.site.register(TradingView)
 admin.site.register(Watchlist)
 admin.site.register(Book)
-admin.site.register(CurrentInvestment)
+admin.site.register(CurrentInvestment, LedgerAdmin)
+admin.site.register(Trade, LedgerAdmin)
+admin.site.register(PositionSnapshot, LedgerAdmin)
 admin.site.register(Portfolio)
 admin.site.register(Currency)
 
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class InvestmentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'investment'
+
+    def ready(self):
+        # Register the signal receivers
+        from investment import signals  # noqa: F401
@@ -89,6 +89,13 @@ INSTRUMENT_MODEL_MAP = {
     "2.3 ETNs": {"model": 'Etp'},
 }
 
+# Instrument type of each instrument table, in the order a ticker found in more than one is taken from
+INSTRUMENT_TYPES = {
+    "Equity": "equity",
+    "Etp": "etp",
+    "Bond": "bond",
+}
+
 
 ########################################### Monthly volume worksheet constants ################################
 MONTHLY_EQUITY_SHEET = "Trading Summary Factsheet"
@@ -177,6 +184,66 @@ TRADINGVIEW_COLS = {
                 'Volatility Week': 'vol_1m'
             }
 
+# Maximum number of rows sent in a single INSERT ... ON CONFLICT statement
+UPSERT_BATCH_SIZE = 5000
+# Number of dataframe rows rendered to CSV at a time when streaming with COPY
+COPY_CHUNK_ROWS = 10000
+# Longest a shadow table swap waits for readers to release the live table before giving up
+SWAP_LOCK_TIMEOUT = "10s"
+# Number of months and Fridays checked, newest first, when looking for the latest LSE report
+LOCATOR_MONTHLY_CANDIDATES = 2
+LOCATOR_WEEKLY_CANDIDATES = 3
+# Seconds to wait for a HEAD probe of an LSE report URL
+LOCATOR_PROBE_TIMEOUT = 10
+# Worker processes used to parse LSE workbooks in parallel
+PARSE_WORKERS = 2
+# Reports downloaded at once by the backfill_volumes command
+BACKFILL_FETCH_WORKERS = 4
+# Seconds a rendered response is kept in the cache. Responses are also dropped whenever the data version moves
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+# Streamed responses up to this many bytes are read whole and cached like any other. Larger ones keep streaming
+# and are rendered on every miss, so a worker never holds one whole. The full screener is well under it
+RESPONSE_CACHE_MAX_STREAMED_BYTES = 8 * 1024 * 1024
+# Seconds a request waits for an identical one in another thread or worker to render the response before it
+# renders it itself
+SINGLE_FLIGHT_TIMEOUT = 30
+# Seconds between checks of the cache while another worker renders the response
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+# The screener's default order. Every field but the last may be NULL, which sorts as SORT_KEY_NULL
+SCREENER_ORDERING = ["asset_class", "region", "country", "objective", "ticker"]
+# Stands in for NULL in sort keys, so they can be compared as one row value. Missing values sort first
+SORT_KEY_NULL = ""
+# Screener fields filtered by exact match, with a comma separated list of values matching any of them
+SCREENER_EXACT_FILTERS = [
+    "asset_class",
+    "region",
+    "sub_region",
+    "country",
+    "objective",
+    "hedge_ccy",
+    "trading_currency",
+    "technical_rating",
+]
+# Numeric screener fields that can be filtered on a threshold or ordered by
+SCREENER_NUMERIC_FIELDS = [
+    "price",
+    "perf_weekly",
+    "perf_monthly",
+    "perf_3m",
+    "perf_ytd",
+    "perf_6m",
+    "vol_1w",
+    "vol_1m",
+    "turnover_monthly",
+    "num_trades_monthly",
+    "volume_monthly",
+    "avg_trade_size_monthly",
+    "turnover_weekly",
+    "num_trades_weekly",
+    "avg_spread",
+    "avg_trade_size_weekly",
+]
+
 # Weeky Volume dataframe dtypes mapping if not text
 TRADINGVIEW_DTYPES = {
     "price": {"dtype": "float64"},
@@ -187,4 +254,34 @@ TRADINGVIEW_DTYPES = {
     "perf_6m": {"dtype": "float64"},
     "vol_1w": {"dtype": "float64"},
     "vol_1m": {"dtype": "float64"},
-}
\ No newline at end of file
+}
+# Tables indexed for autocomplete, with the isin field, if any, and the name fields. A result is named by the
+# first name field and every word of every name field can be matched from its start
+AUTOCOMPLETE_SOURCES = {
+    "TradingView": {"isin": None, "names": ["description"]},
+    "Equity": {"isin": "isin", "names": ["issuer_name", "instrument_name"]},
+    "Bond": {"isin": "isin", "names": ["instrument_name", "issuer_name"]},
+    "Etp": {"isin": "isin", "names": ["instrument_name", "issuer_name"]},
+}
+# Bytes of each autocomplete key kept in the index. Longer queries are checked against the full names
+AUTOCOMPLETE_KEY_WIDTH = 32
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# Text fields searched in each instrument table with their full text search weight, names above sectors
+INSTRUMENT_SEARCH_FIELDS = {
+    "Equity": {"issuer_name": "A", "instrument_name": "B", "icb_super_sector": "C"},
+    "Bond": {"issuer_name": "A", "instrument_name": "B"},
+    "Etp": {"instrument_name": "A", "issuer_name": "B"},
+}
+# Text search configuration. "simple" neither stems nor drops stop words, which suits names
+INSTRUMENT_SEARCH_CONFIG = "simple"
+INSTRUMENT_SEARCH_PAGE_SIZE = 20
+# Name fields matched by trigram word similarity when full text search finds nothing, so a typo still matches
+INSTRUMENT_TRIGRAM_FIELDS = ["issuer_name", "instrument_name"]
+
+# Portfolio valuation breakdowns, in the order they are returned
+VALUATION_DIMENSIONS = ["book", "asset_class", "region", "objective", "currency"]
+
+# Most trades accepted by one batch trade import
+TRADE_IMPORT_MAX_ROWS = 50000
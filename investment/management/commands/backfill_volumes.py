@@ -0,0 +1,153 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+import investment.constants as constants
+from investment.models import MonthlyVolumeHistory, WeeklyVolumeHistory
+from investment.utils.db_utils import copy_merge_dataframe
+from investment.utils.excel_utils import (
+    combine_monthly_volumes,
+    parse_pool,
+    parse_volume_sheet,
+    parse_weekly_volume,
+)
+from investment.utils.report_utils import (
+    ReportCache,
+    month_end,
+    monthly_equity_report_url,
+    monthly_etp_report_url,
+    previous_friday,
+    weekly_report_url,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load past LSE weekly and monthly volume reports into the volume history tables. "
+        "Periods already stored are skipped, so an interrupted run can simply be started again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", type=date.fromisoformat, required=True, help="YYYY-MM-DD")
+        parser.add_argument("--to", dest="end", type=date.fromisoformat, help="YYYY-MM-DD, defaults to today")
+        parser.add_argument("--period", choices=["weekly", "monthly", "both"], default="both")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=constants.BACKFILL_FETCH_WORKERS,
+            help="Maximum number of reports downloaded at once",
+        )
+
+    def handle(self, *args, **options):
+        options["end"] = options["end"] or date.today()
+        if options["start"] > options["end"]:
+            raise CommandError("--from must not be after --to")
+        self.cache = ReportCache()
+        if options["period"] in ("weekly", "both"):
+            self.backfill(
+                WeeklyVolumeHistory,
+                self.weekly_periods(options["start"], options["end"]),
+                self.fetch_weekly,
+                options["workers"],
+            )
+        if options["period"] in ("monthly", "both"):
+            self.backfill(
+                MonthlyVolumeHistory,
+                self.monthly_periods(options["start"], options["end"]),
+                self.fetch_monthly,
+                options["workers"],
+            )
+
+    def weekly_periods(self, start, end):
+        """Every Friday between start and end."""
+        friday = previous_friday(end)
+        periods = []
+        while friday >= start:
+            periods.append(friday)
+            friday -= timedelta(weeks=1)
+        return periods
+
+    def monthly_periods(self, start, end):
+        """The first day of every complete month between start and end."""
+        period = start.replace(day=1)
+        periods = []
+        while month_end(period) <= end:
+            periods.append(period)
+            period = month_end(period) + timedelta(days=1)
+        return periods
+
+    def fetch_weekly(self, period):
+        """Download and parse one weekly report. Runs in a fetch thread while the parse runs in the parse pool."""
+        url = weekly_report_url(period)
+        res = self.cache.fetch(url)
+        if res.status_code != 200:
+            return None, [], f"status {res.status_code}"
+        df, _ = parse_pool().submit(parse_weekly_volume, res.content).result()
+        return df.assign(period_end=period), [url], None
+
+    def fetch_monthly(self, period):
+        """Download and parse one month's equity and ETP reports."""
+        urls = [monthly_equity_report_url(period), monthly_etp_report_url(period)]
+        responses = [self.cache.fetch(url) for url in urls]
+        failed = [res for res in responses if res.status_code != 200]
+        if failed:
+            return None, [], f"status {failed[0].status_code} for {failed[0].url}"
+        res, etp_res = responses
+        futures = [
+            parse_pool().submit(
+                parse_volume_sheet,
+                res.content,
+                constants.MONTHLY_EQUITY_SHEET,
+                constants.MONTHLY_EQUITY_VOLUME_MAP,
+                constants.MONTHLY_EQUITY_VOLUME_SKIP_ROWS,
+            ),
+            parse_pool().submit(
+                parse_volume_sheet,
+                etp_res.content,
+                constants.MONTHLY_ETP_SHEET,
+                constants.MONTHLY_ETP_VOLUME_MAP,
+                constants.MONTHLY_ETP_VOLUME_SKIP_ROWS,
+            ),
+        ]
+        (df_equity, _), (df_etp, _) = [future.result() for future in futures]
+        df, _ = combine_monthly_volumes(df_equity, df_etp)
+        return df.assign(period_end=month_end(period)), urls, None
+
+    def backfill(self, model, periods, fetch, workers):
+        """
+        Fetch the periods that are not stored yet with a bounded number of concurrent downloads and load
+        each one in its own transaction as soon as it has been parsed.
+        """
+        name = model._meta.verbose_name_plural
+        stored = set(model.objects.values_list("period_end", flat=True).distinct())
+        if model is MonthlyVolumeHistory:
+            todo = [period for period in periods if month_end(period) not in stored]
+        else:
+            todo = [period for period in periods if period not in stored]
+        self.stdout.write(f"{name}: {len(periods)} periods in range, {len(periods) - len(todo)} already stored")
+
+        loaded = missing = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(fetch, period): period for period in todo}
+            for future in as_completed(futures):
+                period = futures[future]
+                try:
+                    df, urls, error = future.result()
+                except Exception as e:
+                    df, urls, error = None, [], str(e)
+                if df is None or df.empty:
+                    missing += 1
+                    self.stderr.write(f"{name} {period}: skipped, {error or 'no rows'}")
+                    continue
+                # Each period commits on its own so an interrupted run keeps everything loaded so far
+                copy_merge_dataframe(model, df, conflict_fields=("ticker", "period_end"), prune=False)
+                for url in urls:
+                    self.cache.mark_processed(url)
+                loaded += 1
+                self.stdout.write(f"{name} {period}: {len(df)} rows")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{name}: {loaded} periods loaded, {missing} skipped. Report cache: {self.cache.stats}")
+        )
@@ -0,0 +1,487 @@
+import io
+import logging
+import tempfile
+import time
+import numpy as np
+import openpyxl
+import pandas as pd
+import investment.constants as constants
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from investment.models import (
+    Book,
+    Currency,
+    CurrentInvestment,
+    Equity,
+    Instrument,
+    ManualMeta,
+    Region,
+    Screener,
+    TradingView,
+)
+from investment.serializers import TradingviewObjectiveSerializer
+from investment.utils.json_utils import serializer_json, serializer_sources
+from investment.views import PortfolioValuationView, TradingviewObjectiveViewSet
+from investment.utils.db_utils import upsert_dataframe, copy_merge_dataframe
+from investment.utils.excel_utils import parse_volume_sheet, parse_pool
+from investment.utils.search_utils import PrefixSegment, autocomplete, instrument_search
+from investment.utils.trade_utils import import_trades, record_trade
+import investment.utils.valuation_utils as valuation_utils
+from investment.utils.valuation_utils import load_positions, value_positions
+
+logger = logging.getLogger(__name__)
+
+
+def tradingview_frame(rows, seed=0):
+    """Build a synthetic TradingView frame with the same columns as a formatted TradingView csv."""
+    rng = np.random.default_rng(seed)
+    ratings = np.array(["Strong Buy", "Buy", "Neutral", "Sell", "Strong Sell"])
+    df = pd.DataFrame({
+        "ticker": [f"BENCH{i:06d}" for i in range(rows)],
+        "description": [f"Benchmark instrument {i}" for i in range(rows)],
+        "technical_rating": rng.choice(ratings, rows),
+        "oscillators_rating": rng.choice(ratings, rows),
+        "moving_avg_rating": rng.choice(ratings, rows),
+    })
+    for col in ["price", "perf_weekly", "perf_monthly", "perf_3m", "perf_ytd", "perf_6m", "vol_1w", "vol_1m"]:
+        df[col] = rng.normal(100, 25, rows)
+    return df
+
+
+def equity_frame(rows, seed=0):
+    """Build a synthetic frame shaped like the formatted "1.1 Shares" sheet of the LSE instrument workbook."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "ticker": [f"BENCH{i:06d}" for i in range(rows)],
+        "issuer_name": [f"Benchmark Issuer {i} PLC" for i in range(rows)],
+        "instrument_name": "ORD GBP0.01",
+        "isin": [f"GB{i:010d}" for i in range(rows)],
+        "mifir_identifier_code": "SHRS",
+        "icb_industry": rng.choice(["Financials", "Industrials", "Technology"], rows),
+        "icb_super_sector": rng.choice(["Banks", "Construction and Materials", "Technology"], rows),
+        "start_date": pd.Timestamp("2001-01-02") + pd.to_timedelta(rng.integers(0, 8000, rows), unit="D"),
+        "country_of_incorporation": "United Kingdom",
+        "trading_currency": "GBX",
+        "mkt_cap_mm": rng.lognormal(5, 2, rows),
+        "lse_market": "MAIN MARKET",
+        "fca_listing_category": "EQUITY SHARES (COMMERCIAL COMPANIES)",
+        "market_segment_code": "SET1",
+        "market_sector_code": "FE10",
+    })
+
+
+def volume_workbook(sheet, headers, rows, skip_rows, seed=0):
+    """Build an xlsx shaped like an LSE monthly volume workbook with random tickers and figures."""
+    rng = np.random.default_rng(seed)
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(sheet)
+    for _ in range(skip_rows):
+        ws.append([])
+    ws.append(headers)
+    for i in range(rows):
+        figures = rng.integers(1, 10 ** 6, len(headers) - 2).tolist()
+        ws.append([f"B{i:05d}", f"GB{i:010d}"] + figures)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def monthly_workbooks(rows):
+    """Synthetic equity and ETP monthly volume workbooks as the args for parse_volume_sheet."""
+    equity_headers = ["TIDM", "ISIN", "Value Traded (£)", "Trades", "Volume"]
+    # The ETP sheet repeats its value and trade counts per trading venue and the last group is the total
+    etp_headers = ["TIDM", "ISIN"] + ["Value of Trades (£)", "Number of Trades"] * 5 + ["Volume"]
+    return [
+        (
+            volume_workbook(constants.MONTHLY_EQUITY_SHEET, equity_headers, rows, constants.MONTHLY_EQUITY_VOLUME_SKIP_ROWS),
+            constants.MONTHLY_EQUITY_SHEET,
+            constants.MONTHLY_EQUITY_VOLUME_MAP,
+            constants.MONTHLY_EQUITY_VOLUME_SKIP_ROWS,
+        ),
+        (
+            volume_workbook(constants.MONTHLY_ETP_SHEET, etp_headers, rows, constants.MONTHLY_ETP_VOLUME_SKIP_ROWS),
+            constants.MONTHLY_ETP_SHEET,
+            constants.MONTHLY_ETP_VOLUME_MAP,
+            constants.MONTHLY_ETP_VOLUME_SKIP_ROWS,
+        ),
+    ]
+
+
+def screener_rows(rows, seed=0):
+    """Synthetic Screener rows with some missing metadata and volumes, and prices on half-penny ties."""
+    rng = np.random.default_rng(seed)
+    ratings = ["Strong Buy", "Buy", "Neutral", "Sell", "Strong Sell"]
+    objs = []
+    for i in range(rows):
+        figures = {
+            col: float(rng.normal(0, 50))
+            for col in ["perf_weekly", "perf_monthly", "perf_3m", "perf_ytd", "perf_6m", "vol_1w", "vol_1m"]
+        }
+        has_volume = i % 5 != 0
+        objs.append(Screener(
+            ticker=f"BENCH{i:06d}",
+            description=f"Benchmark instrument {i} – “quoted”",
+            technical_rating=ratings[i % 5],
+            oscillators_rating=ratings[(i + 1) % 5],
+            moving_avg_rating=ratings[(i + 2) % 5],
+            # Three decimal places so a share of prices are exact half-penny ties
+            price=round(float(rng.uniform(1, 5000)), 3),
+            asset_class=["Equity", "Fixed Income", None][i % 3],
+            objective="Growth" if i % 4 else None,
+            trading_currency="GBX",
+            turnover_monthly=float(rng.uniform(0, 10 ** 9)) if has_volume else None,
+            num_trades_monthly=int(rng.integers(0, 10 ** 5)) if has_volume else None,
+            volume_monthly=float(rng.uniform(0, 10 ** 8)) if has_volume else None,
+            avg_trade_size_monthly=float(rng.uniform(0, 10 ** 5)) if has_volume else None,
+            avg_spread=float(rng.uniform(0, 200)) if has_volume else None,
+            **figures,
+        ))
+    return objs
+
+
+def portfolio_rows(positions, seed=0):
+    """Save a synthetic portfolio of positions spread over books, currencies and metadata, with a few unpriced."""
+    rng = np.random.default_rng(seed)
+    tickers = [f"BENCH{i:06d}" for i in range(positions)]
+    currencies = {"GBP": 1, "GBX": 0.01, "USD": 0.79, "EUR": 0.85}
+    Currency.objects.bulk_create([Currency(name=name, gbp_value=rate) for name, rate in currencies.items()])
+    books = Book.objects.bulk_create([Book(name=name) for name in ["ISA", "SIPP", "GIA"]])
+    regions = Region.objects.bulk_create([Region(name=name) for name in ["Global", "Europe", "Asia", "Americas"]])
+    Instrument.objects.bulk_create(
+        Instrument(ticker=ticker, isin=f"GB{i:010d}", instrument_type="etp", trading_currency=currency)
+        for i, (ticker, currency) in enumerate(zip(tickers, rng.choice(list(currencies), positions)))
+    )
+    prices = rng.lognormal(4, 1, positions)
+    TradingView.objects.bulk_create(
+        TradingView(ticker=ticker, description=ticker, price=price)
+        for ticker, price in zip(tickers, prices)
+        if price > 5
+    )
+    ManualMeta.objects.bulk_create(
+        ManualMeta(ticker=ticker, asset_class=asset_class, region=region, objective=objective)
+        for ticker, asset_class, region, objective in zip(
+            tickers,
+            rng.choice(["Equity", "Fixed Income", "Commodity"], positions),
+            rng.choice(regions, positions),
+            rng.choice(["Growth", "Income", "Hedge"], positions),
+        )
+    )
+    CurrentInvestment.objects.bulk_create(
+        CurrentInvestment(ticker_id=ticker, book=book, qty=qty, avg_px=price * rng.uniform(0.7, 1.3), current_px=0)
+        for ticker, book, qty, price in zip(
+            tickers, rng.choice(books, positions), rng.integers(1, 10000, positions), prices
+        )
+    )
+
+
+def trade_rows(trades, tickers=1000, seed=0):
+    """
+    Save books and instruments and return a batch of trade rows over them, as import_trades takes them.
+    Sells never exceed the quantity bought before them.
+    """
+    rng = np.random.default_rng(seed)
+    books = [book.name for book in Book.objects.bulk_create([Book(name=name) for name in ["ISA", "SIPP", "GIA"]])]
+    instruments = Instrument.objects.bulk_create(
+        Instrument(ticker=f"BENCH{i:06d}", isin=f"GB{i:010d}", instrument_type="etp") for i in range(tickers)
+    )
+    held, rows = {}, []
+    start = pd.Timestamp("2024-01-01", tz="UTC")
+    for i, (book, instrument, qty, price) in enumerate(zip(
+        rng.choice(books, trades),
+        rng.choice(instruments, trades),
+        rng.integers(1, 1000, trades).tolist(),
+        rng.lognormal(4, 1, trades).round(4).tolist(),
+    )):
+        key = (book, instrument.ticker)
+        # About a third of the trades sell part of what is held
+        if held.get(key) and rng.random() < 0.35:
+            qty = -min(qty, held[key])
+        held[key] = held.get(key, 0) + qty
+        rows.append({
+            "book": book,
+            "ticker": instrument.ticker,
+            "qty": qty,
+            "transaction_px": price,
+            "executed_at": (start + pd.Timedelta(seconds=i)).isoformat(),
+        })
+    return rows
+
+
+def legacy_trade_writes(rows):
+    """One trade at a time, with the lookups of update-current-investments, kept for comparison."""
+    for row in rows:
+        record_trade(
+            Book.objects.get(name=row["book"]),
+            Instrument.objects.get(ticker=row["ticker"]),
+            row["qty"],
+            row["transaction_px"],
+            executed_at=pd.Timestamp(row["executed_at"]).to_pydatetime(),
+        )
+
+
+def legacy_instrument_write(model, df):
+    """The previous per-row model construction followed by delete and bulk_create, kept for comparison."""
+    objs = [model(**{col: row[col] for col in df.columns}) for _, row in df.iterrows()]
+    model.objects.all().delete()
+    model.objects.bulk_create(objs)
+
+
+def legacy_tradingview_write(df):
+    """The previous create/update split with one UPDATE per existing ticker, kept for comparison."""
+    dicts = df.to_dict("records")
+    existing_tickers = set(
+        TradingView.objects.filter(ticker__in=[row["ticker"] for row in dicts]).values_list("ticker", flat=True)
+    )
+    new_objs = [TradingView(**row) for row in dicts if row["ticker"] not in existing_tickers]
+    update_objs = [TradingView(**row) for row in dicts if row["ticker"] in existing_tickers]
+    with transaction.atomic():
+        TradingView.objects.bulk_create(new_objs, ignore_conflicts=True)
+        for obj in update_objs:
+            TradingView.objects.filter(ticker=obj.ticker).update(
+                **{field: getattr(obj, field) for field in df.columns}
+            )
+
+
+class Command(BaseCommand):
+    help = "Benchmark database write paths. Every run is rolled back so no data is changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", choices=list(self.default_rows), help="The code path to benchmark")
+        parser.add_argument("--rows", type=int, nargs="+", help="Frame sizes to test")
+
+    # Frame sizes used for each target when --rows is not given
+    default_rows = {
+        "upsert": [500, 2000, 8000],
+        "lse-load": [5000, 20000, 50000],
+        "monthly-parse": [2000, 10000],
+        "screener-json": [1000, 5000],
+        "screener-latency": [3000],
+        "autocomplete": [50000],
+        "search": [1000, 100000],
+        "valuation": [1000, 5000],
+        "trade-import": [1000, 5000],
+    }
+
+    def handle(self, *args, **options):
+        target = options["target"]
+        getattr(self, f"bench_{target.replace('-', '_')}")(options["rows"] or self.default_rows[target])
+
+    def run_rolled_back(self, fn, setup=None):
+        """Run setup then fn inside a transaction that is always rolled back, returning fn's (seconds, statements)."""
+        with transaction.atomic():
+            if setup:
+                setup()
+            # The log keeps only the latest 9000 queries, after which the captured count stops growing
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                fn()
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return elapsed, len(ctx.captured_queries)
+
+    def bench_upsert(self, sizes):
+        self.stdout.write(f"{'rows':>8} {'path':>8} {'seconds':>9} {'round trips':>12}")
+        for rows in sizes:
+            df = tradingview_frame(rows)
+            # Half of the tickers already exist so both the insert and the update branches are exercised
+            existing = df.iloc[: rows // 2]
+            paths = [
+                ("legacy", lambda: legacy_tradingview_write(df)),
+                ("upsert", lambda: upsert_dataframe(TradingView, df)),
+            ]
+            for name, write in paths:
+                elapsed, statements = self.run_rolled_back(write, setup=lambda: upsert_dataframe(TradingView, existing))
+                self.stdout.write(f"{rows:>8} {name:>8} {elapsed:>9.3f} {statements:>12}")
+
+    def bench_lse_load(self, sizes):
+        self.stdout.write(f"{'rows':>8} {'path':>8} {'seconds':>9} {'rows/sec':>10}")
+        for rows in sizes:
+            df = equity_frame(rows)
+            # Most rows already exist, as they do on a monthly refresh
+            existing = df.sample(frac=0.9, random_state=0)
+            paths = [
+                ("legacy", lambda: legacy_instrument_write(Equity, df)),
+                ("copy", lambda: copy_merge_dataframe(Equity, df)),
+            ]
+            for name, write in paths:
+                elapsed, _ = self.run_rolled_back(write, setup=lambda: copy_merge_dataframe(Equity, existing))
+                self.stdout.write(f"{rows:>8} {name:>8} {elapsed:>9.3f} {rows / elapsed:>10.0f}")
+
+    def bench_monthly_parse(self, sizes):
+        self.stdout.write(f"{'rows':>8} {'path':>10} {'seconds':>9}")
+        # Start the pool before timing as gunicorn workers keep it between requests
+        parse_pool().submit(int).result()
+        for rows in sizes:
+            workbooks = monthly_workbooks(rows)
+            start = time.perf_counter()
+            for args in workbooks:
+                parse_volume_sheet(*args)
+            self.stdout.write(f"{rows:>8} {'sequential':>10} {time.perf_counter() - start:>9.3f}")
+            start = time.perf_counter()
+            futures = [parse_pool().submit(parse_volume_sheet, *args) for args in workbooks]
+            for future in futures:
+                future.result()
+            self.stdout.write(f"{rows:>8} {'pool':>10} {time.perf_counter() - start:>9.3f}")
+
+    def bench_screener_json(self, sizes):
+        self.stdout.write(f"{'rows':>8} {'path':>10} {'seconds':>9} {'bytes':>10}")
+        serializer_class = TradingviewObjectiveSerializer
+        for rows in sizes:
+            with transaction.atomic():
+                Screener.objects.bulk_create(screener_rows(rows))
+                queryset = TradingviewObjectiveViewSet().get_queryset()
+
+                start = time.perf_counter()
+                drf = JSONRenderer().render(serializer_class(queryset, many=True).data)
+                drf_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                serializer = serializer_class()
+                values = list(queryset.values_list(*serializer_sources(serializer)))
+                fast = serializer_json(serializer, values).encode()
+                fast_seconds = time.perf_counter() - start
+                transaction.set_rollback(True)
+
+            self.stdout.write(f"{rows:>8} {'drf':>10} {drf_seconds:>9.3f} {len(drf):>10}")
+            self.stdout.write(f"{rows:>8} {'values':>10} {fast_seconds:>9.3f} {len(fast):>10}")
+            if fast != drf:
+                self.stderr.write(f"{rows:>8} output differs from the serializer")
+
+    # Requests replayed by bench_screener_latency
+    latency_queries = [
+        "",
+        "?objective=Growth",
+        "?asset_class=Equity&min_turnover_monthly=100000000",
+        "?ordering=-turnover_monthly&limit=50",
+    ]
+
+    def bench_screener_latency(self, sizes, repeats=100):
+        self.stdout.write(f"{'rows':>8} {'query':<52} {'path':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        factory = RequestFactory()
+        paths = [
+            ("sql", TradingviewObjectiveViewSet.as_view({"get": "list"}, use_snapshot=False)),
+            ("snapshot", TradingviewObjectiveViewSet.as_view({"get": "list"})),
+        ]
+        # No response cache, so every request runs the view. The data version is then always None, so the
+        # snapshot is built by the first request and reused
+        dummy_cache = {
+            alias: {"BACKEND": "django.core.cache.backends.dummy.DummyCache"} for alias in ("default", "state")
+        }
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            CACHES=dummy_cache, SCREENER_SNAPSHOT_DIR=directory
+        ):
+            for rows in sizes:
+                with transaction.atomic():
+                    Screener.objects.bulk_create(screener_rows(rows))
+                    for query in self.latency_queries:
+                        for name, view in paths:
+                            view(factory.get(f"/api/investment/tradingview/{query}"))
+                            timings = []
+                            for _ in range(repeats):
+                                start = time.perf_counter()
+                                view(factory.get(f"/api/investment/tradingview/{query}"))
+                                timings.append((time.perf_counter() - start) * 1000)
+                            p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+                            self.stdout.write(
+                                f"{rows:>8} {query or '(all rows)':<52} {name:>8} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f}"
+                            )
+                    transaction.set_rollback(True)
+
+    # Queries replayed by bench_autocomplete, from a few letters to a whole ticker
+    autocomplete_queries = ["b", "bench", "BENCH0001", "GB00000", "benchmark issuer 4", "plc"]
+
+    def bench_autocomplete(self, sizes, repeats=1000):
+        self.stdout.write(f"{'rows':>8} {'query':<20} {'results':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        dummy_cache = {
+            alias: {"BACKEND": "django.core.cache.backends.dummy.DummyCache"} for alias in ("default", "state")
+        }
+        for rows in sizes:
+            with transaction.atomic(), override_settings(CACHES=dummy_cache):
+                copy_merge_dataframe(Equity, equity_frame(rows))
+                start = time.perf_counter()
+                segment = PrefixSegment.build("Equity", None)
+                self.stdout.write(
+                    f"{rows:>8} built in {time.perf_counter() - start:.3f}s, "
+                    f"{sum(keys.nbytes + ids.nbytes for keys, ids in segment.keys.values()) / 2 ** 20:.1f} MiB of keys"
+                )
+                # The other tables are not read, so a query only times the lookup. Versions are all None
+                # under DummyCache, so the segments are built by the first query and reused
+                autocomplete("warm")
+                for query in self.autocomplete_queries:
+                    timings = []
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        results = autocomplete(query)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    p50, p99 = np.percentile(timings, [50, 99])
+                    self.stdout.write(f"{rows:>8} {query:<20} {len(results):>8} {p50:>8.3f} {p99:>8.3f}")
+                transaction.set_rollback(True)
+
+    # Queries replayed by bench_search: a rare name, a partial name and a sector a third of the rows share
+    search_queries = ["benchmark issuer 4242", "issu 99", "banks"]
+
+    def bench_search(self, sizes, repeats=50):
+        self.stdout.write(f"{'rows':>8} {'query':<24} {'matches':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for rows in sizes:
+            with transaction.atomic():
+                copy_merge_dataframe(Equity, equity_frame(rows))
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {connection.ops.quote_name(Equity._meta.db_table)}")
+                for query in self.search_queries:
+                    matches = instrument_search(query).count()
+                    timings = []
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        # The first page, as the search endpoint reads it
+                        list(instrument_search(query)[: constants.INSTRUMENT_SEARCH_PAGE_SIZE])
+                        timings.append((time.perf_counter() - start) * 1000)
+                    p50, p95 = np.percentile(timings, [50, 95])
+                    self.stdout.write(f"{rows:>8} {query:<24} {matches:>8} {p50:>8.2f} {p95:>8.2f}")
+                transaction.set_rollback(True)
+
+    def bench_valuation(self, sizes, repeats=100):
+        self.stdout.write(f"{'positions':>10} {'step':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        view = PortfolioValuationView.as_view()
+        factory = RequestFactory()
+        # No response cache, so each request runs the view on the positions its worker has loaded
+        dummy_cache = {
+            alias: {"BACKEND": "django.core.cache.backends.dummy.DummyCache"} for alias in ("default", "state")
+        }
+        for positions in sizes:
+            with transaction.atomic(), override_settings(CACHES=dummy_cache):
+                portfolio_rows(positions)
+                loaded = load_positions()
+                # The data version is always None under DummyCache, so drop the last size's positions
+                valuation_utils._positions = None
+                steps = [
+                    ("load", load_positions),
+                    ("value", lambda: value_positions(loaded)),
+                    ("request", lambda: view(factory.get("/api/investment/portfolio-valuation/")).render()),
+                ]
+                for name, step in steps:
+                    timings = []
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        step()
+                        timings.append((time.perf_counter() - start) * 1000)
+                    p50, p95 = np.percentile(timings, [50, 95])
+                    self.stdout.write(f"{positions:>10} {name:>8} {p50:>8.2f} {p95:>8.2f}")
+                transaction.set_rollback(True)
+
+    def bench_trade_import(self, sizes):
+        self.stdout.write(f"{'trades':>8} {'path':>8} {'seconds':>9} {'round trips':>12}")
+        for trades in sizes:
+            paths = [
+                ("per-row", legacy_trade_writes),
+                ("import", import_trades),
+            ]
+            for name, write in paths:
+                rows = []
+                elapsed, statements = self.run_rolled_back(
+                    lambda: write(rows), setup=lambda: rows.extend(trade_rows(trades))
+                )
+                self.stdout.write(f"{trades:>8} {name:>8} {elapsed:>9.3f} {statements:>12}")
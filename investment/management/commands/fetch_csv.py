@@ -4,6 +4,7 @@ import pandas as pd
 import numpy as np
 import os
 from investment.models import ManualMeta, Region, SubRegion, Country
+from investment.utils.screener_utils import refresh_screener
 from django.db import transaction
 logger = logging.getLogger(__name__)
 # os.environ.setdefault('DJANGO_SETTINGS_MODULE', )
@@ -154,3 +155,5 @@ class Command(BaseCommand):
 
 
         upload_objectives()
+        # Bulk writes send no save signals, so the screener is rebuilt from the new metadata here
+        refresh_screener()
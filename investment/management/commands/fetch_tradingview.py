@@ -6,6 +6,8 @@ from django.core.management.base import BaseCommand
 from datetime import datetime, timezone
 from utils.utils import delete_all_except_latest_file
 from investment.models import TradingView
+from investment.utils.screener_utils import refresh_screener
+from investment.utils.search_utils import bump_autocomplete_on_commit
 
 logger = logging.getLogger(__name__)
 
@@ -79,3 +81,6 @@ class Command(BaseCommand):
                 logger.error(log_str)
 
         update_tbl_trading_view()
+        # Bulk writes send no save signals, so the screener is rebuilt from the new rows here
+        refresh_screener()
+        bump_autocomplete_on_commit(["TradingView"])
@@ -4,6 +4,7 @@ import pandas as pd
 import numpy as np
 import os
 from investment.models import ManualMeta, Region, SubRegion, Country
+from investment.utils.screener_utils import refresh_screener
 from django.db import transaction
 
 logger = logging.getLogger(__name__)
@@ -17,6 +18,7 @@ class Command(BaseCommand):
         base_path = os.getcwd() + "/investment/data/"
 
         self.upload_objectives(base_path)
+        refresh_screener()
         self.stdout.write(self.style.SUCCESS('Successfully inserted objectives.'))
 
     def upload_objectives(self, base_path):
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from investment.utils.screener_utils import refresh_screener
+
+
+class Command(BaseCommand):
+    help = "Rebuild the screener table. The ingest views do this after every load; run it after migrating."
+
+    def handle(self, *args, **options):
+        inserted, updated, deleted = refresh_screener()
+        self.stdout.write(
+            self.style.SUCCESS(f"Screener refreshed: {inserted} inserted, {updated} updated, {deleted} deleted.")
+        )
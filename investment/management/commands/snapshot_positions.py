@@ -0,0 +1,26 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from investment.utils.trade_utils import snapshot_positions
+
+
+class Command(BaseCommand):
+    help = (
+        "Store every position as it stands, so past positions are rebuilt from the latest snapshot and the "
+        "trades since rather than the whole ledger. Run it periodically, e.g. nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--at", type=datetime.fromisoformat, help="YYYY-MM-DD[THH:MM:SS], defaults to now, in the current time zone"
+        )
+
+    def handle(self, *args, **options):
+        at = options["at"]
+        if at is not None and timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        try:
+            count = snapshot_positions(at)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Snapshot of {count} positions taken."))
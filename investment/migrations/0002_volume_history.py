@@ -0,0 +1,63 @@
+# Generated by Django 4.2.11 on 2026-10-18 13:08
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyVolumeHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('ticker', models.CharField(max_length=255)),
+                ('period_end', models.DateField()),
+                ('isin', models.CharField(max_length=12)),
+                ('gbp_turnover', models.FloatField(null=True)),
+                ('number_of_trades', models.IntegerField()),
+                ('volume', models.FloatField(null=True)),
+                ('avg_trade_size', models.FloatField(null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Monthly volume history',
+                'db_table': 'tblMonthlyVolumeHistory',
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyVolumeHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('ticker', models.CharField(max_length=255)),
+                ('period_end', models.DateField()),
+                ('isin', models.CharField(max_length=12)),
+                ('gbp_turnover', models.FloatField(null=True)),
+                ('number_of_trades', models.IntegerField()),
+                ('avg_spread', models.FloatField(null=True)),
+                ('avg_trade_size', models.FloatField(null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Weekly volume history',
+                'db_table': 'tblWeeklyVolumeHistory',
+                'indexes': [django.contrib.postgres.indexes.BrinIndex(fields=['period_end'], name='weeklyvolumehistory_period')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='weeklyvolumehistory',
+            constraint=models.UniqueConstraint(fields=('ticker', 'period_end'), name='weeklyvolumehistory_ticker_period'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlyvolumehistory',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['period_end'], name='monthlyvolumehistory_period'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyvolumehistory',
+            constraint=models.UniqueConstraint(fields=('ticker', 'period_end'), name='monthlyvolumehistory_ticker_period'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.11 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0002_volume_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Screener',
+            fields=[
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('ticker', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('description', models.CharField(max_length=255)),
+                ('technical_rating', models.CharField(max_length=25)),
+                ('oscillators_rating', models.CharField(max_length=25)),
+                ('moving_avg_rating', models.CharField(max_length=25)),
+                ('price', models.FloatField(null=True)),
+                ('perf_weekly', models.FloatField(null=True)),
+                ('perf_monthly', models.FloatField(null=True)),
+                ('perf_3m', models.FloatField(null=True)),
+                ('perf_ytd', models.FloatField(null=True)),
+                ('perf_6m', models.FloatField(null=True)),
+                ('vol_1w', models.FloatField(null=True)),
+                ('vol_1m', models.FloatField(null=True)),
+                ('asset_class', models.CharField(max_length=25, null=True)),
+                ('country', models.CharField(max_length=255, null=True)),
+                ('region', models.CharField(max_length=255, null=True)),
+                ('sub_region', models.CharField(max_length=255, null=True)),
+                ('objective', models.CharField(max_length=50, null=True)),
+                ('hedge_ccy', models.CharField(max_length=5, null=True)),
+                ('trading_currency', models.CharField(max_length=3, null=True)),
+                ('turnover_monthly', models.FloatField(null=True)),
+                ('num_trades_monthly', models.IntegerField(null=True)),
+                ('volume_monthly', models.FloatField(null=True)),
+                ('avg_trade_size_monthly', models.FloatField(null=True)),
+                ('turnover_weekly', models.FloatField(null=True)),
+                ('num_trades_weekly', models.IntegerField(null=True)),
+                ('avg_spread', models.FloatField(null=True)),
+                ('avg_trade_size_weekly', models.FloatField(null=True)),
+            ],
+            options={
+                'db_table': 'tblScreener',
+                'indexes': [models.Index(fields=['asset_class', 'region', 'country', 'objective', 'ticker'], name='screener_default_order')],
+            },
+        ),
+    ]
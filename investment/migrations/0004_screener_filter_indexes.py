@@ -0,0 +1,37 @@
+# Generated by Django 4.2.11 on 2026-10-18 13:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0003_screener'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(fields=['objective', 'asset_class', 'region', 'country', 'ticker'], name='screener_objective'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(fields=['region', 'asset_class', 'country', 'objective', 'ticker'], name='screener_region'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(fields=['sub_region', 'asset_class', 'region', 'country', 'objective', 'ticker'], name='screener_sub_region'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(fields=['country', 'asset_class', 'region', 'objective', 'ticker'], name='screener_country'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(fields=['technical_rating', 'asset_class', 'region', 'country', 'objective', 'ticker'], name='screener_technical_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(fields=['trading_currency', 'asset_class', 'region', 'country', 'objective', 'ticker'], name='screener_trading_currency'),
+        ),
+    ]
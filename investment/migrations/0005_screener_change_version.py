@@ -0,0 +1,36 @@
+# Generated by Django 4.2.11 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0004_screener_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScreenerTombstone',
+            fields=[
+                ('ticker', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('change_version', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'tblScreenerTombstone',
+            },
+        ),
+        migrations.AddField(
+            model_name='screener',
+            name='change_version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(fields=['change_version'], name='screener_change_version'),
+        ),
+        migrations.AddIndex(
+            model_name='screenertombstone',
+            index=models.Index(fields=['change_version'], name='screener_tombstone_version'),
+        ),
+    ]
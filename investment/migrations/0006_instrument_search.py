@@ -0,0 +1,27 @@
+# Generated by Django 4.2.11 on 2026-10-18 13:36
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0005_screener_change_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bond',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('issuer_name', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('instrument_name', config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), name='bond_search'),
+        ),
+        migrations.AddIndex(
+            model_name='equity',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('issuer_name', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('instrument_name', config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), '||', django.contrib.postgres.search.SearchVector('icb_super_sector', config='simple', weight='C'), django.contrib.postgres.search.SearchConfig('simple')), name='equity_search'),
+        ),
+        migrations.AddIndex(
+            model_name='etp',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('instrument_name', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('issuer_name', config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), name='etp_search'),
+        ),
+    ]
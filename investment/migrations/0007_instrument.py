@@ -0,0 +1,56 @@
+# Generated by Django 4.2.11 on 2026-10-18 13:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Fill the instrument master before positions point at it, as refresh_instruments does after each load
+COLUMNS = "isin, issuer_name, instrument_name, trading_currency, country_of_incorporation, lse_market, start_date"
+POPULATE_INSTRUMENTS = f"""
+INSERT INTO "tblInstrument" (ticker, instrument_type, {COLUMNS}, last_updated)
+SELECT DISTINCT ON (ticker) ticker, instrument_type, {COLUMNS}, now()
+FROM (
+    SELECT 0 AS priority, 'equity' AS instrument_type, ticker, {COLUMNS} FROM "tblEquity"
+    UNION ALL SELECT 1, 'etp', ticker, {COLUMNS} FROM "tblEtp"
+    UNION ALL SELECT 2, 'bond', ticker, {COLUMNS} FROM "tblBond"
+) s
+ORDER BY ticker, priority
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0006_instrument_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Instrument',
+            fields=[
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('ticker', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('isin', models.CharField(max_length=12)),
+                ('instrument_type', models.CharField(max_length=10)),
+                ('issuer_name', models.CharField(max_length=255)),
+                ('instrument_name', models.CharField(max_length=255)),
+                ('trading_currency', models.CharField(max_length=3)),
+                ('country_of_incorporation', models.CharField(max_length=50)),
+                ('lse_market', models.CharField(max_length=50)),
+                ('start_date', models.DateField(null=True)),
+            ],
+            options={
+                'db_table': 'tblInstrument',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='instrument',
+            constraint=models.UniqueConstraint(fields=('isin', 'ticker'), name='instrument_isin_ticker'),
+        ),
+        migrations.RunSQL(POPULATE_INSTRUMENTS, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='currentinvestment',
+            name='ticker',
+            field=models.ForeignKey(db_column='ticker', on_delete=django.db.models.deletion.CASCADE, to='investment.instrument'),
+        ),
+    ]
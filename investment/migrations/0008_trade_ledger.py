@@ -0,0 +1,105 @@
+# Generated by Django 4.2.11 on 2026-10-18 13:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Positions could be entered twice for a book and ticker before the unique constraint. Each pair is merged into
+# its oldest row, with the quantities summed and the quantity-weighted average price
+MERGE_DUPLICATE_POSITIONS = """
+WITH merged AS (
+    SELECT book, ticker, MIN(id) AS keep, SUM(COALESCE(qty, 0)) AS qty,
+        CASE WHEN SUM(COALESCE(qty, 0)) > 0
+            THEN SUM(COALESCE(qty, 0) * avg_px) / SUM(COALESCE(qty, 0)) ELSE 0 END AS avg_px,
+        MAX(last_updated) AS last_updated
+    FROM "tblCurrentInvestment"
+    GROUP BY book, ticker
+    HAVING COUNT(*) > 1
+), kept AS (
+    UPDATE "tblCurrentInvestment" ci
+    SET qty = m.qty, avg_px = m.avg_px, last_updated = m.last_updated
+    FROM merged m
+    WHERE ci.id = m.keep
+)
+DELETE FROM "tblCurrentInvestment" ci
+USING merged m
+WHERE ci.book = m.book AND ci.ticker = m.ticker AND ci.id <> m.keep
+"""
+
+# Existing positions become the opening trade of the ledger, at their average price
+OPEN_LEDGER = """
+INSERT INTO "tblTrade" (created_at, executed_at, book, ticker, qty, price, realized_pnl)
+SELECT now(), last_updated, book, ticker, qty, avg_px, 0
+FROM "tblCurrentInvestment"
+WHERE qty > 0
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0007_instrument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PositionSnapshot',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('snapshot_at', models.DateTimeField()),
+                ('qty', models.IntegerField()),
+                ('avg_px', models.FloatField()),
+                ('realized_pnl', models.FloatField()),
+            ],
+            options={
+                'db_table': 'tblPositionSnapshot',
+            },
+        ),
+        migrations.CreateModel(
+            name='Trade',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('executed_at', models.DateTimeField()),
+                ('qty', models.IntegerField()),
+                ('price', models.FloatField()),
+                ('realized_pnl', models.FloatField(default=0)),
+            ],
+            options={
+                'db_table': 'tblTrade',
+            },
+        ),
+        migrations.RunSQL(MERGE_DUPLICATE_POSITIONS, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='currentinvestment',
+            constraint=models.UniqueConstraint(fields=('book', 'ticker'), name='currentinvestment_book_ticker'),
+        ),
+        migrations.AddField(
+            model_name='trade',
+            name='book',
+            field=models.ForeignKey(db_column='book', on_delete=django.db.models.deletion.PROTECT, to='investment.book'),
+        ),
+        migrations.AddField(
+            model_name='trade',
+            name='ticker',
+            field=models.ForeignKey(db_column='ticker', on_delete=django.db.models.deletion.PROTECT, to='investment.instrument'),
+        ),
+        migrations.AddField(
+            model_name='positionsnapshot',
+            name='book',
+            field=models.ForeignKey(db_column='book', on_delete=django.db.models.deletion.PROTECT, to='investment.book'),
+        ),
+        migrations.AddField(
+            model_name='positionsnapshot',
+            name='ticker',
+            field=models.ForeignKey(db_column='ticker', on_delete=django.db.models.deletion.PROTECT, to='investment.instrument'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['book', 'ticker', 'executed_at'], name='trade_book_ticker_executed'),
+        ),
+        migrations.AddConstraint(
+            model_name='positionsnapshot',
+            constraint=models.UniqueConstraint(fields=('book', 'ticker', 'snapshot_at'), name='positionsnapshot_book_ticker_at'),
+        ),
+        migrations.RunSQL(OPEN_LEDGER, migrations.RunSQL.noop),
+    ]
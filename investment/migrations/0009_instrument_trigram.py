@@ -0,0 +1,40 @@
+# Generated by Django 4.2.11 on 2026-10-18 14:03
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0008_trade_ledger'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='bond',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['issuer_name'], name='bond_issuer_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='bond',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['instrument_name'], name='bond_instrument_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='equity',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['issuer_name'], name='equity_issuer_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='equity',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['instrument_name'], name='equity_instrument_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='etp',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['issuer_name'], name='etp_issuer_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='etp',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['instrument_name'], name='etp_instrument_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
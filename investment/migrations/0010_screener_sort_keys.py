@@ -0,0 +1,70 @@
+# Generated by Django 4.2.11 on 2026-10-18 14:20
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0009_instrument_trigram'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='screener',
+            name='screener_default_order',
+        ),
+        migrations.RemoveIndex(
+            model_name='screener',
+            name='screener_objective',
+        ),
+        migrations.RemoveIndex(
+            model_name='screener',
+            name='screener_region',
+        ),
+        migrations.RemoveIndex(
+            model_name='screener',
+            name='screener_sub_region',
+        ),
+        migrations.RemoveIndex(
+            model_name='screener',
+            name='screener_country',
+        ),
+        migrations.RemoveIndex(
+            model_name='screener',
+            name='screener_technical_rating',
+        ),
+        migrations.RemoveIndex(
+            model_name='screener',
+            name='screener_trading_currency',
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('asset_class', models.Value('')), django.db.models.functions.comparison.Coalesce('region', models.Value('')), django.db.models.functions.comparison.Coalesce('country', models.Value('')), django.db.models.functions.comparison.Coalesce('objective', models.Value('')), models.F('ticker'), name='screener_default_order'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(models.F('objective'), django.db.models.functions.comparison.Coalesce('asset_class', models.Value('')), django.db.models.functions.comparison.Coalesce('region', models.Value('')), django.db.models.functions.comparison.Coalesce('country', models.Value('')), django.db.models.functions.comparison.Coalesce('objective', models.Value('')), models.F('ticker'), name='screener_objective'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(models.F('region'), django.db.models.functions.comparison.Coalesce('asset_class', models.Value('')), django.db.models.functions.comparison.Coalesce('region', models.Value('')), django.db.models.functions.comparison.Coalesce('country', models.Value('')), django.db.models.functions.comparison.Coalesce('objective', models.Value('')), models.F('ticker'), name='screener_region'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(models.F('sub_region'), django.db.models.functions.comparison.Coalesce('asset_class', models.Value('')), django.db.models.functions.comparison.Coalesce('region', models.Value('')), django.db.models.functions.comparison.Coalesce('country', models.Value('')), django.db.models.functions.comparison.Coalesce('objective', models.Value('')), models.F('ticker'), name='screener_sub_region'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(models.F('country'), django.db.models.functions.comparison.Coalesce('asset_class', models.Value('')), django.db.models.functions.comparison.Coalesce('region', models.Value('')), django.db.models.functions.comparison.Coalesce('country', models.Value('')), django.db.models.functions.comparison.Coalesce('objective', models.Value('')), models.F('ticker'), name='screener_country'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(models.F('technical_rating'), django.db.models.functions.comparison.Coalesce('asset_class', models.Value('')), django.db.models.functions.comparison.Coalesce('region', models.Value('')), django.db.models.functions.comparison.Coalesce('country', models.Value('')), django.db.models.functions.comparison.Coalesce('objective', models.Value('')), models.F('ticker'), name='screener_technical_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='screener',
+            index=models.Index(models.F('trading_currency'), django.db.models.functions.comparison.Coalesce('asset_class', models.Value('')), django.db.models.functions.comparison.Coalesce('region', models.Value('')), django.db.models.functions.comparison.Coalesce('country', models.Value('')), django.db.models.functions.comparison.Coalesce('objective', models.Value('')), models.F('ticker'), name='screener_trading_currency'),
+        ),
+    ]
@@ -1,4 +1,41 @@
-from django.db import models
+from functools import reduce
+from operator import add
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+import investment.constants as constants
+
+
+def instrument_search_vector(source):
+    """
+    Weighted tsvector of an instrument table's INSTRUMENT_SEARCH_FIELDS. The table's GIN index is built on
+    this expression and search filters on the same one, so the planner matches them up.
+    """
+    return reduce(add, [
+        SearchVector(field, weight=weight, config=constants.INSTRUMENT_SEARCH_CONFIG)
+        for field, weight in constants.INSTRUMENT_SEARCH_FIELDS[source].items()
+    ])
+
+
+def sort_keys(ordering):
+    """
+    Sort key expressions of an ordering whose last field is unique and not null, with NULLs in the others
+    coalesced to SORT_KEY_NULL. Indexes are built on these expressions and keyset pagination orders and
+    compares on the same ones, so the rows after a cursor are an index range.
+    """
+    *nullable, unique = ordering
+    return [Coalesce(field, Value(constants.SORT_KEY_NULL)) for field in nullable] + [F(unique)]
+
+
+def instrument_trigram_indexes(source):
+    """pg_trgm GIN index of each INSTRUMENT_TRIGRAM_FIELDS field, used by the trigram_word_similar lookup."""
+    return [
+        GinIndex(fields=[field], opclasses=["gin_trgm_ops"], name=f"{source.lower()}_{field}_trgm")
+        for field in constants.INSTRUMENT_TRIGRAM_FIELDS
+    ]
+
 
 # ************************LONDON STOCK EXCHANGE MODELS ************************
 
@@ -7,6 +44,10 @@ class Equity(models.Model):
     class Meta:
         db_table = "tblEquity"
         verbose_name_plural = "Equities"
+        indexes = [
+            GinIndex(instrument_search_vector("Equity"), name="equity_search"),
+            *instrument_trigram_indexes("Equity"),
+        ]
 
     last_updated = models.DateTimeField(auto_now=True)
     ticker = models.CharField(max_length=255, primary_key=True)
@@ -30,6 +71,10 @@ class Bond(models.Model):
 
     class Meta:
         db_table = "tblBond"
+        indexes = [
+            GinIndex(instrument_search_vector("Bond"), name="bond_search"),
+            *instrument_trigram_indexes("Bond"),
+        ]
 
     last_updated = models.DateTimeField(auto_now=True)
     ticker = models.CharField(max_length=255, primary_key=True)
@@ -54,6 +99,10 @@ class Etp(models.Model):
 
     class Meta:
         db_table = "tblEtp"
+        indexes = [
+            GinIndex(instrument_search_vector("Etp"), name="etp_search"),
+            *instrument_trigram_indexes("Etp"),
+        ]
 
     last_updated = models.DateTimeField(auto_now=True)
     ticker = models.CharField(max_length=255, primary_key=True)
@@ -73,6 +122,33 @@ class Etp(models.Model):
         return self.ticker
 
 
+class Instrument(models.Model):
+    """
+    Every ticker of Equity, Etp and Bond in one table, rebuilt by refresh_instruments after each instrument
+    load, so the trading currency and reference columns are read with a single join. The (isin, ticker)
+    constraint indexes ISIN lookups. An ISIN is not unique on its own, as a fund can list several currency lines.
+    """
+
+    class Meta:
+        db_table = "tblInstrument"
+        constraints = [models.UniqueConstraint(fields=["isin", "ticker"], name="instrument_isin_ticker")]
+
+    last_updated = models.DateTimeField(auto_now=True)
+    ticker = models.CharField(max_length=255, primary_key=True)
+    isin = models.CharField(max_length=12)
+    # The table the row was taken from, as in INSTRUMENT_TYPES
+    instrument_type = models.CharField(max_length=10)
+    issuer_name = models.CharField(max_length=255)
+    instrument_name = models.CharField(max_length=255)
+    trading_currency = models.CharField(max_length=3)
+    country_of_incorporation = models.CharField(max_length=50)
+    lse_market = models.CharField(max_length=50)
+    start_date = models.DateField(null=True)
+
+    def __str__(self) -> str:
+        return self.ticker
+
+
 class MonthlyVolume(models.Model):
 
     class Meta:
@@ -127,6 +203,56 @@ class WeeklyVolume(models.Model):
         super().save(*args, **kwargs)
 
 
+class MonthlyVolumeHistory(models.Model):
+    """Append-only monthly trading statistics, one row per ticker per month."""
+
+    class Meta:
+        db_table = "tblMonthlyVolumeHistory"
+        verbose_name_plural = "Monthly volume history"
+        constraints = [
+            models.UniqueConstraint(fields=["ticker", "period_end"], name="monthlyvolumehistory_ticker_period"),
+        ]
+        # Rows arrive in period order so a BRIN index on the period stays small and selective
+        indexes = [BrinIndex(fields=["period_end"], name="monthlyvolumehistory_period")]
+
+    last_updated = models.DateTimeField(auto_now=True)
+    ticker = models.CharField(max_length=255)
+    period_end = models.DateField()
+    isin = models.CharField(max_length=12)
+    gbp_turnover = models.FloatField(null=True)
+    number_of_trades = models.IntegerField()
+    volume = models.FloatField(null=True)
+    avg_trade_size = models.FloatField(null=True)
+
+    def __str__(self) -> str:
+        return f"{self.ticker} {self.period_end}"
+
+
+class WeeklyVolumeHistory(models.Model):
+    """Append-only weekly trading statistics, one row per ticker per week ending Friday."""
+
+    class Meta:
+        db_table = "tblWeeklyVolumeHistory"
+        verbose_name_plural = "Weekly volume history"
+        constraints = [
+            models.UniqueConstraint(fields=["ticker", "period_end"], name="weeklyvolumehistory_ticker_period"),
+        ]
+        # Rows arrive in period order so a BRIN index on the period stays small and selective
+        indexes = [BrinIndex(fields=["period_end"], name="weeklyvolumehistory_period")]
+
+    last_updated = models.DateTimeField(auto_now=True)
+    ticker = models.CharField(max_length=255)
+    period_end = models.DateField()
+    isin = models.CharField(max_length=12)
+    gbp_turnover = models.FloatField(null=True)
+    number_of_trades = models.IntegerField()
+    avg_spread = models.FloatField(null=True)
+    avg_trade_size = models.FloatField(null=True)
+
+    def __str__(self) -> str:
+        return f"{self.ticker} {self.period_end}"
+
+
 # ************************GEOGRAPHY AND MANUAL META MODELS ************************
 
 
@@ -198,6 +324,19 @@ class ManualMeta(models.Model):
             self.country = None
 
         super().save(*args, **kwargs)
+        self._refresh_screener()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._refresh_screener()
+        return result
+
+    def _refresh_screener(self):
+        """Rebuild this ticker's screener row once the metadata change has committed."""
+        # Imported here as screener_utils imports the models
+        from investment.utils.screener_utils import refresh_screener
+        ticker = self.ticker
+        transaction.on_commit(lambda: refresh_screener([ticker]))
 
     def __str__(self) -> str:
         return self.ticker
@@ -229,6 +368,82 @@ class TradingView(models.Model):
         return self.ticker
 
 
+class Screener(models.Model):
+    """
+    Every TradingView ticker joined with its ManualMeta, latest volumes and trading currency, so the screener
+    is read from one table. Rebuilt by investment.utils.screener_utils.refresh_screener after each ingest.
+    """
+
+    class Meta:
+        db_table = "tblScreener"
+        # The first index matches the default ordering. The others lead with a filtered column and then follow
+        # the default ordering, so a filtered page is still read in order straight off an index
+        indexes = [
+            models.Index(*sort_keys(constants.SCREENER_ORDERING), name="screener_default_order"),
+            models.Index(F("objective"), *sort_keys(constants.SCREENER_ORDERING), name="screener_objective"),
+            models.Index(F("region"), *sort_keys(constants.SCREENER_ORDERING), name="screener_region"),
+            models.Index(F("sub_region"), *sort_keys(constants.SCREENER_ORDERING), name="screener_sub_region"),
+            models.Index(F("country"), *sort_keys(constants.SCREENER_ORDERING), name="screener_country"),
+            models.Index(
+                F("technical_rating"), *sort_keys(constants.SCREENER_ORDERING), name="screener_technical_rating"
+            ),
+            models.Index(
+                F("trading_currency"), *sort_keys(constants.SCREENER_ORDERING), name="screener_trading_currency"
+            ),
+            # Delta sync reads the rows changed since a version
+            models.Index(fields=["change_version"], name="screener_change_version"),
+        ]
+
+    last_updated = models.DateTimeField(auto_now=True)
+    # Version of the refresh, or watchlist or portfolio change, that last changed this row
+    change_version = models.BigIntegerField(default=0)
+    ticker = models.CharField(max_length=255, primary_key=True)
+    description = models.CharField(max_length=255)
+    technical_rating = models.CharField(max_length=25)
+    oscillators_rating = models.CharField(max_length=25)
+    moving_avg_rating = models.CharField(max_length=25)
+    price = models.FloatField(null=True)
+    perf_weekly = models.FloatField(null=True)
+    perf_monthly = models.FloatField(null=True)
+    perf_3m = models.FloatField(null=True)
+    perf_ytd = models.FloatField(null=True)
+    perf_6m = models.FloatField(null=True)
+    vol_1w = models.FloatField(null=True)
+    vol_1m = models.FloatField(null=True)
+    asset_class = models.CharField(max_length=25, null=True)
+    country = models.CharField(max_length=255, null=True)
+    region = models.CharField(max_length=255, null=True)
+    sub_region = models.CharField(max_length=255, null=True)
+    objective = models.CharField(max_length=50, null=True)
+    hedge_ccy = models.CharField(max_length=5, null=True)
+    trading_currency = models.CharField(max_length=3, null=True)
+    turnover_monthly = models.FloatField(null=True)
+    num_trades_monthly = models.IntegerField(null=True)
+    volume_monthly = models.FloatField(null=True)
+    avg_trade_size_monthly = models.FloatField(null=True)
+    turnover_weekly = models.FloatField(null=True)
+    num_trades_weekly = models.IntegerField(null=True)
+    avg_spread = models.FloatField(null=True)
+    avg_trade_size_weekly = models.FloatField(null=True)
+
+    def __str__(self) -> str:
+        return self.ticker
+
+
+class ScreenerTombstone(models.Model):
+    """Tickers removed from the screener, with the version that removed them, for delta sync."""
+
+    class Meta:
+        db_table = "tblScreenerTombstone"
+        indexes = [models.Index(fields=["change_version"], name="screener_tombstone_version")]
+
+    ticker = models.CharField(max_length=255, primary_key=True)
+    change_version = models.BigIntegerField()
+
+    def __str__(self) -> str:
+        return self.ticker
+
+
 class Watchlist(models.Model):
 
     class Meta:
@@ -267,17 +482,70 @@ class Currency(models.Model):
 
 
 class CurrentInvestment(models.Model):
+    """The open position per book and ticker, kept up to date from the Trade ledger by record_trade."""
 
     class Meta:
         db_table = "tblCurrentInvestment"
+        constraints = [models.UniqueConstraint(fields=["book", "ticker"], name="currentinvestment_book_ticker")]
 
     id = models.AutoField(primary_key=True)
     last_updated = models.DateTimeField(auto_now=True)
     qty = models.PositiveIntegerField(null=True)
-    ticker = models.ForeignKey('Etp', to_field='ticker', on_delete=models.CASCADE, db_column='ticker')
+    ticker = models.ForeignKey('Instrument', to_field='ticker', on_delete=models.CASCADE, db_column='ticker')
     avg_px = models.FloatField()
     current_px = models.FloatField() # NO LONGER USED - WILL FETCH FROM TRADINGVIEW
     book = models.ForeignKey('Book', to_field='name', on_delete=models.CASCADE, db_column='book')
 
     def __str__(self):
-        return f"{self.ticker.ticker} - {self.book.name}"
\ No newline at end of file
+        return f"{self.ticker.ticker} - {self.book.name}"
+
+
+class Trade(models.Model):
+    """
+    Append-only ledger of every buy and sell. Rows are never updated, so past positions and realized P&L can
+    always be rebuilt from it.
+    """
+
+    class Meta:
+        db_table = "tblTrade"
+        indexes = [models.Index(fields=["book", "ticker", "executed_at"], name="trade_book_ticker_executed")]
+
+    id = models.BigAutoField(primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    executed_at = models.DateTimeField()
+    book = models.ForeignKey('Book', to_field='name', on_delete=models.PROTECT, db_column='book')
+    ticker = models.ForeignKey('Instrument', to_field='ticker', on_delete=models.PROTECT, db_column='ticker')
+    # Positive for a buy and negative for a sell
+    qty = models.IntegerField()
+    price = models.FloatField()
+    # P&L a sell realised against the position's average price, zero for a buy
+    realized_pnl = models.FloatField(default=0)
+
+    def __str__(self):
+        return f"{self.executed_at:%Y-%m-%d} {self.book_id} {self.ticker_id} {self.qty} @ {self.price}"
+
+
+class PositionSnapshot(models.Model):
+    """
+    Every position as it stood at snapshot_at, written by the snapshot_positions command, so a past position
+    is its latest snapshot plus the trades after it rather than a replay of the whole ledger.
+    """
+
+    class Meta:
+        db_table = "tblPositionSnapshot"
+        constraints = [
+            models.UniqueConstraint(fields=["book", "ticker", "snapshot_at"], name="positionsnapshot_book_ticker_at"),
+        ]
+
+    id = models.BigAutoField(primary_key=True)
+    snapshot_at = models.DateTimeField()
+    book = models.ForeignKey('Book', to_field='name', on_delete=models.PROTECT, db_column='book')
+    ticker = models.ForeignKey('Instrument', to_field='ticker', on_delete=models.PROTECT, db_column='ticker')
+    qty = models.IntegerField()
+    avg_px = models.FloatField()
+    # Realized P&L of the position from its first trade up to snapshot_at
+    realized_pnl = models.FloatField()
+
+    def __str__(self):
+        return f"{self.snapshot_at:%Y-%m-%d} {self.book_id} {self.ticker_id} {self.qty}"
+
@@ -0,0 +1,126 @@
+import base64
+import binascii
+import json
+from django.db.models import BooleanField, Func, Value
+import investment.constants as constants
+from investment.models import sort_keys
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class RowAfter(Func):
+    """(keys) > (values) as one row-value comparison, which a btree index on the keys can start a scan from."""
+
+    output_field = BooleanField()
+
+    def __init__(self, keys, values):
+        super().__init__(*keys, *values)
+        self.size = len(keys)
+
+    def as_sql(self, compiler, connection):
+        sqls, params = [], []
+        for expression in self.source_expressions:
+            sql, expression_params = compiler.compile(expression)
+            sqls.append(sql)
+            params.extend(expression_params)
+        return f"({', '.join(sqls[: self.size])}) > ({', '.join(sqls[self.size :])})", params
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in keyset (cursor) pagination over a multi-column ordering that may contain NULLs.
+
+    Only used when the request has a cursor or page_size query param, so existing clients still get the full
+    list. Each page is fetched with a WHERE on the last row of the previous page instead of an OFFSET, so the
+    cost of a page does not grow with how far into the results it is. Rows are ordered on the sort_keys of the
+    ordering, which sort NULLs as SORT_KEY_NULL, and the last column must be unique and not null. An index on
+    the same sort keys serves every page as one range scan.
+    """
+
+    ordering = ()
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 100
+    max_page_size = 1000
+
+    def is_requested(self, request):
+        return self.cursor_query_param in request.query_params or self.page_size_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*sort_keys(self.ordering))
+        if position is not None:
+            queryset = self.after(queryset, position)
+        # Fetch one extra row to find out whether there is a next page
+        rows = list(queryset[: self.page_size + 1])
+        self.next_position = None
+        if len(rows) > self.page_size:
+            rows = rows[: self.page_size]
+            self.next_position = self.sort_position(rows[-1])
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound("Invalid cursor")
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound("Invalid cursor")
+        # Cursors from before NULLs were coalesced hold them as null
+        return [constants.SORT_KEY_NULL if value is None else value for value in position]
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def sort_position(self, row):
+        """The sort keys of a row, as a cursor holds them."""
+        return [
+            constants.SORT_KEY_NULL if value is None else value
+            for value in (getattr(row, field) for field in self.ordering)
+        ]
+
+    def after(self, queryset, position):
+        """The rows of queryset that sort after position."""
+        fields = [queryset.model._meta.get_field(field) for field in self.ordering]
+        # Typed by the field, so a value of another JSON type is compared as the column's type
+        values = [Value(value, output_field=field) for value, field in zip(position, fields)]
+        return queryset.filter(RowAfter(sort_keys(self.ordering), values))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+
+class ScreenerPagination(KeysetPagination):
+    # Matches the screener_default_order index
+    ordering = constants.SCREENER_ORDERING
+
+
+class SearchPagination(PageNumberPagination):
+    """Numbered pages of ranked search results. Searches are read from the top, so OFFSET stays small."""
+
+    page_size = constants.INSTRUMENT_SEARCH_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 100
@@ -0,0 +1,179 @@
+import json
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Iterable, Optional, Union
+import msgpack
+from django.http import StreamingHttpResponse
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from investment.utils.json_utils import column_encoders, encoded_columns, escape_separators, value_columns
+
+# Column type named in the schema header for each serializer field class, most specific first
+FIELD_TYPES = [
+    (serializers.BooleanField, "boolean"),
+    (serializers.DecimalField, "decimal"),
+    (serializers.IntegerField, "integer"),
+    (serializers.FloatField, "float"),
+    (serializers.DateTimeField, "datetime"),
+    (serializers.DateField, "date"),
+    (serializers.CharField, "string"),
+]
+
+# Column type for the values a field returned, for fields whose class does not say
+VALUE_TYPES = [(bool, "boolean"), (int, "integer"), (float, "float"), (str, "string")]
+
+
+def dump_json(value):
+    """JSON exactly as JSONRenderer writes it with its default settings."""
+    return escape_separators(
+        json.dumps(value, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+    )
+
+
+@dataclass
+class Table:
+    """
+    A list response split into columns. Each column is JSON array text, as str or UTF-8 bytes, and is only
+    produced when a renderer reaches it, so the response can be streamed while later columns are still built.
+    values holds the same columns as lists of values, for renderers that encode them themselves, when the
+    table was built from values rather than from JSON.
+    """
+
+    schema: list
+    columns: Iterable[Union[str, bytes]]
+    next: Optional[str] = None
+    values: Optional[Iterable[list]] = None
+
+    @classmethod
+    def from_rows(cls, serializer, rows, method_columns=None, next_link=None):
+        """
+        Build the columns straight from values_list rows with the json_utils column encoders.
+        Raises FastPathUnsupported up front if the serializer has a field they cannot render.
+        """
+        encoders = column_encoders(serializer)
+        columns = encoded_columns(encoders, rows, method_columns)
+        return cls(
+            schema=[{"name": name, "type": kind} for name, kind, _ in encoders],
+            columns=(escape_separators(f"[{','.join(column)}]") for column in columns),
+            next=next_link,
+            values=value_columns(encoders, rows, method_columns),
+        )
+
+    @classmethod
+    def from_data(cls, data, fields=None, next_link=None):
+        """
+        Build the columns from serialized data, a list of dicts. Column types come from the serializer fields
+        when given, otherwise from the first value in the column that is not null.
+        """
+        names = list(fields if fields is not None else (data[0] if data else []))
+        schema = []
+        for name in names:
+            field = fields.get(name) if fields is not None else None
+            kind = next((label for field_class, label in FIELD_TYPES if isinstance(field, field_class)), None)
+            if kind is None:
+                value = next((row[name] for row in data if row[name] is not None), None)
+                kind = next((label for value_class, label in VALUE_TYPES if isinstance(value, value_class)), "any")
+            schema.append({"name": name, "type": kind})
+        # Serialized decimals are strings, which the value columns turn back into numbers
+        decimals = {name for name in names if isinstance(fields and fields.get(name), serializers.DecimalField)}
+        return cls(
+            schema=schema,
+            columns=(dump_json([row[name] for row in data]) for name in names),
+            next=next_link,
+            values=(
+                [None if row[name] is None else float(row[name]) for row in data]
+                if name in decimals
+                else [row[name] for row in data]
+                for name in names
+            ),
+        )
+
+    @classmethod
+    def from_response_data(cls, data):
+        """Table from the data of a list response, paginated or not, or None if it is not a list response."""
+        if isinstance(data, list):
+            return cls.from_data(data)
+        if isinstance(data, dict) and isinstance(data.get("results"), list):
+            return cls.from_data(data["results"], next_link=data.get("next"))
+        return None
+
+
+class TabularRenderer(BaseRenderer, ABC):
+    """Base for renderers that write a Table as a schema header followed by one array per column."""
+
+    # Renderers that need Table.values cannot be given a table of JSON columns alone
+    needs_values = False
+
+    @abstractmethod
+    def stream(self, table):
+        """The body for a table, as an iterable of bytes."""
+
+    @abstractmethod
+    def render_other(self, data, accepted_media_type, renderer_context):
+        """The body for response data that is not a list, like an error."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Errors and other non-list responses are written as they are
+        table = Table.from_response_data(data)
+        if table is None:
+            return self.render_other(data, accepted_media_type, renderer_context)
+        return b"".join(self.stream(table))
+
+    def streaming_response(self, table, status=200):
+        return StreamingHttpResponse(self.stream(table), content_type=self.media_type, status=status)
+
+
+class ColumnarJSONRenderer(TabularRenderer):
+    """
+    {"schema": [{"name", "type"}, ...], "next": ..., "columns": [[...], ...]}, chosen with ?format=columnar.
+    Field names are written once instead of once per row, and each column holds values of one type, which
+    gzip compresses well.
+    """
+
+    media_type = "application/vnd.columnar+json"
+    format = "columnar"
+    charset = None
+
+    def stream(self, table):
+        yield f'{{"schema":{dump_json(table.schema)},"next":{dump_json(table.next)},"columns":['.encode()
+        for i, column in enumerate(table.columns):
+            if isinstance(column, str):
+                column = column.encode()
+            yield b"," + column if i else column
+        yield b"]}"
+
+    def render_other(self, data, accepted_media_type, renderer_context):
+        return JSONRenderer().render(data)
+
+
+class MessagePackRenderer(TabularRenderer):
+    """
+    The columnar layout as MessagePack, chosen with Accept: application/msgpack or ?format=msgpack.
+    Columns are packed straight from Table.values. Values match the JSON responses, except that decimals are
+    numbers rather than strings.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+    needs_values = True
+
+    def stream(self, table):
+        packer = msgpack.Packer()
+        yield packer.pack_map_header(3)
+        yield packer.pack("schema") + packer.pack(table.schema)
+        yield packer.pack("next") + packer.pack(table.next)
+        yield packer.pack("columns") + packer.pack_array_header(len(table.schema))
+        for column in table.values:
+            yield packer.pack(column)
+
+    def render_other(self, data, accepted_media_type, renderer_context):
+        # Decimals, dates and the like are converted as the JSON encoder would
+        return msgpack.packb(data, default=JSONEncoder().default)
+
+
+# The default renderers, so JSON stays the default, followed by the opt-in columnar formats
+TABULAR_RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer, MessagePackRenderer]
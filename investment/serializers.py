@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 import math
-from .models import TradingView, Watchlist, CurrentInvestment, Book
+from .models import TradingView, Watchlist, CurrentInvestment, Book, Screener, Instrument
 
 class TradingviewObjectiveSerializer(serializers.ModelSerializer):
     id = serializers.CharField()
@@ -17,8 +17,8 @@ class TradingviewObjectiveSerializer(serializers.ModelSerializer):
     perf_6m = serializers.DecimalField(max_digits=10, decimal_places=2)
     vol_1w = serializers.DecimalField(max_digits=10, decimal_places=2)
     vol_1m = serializers.DecimalField(max_digits=10, decimal_places=2)
-    on_watchlist = serializers.SerializerMethodField()
-    in_portfolio = serializers.SerializerMethodField()
+    on_watchlist = serializers.BooleanField(read_only=True)
+    in_portfolio = serializers.BooleanField(read_only=True)
     asset_class = serializers.CharField()
     country = serializers.CharField()
     region = serializers.CharField()
@@ -37,11 +37,12 @@ class TradingviewObjectiveSerializer(serializers.ModelSerializer):
 
      # Send the primary key 'isin' to frontend as 'id'
     id = serializers.CharField(source='ticker', read_only=True)
-    on_watchlist = serializers.SerializerMethodField()
-    in_portfolio = serializers.SerializerMethodField()
+    # Annotated by TradingviewObjectiveViewSet.get_queryset
+    on_watchlist = serializers.BooleanField(read_only=True)
+    in_portfolio = serializers.BooleanField(read_only=True)
 
     class Meta:
-        model = TradingView
+        model = Screener
         fields = [
             'id', 'description', 'technical_rating', 'oscillators_rating',
             'moving_avg_rating', 'price', 'perf_weekly', 'perf_monthly', 'perf_3m',
@@ -59,18 +60,6 @@ class TradingviewObjectiveSerializer(serializers.ModelSerializer):
                 ret[key] = None
         return ret
 
-    def get_on_watchlist(self, obj):
-        request = self.context.get('request')
-        if request and hasattr(request, 'watchlist_cache'):
-            return obj.ticker in request.watchlist_cache
-        return False
-
-    def get_in_portfolio(self, obj):
-        request = self.context.get('request')
-        if request and hasattr(request, 'portfolio_cache'):
-            return obj.ticker in request.portfolio_cache
-        return False
-
 
 class NotInManualMetaViewSerializer(serializers.ModelSerializer):
      # Fields from the TradingView model
@@ -105,3 +94,19 @@ class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = '__all__'
+
+
+class InstrumentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Instrument
+        fields = '__all__'
+
+
+class InstrumentSearchSerializer(serializers.Serializer):
+    ticker = serializers.CharField()
+    isin = serializers.CharField()
+    issuer_name = serializers.CharField()
+    instrument_name = serializers.CharField()
+    sector = serializers.CharField(allow_null=True)
+    source = serializers.CharField()
+    rank = serializers.FloatField()
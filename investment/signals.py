@@ -0,0 +1,48 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+import investment.constants as constants
+from investment.models import CurrentInvestment, Watchlist
+from investment.utils.cache_utils import bump_data_version_on_commit
+from investment.utils.search_utils import bump_autocomplete_on_commit
+from investment.utils.screener_utils import touch_screener
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_data_version_on_change(sender, **kwargs):
+    """
+    Any saved or deleted investment model changes what the read endpoints return. Bulk and raw SQL writes
+    don't send these signals, so the ingest and bulk upload paths bump the data version themselves.
+    """
+    if sender._meta.app_label == "investment":
+        bump_data_version_on_commit()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_autocomplete_on_change(sender, **kwargs):
+    """A single instrument saved or deleted, as from the admin. The ingests bump the tables they load."""
+    if sender._meta.app_label == "investment" and sender.__name__ in constants.AUTOCOMPLETE_SOURCES:
+        bump_autocomplete_on_commit([sender.__name__])
+
+
+@receiver(post_save, sender=Watchlist)
+@receiver(post_delete, sender=Watchlist)
+def touch_watchlist_ticker(sender, instance, **kwargs):
+    """
+    The screener's on_watchlist flag changed for this ticker, so delta sync has to send its row again. Only
+    creating or deleting the row changes the flag. post_delete sends no created argument.
+    """
+    if kwargs.get("created", True):
+        touch_screener([instance.pk])
+
+
+@receiver(post_save, sender=CurrentInvestment)
+@receiver(post_delete, sender=CurrentInvestment)
+def touch_portfolio_ticker(sender, instance, **kwargs):
+    """
+    As touch_watchlist_ticker, for the in_portfolio flag. Trades update qty and avg_px far more often, and
+    skipping those keeps them from queueing on the screener's lock behind a running refresh.
+    """
+    if kwargs.get("created", True):
+        touch_screener([instance.ticker_id])
@@ -1,3 +1,444 @@
-from django.test import TestCase
+import fcntl
+import hashlib
+import tempfile
+import threading
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from datetime import date, datetime, timezone
+import msgpack
+import numpy as np
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework import serializers
+import investment.constants as constants
+from investment.models import (
+    Book,
+    CurrentInvestment,
+    Equity,
+    Etp,
+    Instrument,
+    ManualMeta,
+    Screener,
+    Trade,
+    TradingView,
+    Watchlist,
+)
+from investment.pagination import ScreenerPagination
+from investment.utils.cache_utils import _lock_path, response_cache_stats, single_flight
+from investment.utils.instrument_utils import refresh_instruments
+from investment.utils.json_utils import FastPathUnsupported, decimal_column, decimal_values, integer_column
+from investment.utils.report_utils import ReportCache
+from investment.utils.screener_utils import screener_queryset
+from investment.utils.trade_utils import TradeRejected, positions_at, record_trade, snapshot_positions
+from investment.utils.valuation_utils import value_positions
 
-# Create your tests here.
+
+# Separate locations, as the state alias must not be cleared with the responses
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "default"},
+    "state": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "state"},
+}
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+    """Stand-in for the LSE document server that honours If-None-Match."""
+
+    def do_GET(self):
+        body = self.server.body
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Fri, 03 Jan 2025 09:00:00 GMT")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReportCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ReportHandler)
+        self.server.body = b"report v1"
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/report.xlsx"
+
+    def test_conditional_refetch(self):
+        cache = ReportCache(self.directory.name)
+        res = cache.fetch(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.content, b"report v1")
+        self.assertFalse(res.unchanged)
+        self.assertEqual(cache.stats, {"hits": 0, "misses": 1, "bytes_saved": 0})
+
+        # Not yet loaded into the db, so a 304 still has to be processed
+        res = cache.fetch(self.url)
+        self.assertEqual(res.content, b"report v1")
+        self.assertFalse(res.unchanged)
+        cache.mark_processed(self.url)
+
+        # A new cache instance reads the validators from disk
+        cache = ReportCache(self.directory.name)
+        res = cache.fetch(self.url)
+        self.assertIn("If-None-Match", self.server.requests[-1])
+        self.assertIn("If-Modified-Since", self.server.requests[-1])
+        self.assertTrue(res.unchanged)
+        self.assertEqual(res.content, b"report v1")
+        self.assertEqual(cache.stats, {"hits": 1, "misses": 0, "bytes_saved": len(b"report v1")})
+
+        self.server.body = b"report v2"
+        res = cache.fetch(self.url)
+        self.assertFalse(res.unchanged)
+        self.assertEqual(res.content, b"report v2")
+        self.assertEqual(cache.stats["misses"], 1)
+
+    def test_unreachable_server(self):
+        cache = ReportCache(self.directory.name)
+        res = cache.fetch("http://127.0.0.1:1/report.xlsx")
+        self.assertEqual(res.status_code, 502)
+        self.assertIsNone(res.content)
+
+
+class ColumnEncodingTests(SimpleTestCase):
+    def test_decimal_column_matches_decimal_field(self):
+        field = serializers.DecimalField(max_digits=10, decimal_places=2)
+        values = [2.675, 0.125, 0.135, -0.001, -0.0, 1e-05, 99999999.99, 12.3456, -7.005, 1234567.895, float("nan")]
+        expected = [json.dumps(field.to_representation(value)) for value in values]
+        self.assertEqual(decimal_column(values, 10, 2), expected)
+        self.assertEqual(decimal_column([None], 10, 2), ["null"])
+        # As numbers, each value is the float of the string
+        numbers = decimal_values(values[:-1] + [None], 10, 2)
+        self.assertEqual(numbers, [float(json.loads(text)) for text in expected[:-1]] + [None])
+        # DecimalField raises on these, so the caller has to fall back to it
+        for value in [1e8, float("inf")]:
+            with self.assertRaises(FastPathUnsupported):
+                decimal_column([value], 10, 2)
+
+    def test_integer_column_truncates(self):
+        self.assertEqual(integer_column([1.9, -1.9, None, 7]), ["1", "-1", "null", "7"])
+        with self.assertRaises(FastPathUnsupported):
+            integer_column([float("nan")])
+
+
+class ValuationTests(SimpleTestCase):
+    def test_rollups(self):
+        labels = lambda *values: np.array(values, dtype=object)
+        positions = {
+            "ticker": labels("AAA", "BBB", "CCC", "DDD"),
+            "book": labels("ISA", "ISA", "SIPP", "SIPP"),
+            "asset_class": labels("Equity", "Equity", None, "Equity"),
+            "region": labels("Europe", "Asia", "Europe", "Asia"),
+            "objective": labels("Growth", "Income", "Growth", "Growth"),
+            "currency": labels("GBP", "GBX", "USD", "GBP"),
+            "qty": np.array([10, 100, 5, 1.0]),
+            "avg_px": np.array([8, 500, 20, 1.0]),
+            # DDD has no price, so it is left out
+            "price": np.array([10, 600, 20, np.nan]),
+            "gbp_rate": np.array([1, 0.01, 0.8, 1]),
+        }
+        valuation = value_positions(positions)
+        self.assertEqual(valuation["unpriced"], ["DDD"])
+        self.assertEqual(valuation["totals"]["market_value"], 780.0)
+        self.assertEqual(valuation["totals"]["unrealized_pnl"], 120.0)
+        books = {row["key"]: row for row in valuation["breakdowns"]["book"]}
+        self.assertEqual([row["key"] for row in valuation["breakdowns"]["book"]], ["ISA", "SIPP"])
+        self.assertEqual(books["ISA"]["market_value"], 700.0)
+        self.assertEqual(books["ISA"]["unrealized_pnl_pct"], 20.69)
+        self.assertAlmostEqual(books["SIPP"]["weight"], 80 / 780, places=6)
+        self.assertEqual({row["key"] for row in valuation["breakdowns"]["asset_class"]}, {"Equity", None})
+
+
+class VolumeTrendTests(SimpleTestCase):
+    def test_periods_out_of_range(self):
+        for periods in ["0", "-1", "241", "99999999999"]:
+            response = self.client.get("/api/investment/volume-trends/", {"ticker": "VUSA", "periods": periods})
+            self.assertEqual(response.status_code, 400, periods)
+            self.assertEqual(response.json(), {"periods": "Must be between 1 and 240."})
+        response = self.client.get(
+            "/api/investment/volume-trends/", {"ticker": "VUSA", "period": "weekly", "periods": "1041"}
+        )
+        self.assertEqual(response.json(), {"periods": "Must be between 1 and 1040."})
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    SINGLE_FLIGHT_LOCK_DIR=tempfile.mkdtemp(),
+)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_render_once(self):
+        key, renders, results = "investment:response:test", [], []
+        started, release = threading.Event(), threading.Event()
+
+        def render():
+            renders.append(1)
+            started.set()
+            release.wait(5)
+            cache.set(key, (b"[]", "application/json"))
+            return "rendered"
+
+        threads = [threading.Thread(target=lambda: results.append(single_flight(key, render))) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(renders), 1)
+        self.assertEqual(sorted(results, key=str), [((b"[]", "application/json"), None)] * 4 + [(None, "rendered")])
+
+    def test_waits_for_another_worker(self):
+        key = "investment:response:test"
+        # Another worker holds the lock file and stores the body
+        path = _lock_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            threading.Timer(0.1, lambda: cache.set(key, (b"[]", "application/json"))).start()
+            self.assertEqual(single_flight(key, lambda: "rendered"), ((b"[]", "application/json"), None))
+        # Once it lets go without storing one, the waiter renders its own
+        cache.clear()
+        self.assertEqual(single_flight(key, lambda: "rendered"), (None, "rendered"))
+        self.assertFalse(path.exists())
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    SCREENER_SNAPSHOT_DIR=tempfile.mkdtemp(),
+)
+class ScreenerQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        ratings = dict(technical_rating="Buy", oscillators_rating="Buy", moving_avg_rating="Buy")
+        Screener.objects.bulk_create(
+            Screener(ticker=ticker, description=ticker, price=1.5, **ratings) for ticker in ["AAA", "BBB", "CCC"]
+        )
+        Watchlist.objects.create(id="AAA")
+        instrument = Instrument.objects.create(ticker="BBB", isin="IE00B3RBWM25", instrument_type="etp")
+        CurrentInvestment.objects.create(
+            ticker=instrument, qty=1, avg_px=1, current_px=1, book=Book.objects.create(name="ISA")
+        )
+
+    def get(self, path, **headers):
+        # Every request is a cache miss, and a new data version outdates the snapshot, so the view itself runs
+        cache.clear()
+        caches["state"].clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(path, **headers)
+            body = b"".join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(response.status_code, 200)
+        return body
+
+    def test_one_query_per_request(self):
+        rows = json.loads(self.get("/api/investment/tradingview/"))
+        flags = {row["id"]: (row["on_watchlist"], row["in_portfolio"]) for row in rows}
+        self.assertEqual(flags, {"AAA": (True, False), "BBB": (False, True), "CCC": (False, False)})
+
+        page = json.loads(self.get("/api/investment/tradingview/?page_size=2"))
+        self.assertEqual(len(page["results"]), 2)
+        columns = json.loads(self.get("/api/investment/tradingview/?format=columnar"))
+        self.assertEqual(len(columns["columns"][0]), 3)
+        packed = msgpack.unpackb(self.get("/api/investment/tradingview/?format=msgpack"))
+        prices = packed["columns"][[column["name"] for column in packed["schema"]].index("price")]
+        self.assertEqual(prices, [1.5, 1.5, 1.5])
+
+    def test_cursor_pages(self):
+        # NULLs sort as SORT_KEY_NULL, before any value
+        Screener.objects.filter(ticker="AAA").update(asset_class="Equity")
+        tickers, url = [], "/api/investment/tradingview/?page_size=1"
+        while url:
+            page = json.loads(self.get(url))
+            tickers += [row["id"] for row in page["results"]]
+            url = page["next"]
+        self.assertEqual(tickers, ["BBB", "CCC", "AAA"])
+
+    def test_cursor_page_is_an_index_range(self):
+        with connection.cursor() as cursor:
+            # A few rows are cheaper to scan and sort, so show the plan a full table gets
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_bitmapscan = off")
+        paginator = ScreenerPagination()
+        plan = paginator.after(screener_queryset(), ["", "", "", "", "AAA"])[: paginator.page_size + 1].explain()
+        self.assertIn("Index Scan using screener_default_order", plan)
+        self.assertRegex(plan, r"Index Cond: \(ROW\(\(COALESCE")
+        # Read in order off the index, without sorting the rows after the cursor
+        self.assertNotIn("Sort", plan)
+
+    def test_metadata_edit_refreshes_its_row(self):
+        ratings = dict(technical_rating="Buy", oscillators_rating="Buy", moving_avg_rating="Buy")
+        TradingView.objects.bulk_create(
+            TradingView(ticker=ticker, description=ticker, **ratings) for ticker in ["AAA", "BBB"]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            ManualMeta.objects.create(ticker="AAA", asset_class="Equity", objective="Growth", region=None)
+        # Only AAA is rebuilt. A full rebuild would also remove CCC, which is not in TradingView
+        rows = dict(Screener.objects.values_list("ticker", "asset_class"))
+        self.assertEqual(rows, {"AAA": "Equity", "BBB": None, "CCC": None})
+
+    def test_streamed_bodies_are_cached_up_to_a_size(self):
+        url = "/api/investment/tradingview/?format=columnar"
+        body = self.get(url)
+        cached = self.client.get(url)
+        self.assertEqual((cached.streaming, cached.content), (False, body))
+        self.assertEqual(response_cache_stats(["screener"])["screener"]["hits"], 1)
+        with mock.patch.object(constants, "RESPONSE_CACHE_MAX_STREAMED_BYTES", 10):
+            self.assertEqual(self.get(url), body)
+            self.assertTrue(self.client.get(url).streaming)
+
+    def test_response_cache_stats(self):
+        # get() clears the counters along with the data version
+        self.get("/api/investment/tradingview/")
+        self.client.get("/api/investment/tradingview/")
+        stats = response_cache_stats(["screener"])["screener"]
+        self.assertEqual((stats["misses"], stats["hits"], stats["hit_rate"]), (1, 1, 0.5))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for ticker, isin, name in [
+            ("VWRL", "IE00B3RBWM25", "Vanguard FTSE All-World UCITS ETF"),
+            ("VUSA", "IE00B3XXRP09", "Vanguard S&P 500 UCITS ETF"),
+        ]:
+            Etp.objects.create(
+                ticker=ticker, isin=isin, instrument_name=name, issuer_name="Vanguard Funds PLC",
+                start_date=date(2012, 5, 22),
+            )
+
+    def search(self, q):
+        cache.clear()
+        response = self.client.get("/api/investment/autocomplete/", {"q": q})
+        return [row["ticker"] for row in response.json()]
+
+    def test_prefix_matches(self):
+        self.assertEqual(self.search("vw"), ["VWRL"])
+        self.assertEqual(self.search("ie00b3x"), ["VUSA"])
+        # Any word of a name, with punctuation treated as a space
+        self.assertEqual(self.search("all world"), ["VWRL"])
+        self.assertEqual(self.search("s&p"), ["VUSA"])
+        self.assertEqual(sorted(self.search("vanguard funds")), ["VUSA", "VWRL"])
+        self.assertEqual(self.search(""), [])
+
+    def test_full_text_search(self):
+        response = self.client.get("/api/investment/search/", {"q": "vang all"})
+        self.assertEqual([row["ticker"] for row in response.json()["results"]], ["VWRL"])
+        # No instrument has both words, so those with either are ranked instead
+        response = self.client.get("/api/investment/search/", {"q": "vanguard zzz"})
+        self.assertEqual([row["ticker"] for row in response.json()["results"]], ["VUSA", "VWRL"])
+        # Nothing has a word starting with "vangard", so names similar to it are ranked instead
+        response = self.client.get("/api/investment/search/", {"q": "vangard"})
+        self.assertEqual({row["ticker"] for row in response.json()["results"]}, {"VUSA", "VWRL"})
+        self.assertEqual(self.client.get("/api/investment/search/", {"q": "&!"}).status_code, 400)
+
+
+class InstrumentTests(TestCase):
+    def test_refresh_and_lookup(self):
+        common = dict(issuer_name="Vanguard Funds PLC", start_date=date(2012, 5, 22))
+        Etp.objects.create(ticker="VWRL", isin="IE00B3RBWM25", trading_currency="GBP", **common)
+        Etp.objects.create(ticker="VWRD", isin="IE00B3RBWM25", trading_currency="USD", **common)
+        # A ticker in both tables is taken from Equity
+        Equity.objects.create(ticker="VWRD", isin="IE00B3RBWM25", trading_currency="USD", issuer_name="Vanguard")
+        Etp.objects.create(ticker="GONE", isin="IE0000000001", **common)
+        Etp.objects.create(ticker="HELD", isin="IE0000000002", **common)
+        self.assertEqual(refresh_instruments(), (4, 0, 0))
+        self.assertEqual(Instrument.objects.get(ticker="VWRD").instrument_type, "equity")
+
+        CurrentInvestment.objects.create(
+            ticker_id="HELD", qty=1, avg_px=1, current_px=1, book=Book.objects.create(name="ISA")
+        )
+        Etp.objects.filter(ticker__in=["GONE", "HELD"]).delete()
+        # Held tickers are kept for the portfolio
+        self.assertEqual(refresh_instruments(), (0, 0, 1))
+        self.assertEqual(sorted(Instrument.objects.values_list("ticker", flat=True)), ["HELD", "VWRD", "VWRL"])
+
+        by_isin = self.client.get("/api/investment/instrument/ie00b3rbwm25/").json()
+        self.assertEqual([row["ticker"] for row in by_isin], ["VWRD", "VWRL"])
+        by_ticker = self.client.get("/api/investment/instrument/VWRL/").json()
+        self.assertEqual([row["trading_currency"] for row in by_ticker], ["GBP"])
+        self.assertEqual(self.client.get("/api/investment/instrument/NOPE/").status_code, 404)
+
+
+class TradeLedgerTests(TestCase):
+    def test_positions_from_ledger(self):
+        book = Book.objects.create(name="ISA")
+        instrument = Instrument.objects.create(ticker="AAA", isin="GB0000000001")
+        at = lambda day: datetime(2024, 1, day, tzinfo=timezone.utc)
+        record_trade(book, instrument, 10, 5.0, executed_at=at(1))
+        record_trade(book, instrument, 10, 7.0, executed_at=at(2))
+        record_trade(book, instrument, -5, 8.0, executed_at=at(4))
+        position = CurrentInvestment.objects.get(book=book, ticker=instrument)
+        # Sells realize against the average price and leave it as it is
+        self.assertEqual((position.qty, position.avg_px), (15, 6.0))
+        self.assertEqual(list(Trade.objects.values_list("realized_pnl", flat=True).order_by("id")), [0, 0, 10.0])
+
+        self.assertEqual(snapshot_positions(at(3)), 1)
+        record_trade(book, instrument, -15, 4.0, executed_at=at(5))
+        self.assertEqual(positions_at(at(3)), {("ISA", "AAA"): (20, 6.0, 0.0)})
+        self.assertEqual(positions_at(at(5)), {("ISA", "AAA"): (0, 0.0, -20.0)})
+
+        with self.assertRaises(TradeRejected):
+            record_trade(book, instrument, 1, 5.0, executed_at=at(3))
+        response = self.client.put(
+            "/api/investment/update-current-investments/",
+            {"ticker": "AAA", "book": "ISA", "qty": -1, "transaction_px": 5},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["current_qty"], 0)
+        self.assertEqual(Trade.objects.count(), 4)
+
+    def test_batch_import(self):
+        Book.objects.create(name="ISA")
+        for ticker in ("AAA", "BBB"):
+            Instrument.objects.create(ticker=ticker, isin="GB0000000001")
+        url = "/api/investment/import-trades/"
+        rejected = self.client.post(
+            url,
+            [
+                {"book": "ISA", "ticker": "AAA", "qty": 10, "transaction_px": 5},
+                {"book": "ISA", "ticker": "AAA", "qty": -11, "transaction_px": 6},
+                {"book": "SIPP", "ticker": "AAA", "qty": 1, "transaction_px": 5},
+                {"book": "ISA", "ticker": "BBB", "qty": 1.5, "transaction_px": 0},
+            ],
+            content_type="application/json",
+        )
+        self.assertEqual(rejected.status_code, 400)
+        self.assertEqual(
+            [(error["row"], error["field"]) for error in rejected.json()["errors"]],
+            [(2, "qty"), (3, "book"), (4, "qty"), (4, "transaction_px")],
+        )
+        self.assertFalse(Trade.objects.exists())
+
+        csv_file = SimpleUploadedFile(
+            "trades.csv",
+            b"book,ticker,qty,transaction_px,executed_at\n"
+            b"ISA,AAA,-4,6,2024-01-02T00:00:00Z\n"
+            b"ISA,AAA,10,5,2024-01-01T00:00:00Z\n"
+            b"ISA,BBB,3,2,\n",
+        )
+        imported = self.client.post(url, {"file": csv_file})
+        self.assertEqual(imported.json()["trades"], 3)
+        # Trades are applied in order of execution, not the order they were sent
+        self.assertEqual(
+            sorted(CurrentInvestment.objects.values_list("ticker", "qty", "avg_px")), [("AAA", 6, 5.0), ("BBB", 3, 2.0)]
+        )
+        self.assertEqual(Trade.objects.get(qty=-4).realized_pnl, 4.0)
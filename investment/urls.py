@@ -10,14 +10,21 @@ urlpatterns = [
      path("update-instruments/", views.InstrumentUploadView.as_view(), name="update-instruments"),
      path('update-monthly/', views.MonthlyVolumesUploadView.as_view(), name="update-monthly"),
      path("update-weekly/", views.WeeklyVolumesUploadView.as_view(), name="update-weekly"),
+     path("volume-trends/", views.VolumeTrendView.as_view(), name="volume-trends"),
      path('download-no-metadata/', views.UploadNoMetadataCSVView.as_view(), name='download-no-metadata'),
      path('get-temporary-credentials/', views.GetTemporaryCredentialsView.as_view(), name='get-temporary-credentials'),
      path('get-presigned-url/', views.GetPresignedUrlView.as_view(), name='get-presigned-url'),
      path("tradingview/", views.TradingviewObjectiveViewSet.as_view({'get': 'list'}), name="tradingview"),
      path("add-to-watchlist/", views.WatchlistCreateView.as_view(), name="add-to-watchlist"),
      path("delete-from-watchlist/<str:id>/", views.WatchlistDeleteView.as_view(), name="delete-from-watchlist"),
+     path("autocomplete/", views.AutocompleteView.as_view(), name="autocomplete"),
+     path("search/", views.InstrumentSearchView.as_view(), name="search"),
+     path("instrument/<str:key>/", views.InstrumentDetailView.as_view(), name="instrument"),
      path('get-current-investments/', views.CurrentInvestmentDetailView.as_view(), name='get-current-investments'),
+     path("portfolio-valuation/", views.PortfolioValuationView.as_view(), name="portfolio-valuation"),
      path('get-books/', views.BookAPIView.as_view(), name='get-books'),
+     path('response-cache-stats/', views.ResponseCacheStatsView.as_view(), name='response-cache-stats'),
      path('update-current-investments/', views.UpdateCurrentInvestmentView.as_view(), name='update-current-investments'),
+     path('import-trades/', views.TradeImportView.as_view(), name='import-trades'),
      path('test/', views.TestAPIView2.as_view(), name='test'),
 ]
\ No newline at end of file
@@ -0,0 +1,277 @@
+import fcntl
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from functools import wraps
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.connection import ConnectionProxy
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+import investment.constants as constants
+
+logger = logging.getLogger(__name__)
+
+DATA_VERSION_KEY = "investment:data_version"
+
+# Versions live in their own cache alias, which cached responses cannot push them out of
+state_cache = ConnectionProxy(caches, "state")
+
+
+def get_data_version():
+    """
+    The current data version, shared by every worker through the state cache.
+
+    Versions are timestamps rather than a counter so a version is never reused, even after the cache has
+    been cleared, and a client can never be sent a 304 for data older than its copy.
+    """
+    version = state_cache.get(DATA_VERSION_KEY)
+    if version is None:
+        state_cache.add(DATA_VERSION_KEY, str(time.time_ns()), timeout=None)
+        version = state_cache.get(DATA_VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    """Start a new data version, invalidating every cached response."""
+    version = str(time.time_ns())
+    state_cache.set(DATA_VERSION_KEY, version, timeout=None)
+    logger.debug(f"Data version bumped to {version}")
+    return version
+
+
+def bump_data_version_on_commit():
+    """Bump the data version once the current transaction commits, or straight away outside one."""
+    transaction.on_commit(bump_data_version)
+
+
+def _stats_key(name, outcome):
+    return f"investment:response_stats:{name}:{outcome}"
+
+
+def _count(name, outcome):
+    """Count a request in the state cache, so every worker adds to the same counters and reads them back."""
+    key = _stats_key(name, outcome)
+    try:
+        state_cache.incr(key)
+    except ValueError:
+        # The first count. If another worker has just added it, count on top of theirs
+        if not state_cache.add(key, 1, timeout=None):
+            state_cache.incr(key)
+
+
+def response_cache_stats(names):
+    """
+    Hits, misses, 304s, coalesced requests and hit rate of the response cache for each cached view name,
+    summed over every worker. Coalesced requests missed the cache but were served the body an identical
+    request in flight rendered.
+    """
+    outcomes = ("hits", "misses", "not_modified", "coalesced")
+    totals = state_cache.get_many([_stats_key(name, outcome) for name in names for outcome in outcomes])
+    stats = {}
+    for name in names:
+        counts = {outcome: totals.get(_stats_key(name, outcome), 0) for outcome in outcomes}
+        served = sum(counts.values())
+        reused = counts["hits"] + counts["not_modified"] + counts["coalesced"]
+        counts["hit_rate"] = round(reused / served, 4) if served else None
+        stats[name] = counts
+    return stats
+
+
+# Response cache key to the Event set once the request rendering it in this worker has finished
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _lock_path(key):
+    return Path(settings.SINGLE_FLIGHT_LOCK_DIR) / f"{hashlib.sha256(key.encode()).hexdigest()[:32]}.lock"
+
+
+def _try_worker_lock(path):
+    """
+    Take an exclusive flock on path without blocking. Returns the open file holding it, or None if another
+    worker holds it. The lock is released by the kernel if the worker dies.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        f = open(path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        # The previous holder removes the file as it lets go, so a file opened before then is no longer the lock
+        try:
+            if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+
+
+def _release_worker_lock(path, f):
+    # Removed while still held, so the lock files do not pile up
+    path.unlink(missing_ok=True)
+    f.close()
+
+
+def _render_across_workers(key, render):
+    """
+    Render under this host's lock file for key, or, while another worker holds it, poll for the body that
+    worker stores. Renders itself if that worker lets go without storing one or the wait times out.
+    """
+    path = _lock_path(key)
+    deadline = time.monotonic() + constants.SINGLE_FLIGHT_TIMEOUT
+    while time.monotonic() < deadline:
+        lock = _try_worker_lock(path)
+        if lock is not None:
+            try:
+                # The worker that held the lock may have stored the body just before letting go
+                cached = cache.get(key)
+                return (cached, None) if cached is not None else (None, render())
+            finally:
+                _release_worker_lock(path, lock)
+        time.sleep(constants.SINGLE_FLIGHT_POLL_INTERVAL)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, None
+    return None, render()
+
+
+def single_flight(key, render):
+    """
+    Render the response for a cache key once while identical requests are in flight, in this worker or another.
+
+    The first thread in a worker to miss on key leads and the others wait on it. The leader also takes a flock
+    on a lock file for key shared by the workers on this host, and if another worker holds it waits for that
+    worker's body instead of rendering. render must store the body under key for waiters to be served. When
+    it does not, as for streamed and error responses, or a wait times out, the waiter renders its own.
+
+    :param key: Response cache key, which includes the data version
+    :param render: Callable rendering and storing the response
+    :return: Tuple of (cached, response), with cached the stored (content, content_type) another request
+        rendered, or None and the response render returned
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = threading.Event()
+
+    if not leader:
+        flight.wait(constants.SINGLE_FLIGHT_TIMEOUT)
+        cached = cache.get(key)
+        return (cached, None) if cached is not None else (None, render())
+
+    try:
+        # A leader that finished between the caller's cache miss and now has stored the body
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, None
+        return _render_across_workers(key, render)
+    finally:
+        # Wake the waiters only once the body is stored
+        with _flights_lock:
+            del _flights[key]
+        flight.set()
+
+
+def _cached_response(cached, etag):
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response["ETag"] = etag
+    return response
+
+
+def _buffered(response):
+    """
+    A streamed response read into a plain one, so its body can be cached, unless the body is larger than
+    RESPONSE_CACHE_MAX_STREAMED_BYTES. Then the response keeps streaming, starting with the chunks already read.
+    """
+    chunks, size = [], 0
+    content = iter(response.streaming_content)
+    for chunk in content:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > constants.RESPONSE_CACHE_MAX_STREAMED_BYTES:
+            response.streaming_content = itertools.chain(chunks, content)
+            return response
+    buffered = HttpResponse(b"".join(chunks), status=response.status_code)
+    for header, value in response.items():
+        buffered[header] = value
+    return buffered
+
+
+# Every view name passed to cached_response, for the stats endpoint
+CACHED_VIEWS = []
+
+
+def cached_response(name):
+    """
+    Cache a DRF view method's rendered body under the current data version and serve it with a strong ETag.
+
+    The ETag is derived from the data version, the full path and the Accept header, so a conditional request
+    that still matches is answered 304 from the cache alone, without running the view or touching the
+    database. Other requests for an unchanged version are served from the cached body. Identical requests that
+    miss together, as after an ingest moves the version on, are coalesced by single_flight so the view runs
+    once for them all. Streamed bodies are read whole to be cached, up to RESPONSE_CACHE_MAX_STREAMED_BYTES.
+    Larger ones are streamed uncached, so they are rendered again on every miss and not coalesced.
+
+    :param name: Name the view is counted under in the hit rate stats
+    """
+    CACHED_VIEWS.append(name)
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            version = get_data_version()
+            variant = f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+            digest = hashlib.sha256(f"{name}|{version}|{variant}".encode()).hexdigest()
+            etag = f'"{digest}"'
+
+            # If-None-Match uses weak comparison, which also matches the W/ ETag left by response compression
+            client_etags = [tag.removeprefix("W/") for tag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))]
+            if etag in client_etags or "*" in client_etags:
+                _count(name, "not_modified")
+                response = HttpResponseNotModified()
+                response["ETag"] = etag
+                return response
+
+            key = f"investment:response:{digest}"
+            cached = cache.get(key)
+            if cached is not None:
+                _count(name, "hits")
+                return _cached_response(cached, etag)
+
+            def render():
+                _count(name, "misses")
+                response = method(self, request, *args, **kwargs)
+                if response.status_code == 200:
+                    if isinstance(response, Response):
+                        # Pick the renderer now so the body can be stored. dispatch finalises the response
+                        # again, which leaves an already rendered response alone
+                        response = self.finalize_response(request, response, *args, **kwargs)
+                        response.render()
+                    if response.streaming:
+                        response = _buffered(response)
+                    # Only store the body if the version did not move while the view was running
+                    if not response.streaming and get_data_version() == version:
+                        cache.set(key, (response.content, response["Content-Type"]), constants.RESPONSE_CACHE_TIMEOUT)
+                    response["ETag"] = etag
+                return response
+
+            cached, response = single_flight(key, render)
+            if cached is not None:
+                _count(name, "coalesced")
+                return _cached_response(cached, etag)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,333 @@
+import logging
+import numpy as np
+import pandas as pd
+import investment.constants as constants
+from django.db import connection, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _column_values(field, series):
+    """Return a dataframe column as native Python values, replacing missing values with NULL or the field default."""
+    empty = None if field.null else field.get_default()
+    missing = series.isna().tolist()
+    return [empty if is_missing else value for value, is_missing in zip(series.tolist(), missing)]
+
+
+def upsert_dataframe(model, df, conflict_fields=("ticker",), batch_size=constants.UPSERT_BATCH_SIZE):
+    """
+    Insert or update every row of a dataframe with set-based INSERT ... ON CONFLICT DO UPDATE statements.
+
+    Each batch is sent as one statement with one array parameter per column, so the number of
+    round trips depends on the batch size and not on the number of rows.
+
+    :param model: The Django model whose table is written to
+    :param df: Dataframe with columns named after the model fields. Conflict fields must be unique
+    :param conflict_fields: Fields of the unique constraint used as the conflict target
+    :param batch_size: Maximum number of rows written per statement
+    :return: Tuple of (inserted, updated) row counts
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = [f for f in model._meta.concrete_fields if f.column in df.columns]
+    auto_now_fields = [f for f in model._meta.concrete_fields if getattr(f, "auto_now", False)]
+
+    columns = [quote(f.column) for f in fields + auto_now_fields]
+    arrays = ", ".join(f"%s::{f.db_type(connection)}[]" for f in fields)
+    now_params = ", ".join("%s" for _ in auto_now_fields)
+    select_list = "u.*" + (f", {now_params}" if auto_now_fields else "")
+    updates = ", ".join(
+        f"{col} = EXCLUDED.{col}"
+        for f, col in zip(fields + auto_now_fields, columns)
+        if f.column not in conflict_fields
+    )
+    conflict = ", ".join(quote(model._meta.get_field(name).column) for name in conflict_fields)
+    on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+
+    # xmax is only zero for rows that were freshly inserted by this statement
+    sql = (
+        f"WITH upserted AS ("
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"SELECT {select_list} FROM unnest({arrays}) AS u "
+        f"ON CONFLICT ({conflict}) {on_conflict} "
+        f"RETURNING (xmax = 0) AS inserted"
+        f") SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted"
+    )
+
+    # Rows without a key can never match the conflict target
+    df = df.dropna(subset=[model._meta.get_field(name).column for name in conflict_fields])
+
+    inserted = updated = 0
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(df), batch_size):
+            batch = df.iloc[start:start + batch_size]
+            params = [now] * len(auto_now_fields) + [_column_values(f, batch[f.column]) for f in fields]
+            cursor.execute(sql, params)
+            batch_inserted, batch_updated = cursor.fetchone()
+            inserted += batch_inserted
+            updated += batch_updated
+
+    logger.info(f"Upserted {len(df)} rows into {model._meta.db_table}: {inserted} inserted, {updated} updated.")
+    return inserted, updated
+
+
+def prepare_frame(model, df):
+    """
+    Coerce dataframe columns to the types of the matching model fields so they can be sent with COPY.
+
+    Missing text in non-nullable text fields becomes the field default. Rows missing a value for any
+    other non-nullable field can't be stored and are dropped.
+    """
+    df = df.copy()
+    required = []
+    for field in model._meta.concrete_fields:
+        if field.column not in df.columns:
+            continue
+        col = field.column
+        field_type = field.get_internal_type()
+        if field_type in ("CharField", "TextField"):
+            if not field.null:
+                df[col] = df[col].fillna(field.get_default())
+            continue
+        if field_type in ("IntegerField", "PositiveIntegerField", "BigIntegerField", "SmallIntegerField"):
+            df[col] = np.trunc(pd.to_numeric(df[col], errors="coerce")).astype("Int64")
+        elif field_type == "FloatField":
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        elif field_type == "DateField":
+            df[col] = pd.to_datetime(df[col], errors="coerce").dt.strftime("%Y-%m-%d")
+        if not field.null:
+            required.append(col)
+
+    if required:
+        len_all = len(df)
+        df = df.dropna(subset=required)
+        if len(df) < len_all:
+            logger.warning(f"Dropped {len_all - len(df)} rows from {model._meta.db_table} missing one of {required}.")
+    return df
+
+
+class _CsvChunkReader:
+    """File-like object that renders a dataframe to CSV a chunk of rows at a time."""
+
+    def __init__(self, df, chunk_rows):
+        self._chunks = (
+            df.iloc[start:start + chunk_rows].to_csv(header=False, index=False, na_rep=r"\N")
+            for start in range(0, len(df), chunk_rows)
+        )
+        self._buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def __iter__(self):
+        yield self._buffer
+        yield from self._chunks
+
+
+def copy_dataframe(cursor, table, columns, df, chunk_rows=constants.COPY_CHUNK_ROWS):
+    """
+    Stream a dataframe into a table with COPY FROM STDIN.
+
+    :param cursor: An open database cursor
+    :param table: Quoted name of the destination table
+    :param columns: Column names in the same order as the dataframe columns
+    :param df: Dataframe already coerced with prepare_frame
+    """
+    quote = connection.ops.quote_name
+    sql = f"COPY {table} ({', '.join(quote(c) for c in columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    reader = _CsvChunkReader(df[list(columns)], chunk_rows)
+    if is_psycopg3:
+        with cursor.copy(sql) as copy:
+            for chunk in reader:
+                copy.write(chunk)
+    else:
+        cursor.copy_expert(sql, reader)
+
+
+def unreferenced_conditions(model, alias):
+    """SQL conditions that exclude rows of model still referenced by a foreign key from another table."""
+    quote = connection.ops.quote_name
+    conditions = []
+    for rel in model._meta.related_objects:
+        if rel.many_to_many or not rel.field.concrete:
+            continue
+        conditions.append(
+            f"NOT EXISTS (SELECT 1 FROM {quote(rel.related_model._meta.db_table)} r "
+            f"WHERE r.{quote(rel.field.column)} = {alias}.{quote(rel.field.target_field.column)})"
+        )
+    return conditions
+
+
+def copy_merge_dataframe(model, df, conflict_fields=None, prune=True):
+    """
+    Load a dataframe into a model's table through an unlogged staging table.
+
+    The frame is streamed into the staging table with COPY and merged into the live table with one
+    INSERT ... ON CONFLICT DO UPDATE. With prune, rows missing from the frame are then deleted, unless
+    another table still references them. Loads of the same table are serialised with a transaction-level
+    advisory lock, as they share the staging table.
+
+    :param model: The Django model whose table is written to
+    :param df: Dataframe with columns named after the model fields
+    :param conflict_fields: Fields of the unique constraint used to match rows. Defaults to the primary key
+    :param prune: Delete rows that are not in the frame
+    :return: Tuple of (inserted, updated, deleted) row counts
+    """
+    quote = connection.ops.quote_name
+    conflict_fields = conflict_fields or (model._meta.pk.name,)
+    fields = [f for f in model._meta.concrete_fields if f.column in df.columns]
+    auto_now_fields = [f for f in model._meta.concrete_fields if getattr(f, "auto_now", False)]
+    columns = [f.column for f in fields]
+    keys = [model._meta.get_field(name).column for name in conflict_fields]
+
+    df = prepare_frame(model, df).dropna(subset=keys).drop_duplicates(subset=keys)
+
+    table = quote(model._meta.db_table)
+    staging = quote(f"{model._meta.db_table}_staging")
+    column_list = ", ".join(quote(c) for c in columns)
+    insert_list = ", ".join(quote(c) for c in columns + [f.column for f in auto_now_fields])
+    now_params = "".join(", %s" for _ in auto_now_fields)
+    key_list = ", ".join(quote(k) for k in keys)
+    updates = ", ".join(
+        f"{quote(c)} = EXCLUDED.{quote(c)}"
+        for c in columns + [f.column for f in auto_now_fields]
+        if c not in keys
+    )
+    on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+
+    inserted = updated = deleted = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Serialise loads of the same table as they share the staging table
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [model._meta.db_table])
+        # Recreate the staging table each time so it always matches the live table
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        cursor.execute(f"CREATE UNLOGGED TABLE {staging} AS SELECT {column_list} FROM {table} WITH NO DATA")
+        copy_dataframe(cursor, staging, columns, df)
+
+        cursor.execute(
+            f"WITH merged AS ("
+            f"INSERT INTO {table} ({insert_list}) "
+            f"SELECT {column_list}{now_params} FROM {staging} "
+            f"ON CONFLICT ({key_list}) {on_conflict} "
+            f"RETURNING (xmax = 0) AS inserted"
+            f") SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged",
+            [timezone.now()] * len(auto_now_fields),
+        )
+        inserted, updated = cursor.fetchone()
+
+        if prune:
+            match = " AND ".join(f"s.{quote(k)} = t.{quote(k)}" for k in keys)
+            conditions = [f"NOT EXISTS (SELECT 1 FROM {staging} s WHERE {match})"] + unreferenced_conditions(model, "t")
+            cursor.execute(f"DELETE FROM {table} t WHERE {' AND '.join(conditions)}")
+            deleted = cursor.rowcount
+
+        cursor.execute(f"DROP TABLE {staging}")
+
+    logger.info(
+        f"Loaded {len(df)} rows into {model._meta.db_table}: "
+        f"{inserted} inserted, {updated} updated, {deleted} deleted."
+    )
+    return inserted, updated, deleted
+
+
+def _index_signatures(cursor, table):
+    """Map each index of a table to a (primary, unique, definition) signature that ignores names."""
+    cursor.execute(
+        "SELECT i.relname, ix.indisprimary, ix.indisunique, "
+        "regexp_replace(pg_get_indexdef(ix.indexrelid), '^.* USING ', '') "
+        "FROM pg_index ix JOIN pg_class i ON i.oid = ix.indexrelid WHERE ix.indrelid = %s::regclass",
+        [table],
+    )
+    return {(primary, unique, definition): name for name, primary, unique, definition in cursor.fetchall()}
+
+
+def swap_dataframe(model, df):
+    """
+    Replace the contents of a model's table by loading a shadow copy and renaming it into place.
+
+    The frame is streamed with COPY into "<table>_shadow", built with the same columns, defaults and
+    indexes as the live table, and the shadow is analyzed so the planner has statistics from the first query.
+    Only the swap itself runs under an exclusive lock: rows still referenced by other tables are carried over,
+    foreign keys pointing at the live table are dropped, the live table is dropped, the shadow is renamed with
+    the original index names and the foreign keys are recreated.
+    Readers see either the old table or the new one and never block on the load.
+
+    :param model: The Django model whose table is replaced
+    :param df: Dataframe with columns named after the model fields
+    :return: Tuple of (loaded, retained) where retained counts referenced rows kept from the old table
+    """
+    quote = connection.ops.quote_name
+    table_name = model._meta.db_table
+    shadow_name = f"{table_name}_shadow"
+    table, shadow = quote(table_name), quote(shadow_name)
+    pk = quote(model._meta.pk.column)
+
+    df = prepare_frame(model, df).dropna(subset=[model._meta.pk.column])
+    df = df.drop_duplicates(subset=[model._meta.pk.column])
+    now = timezone.now()
+    for field in model._meta.concrete_fields:
+        if getattr(field, "auto_now", False):
+            df[field.column] = now
+    columns = [f.column for f in model._meta.concrete_fields if f.column in df.columns]
+
+    with connection.cursor() as cursor:
+        # Serialise refreshes of the same table as they share the shadow table
+        cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", [table_name])
+        try:
+            with transaction.atomic():
+                cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+                cursor.execute(f"CREATE TABLE {shadow} (LIKE {table} INCLUDING ALL)")
+                copy_dataframe(cursor, shadow, columns, df)
+                # A new table has no statistics, so collect them before it is queried, outside the exclusive lock
+                cursor.execute(f"ANALYZE {shadow}")
+
+            with transaction.atomic():
+                cursor.execute(f"SET LOCAL lock_timeout = '{constants.SWAP_LOCK_TIMEOUT}'")
+                cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+
+                # Keep rows other tables still point at so their foreign keys remain valid
+                referenced = unreferenced_conditions(model, "t")
+                retained = 0
+                if referenced:
+                    still_referenced = " OR ".join(f"NOT ({condition})" for condition in referenced)
+                    cursor.execute(
+                        f"INSERT INTO {shadow} SELECT * FROM {table} t WHERE ({still_referenced}) "
+                        f"AND NOT EXISTS (SELECT 1 FROM {shadow} s WHERE s.{pk} = t.{pk})"
+                    )
+                    retained = cursor.rowcount
+
+                cursor.execute(
+                    "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) "
+                    "FROM pg_constraint WHERE contype = 'f' AND confrelid = %s::regclass",
+                    [table],
+                )
+                foreign_keys = cursor.fetchall()
+                for referencing, name, _ in foreign_keys:
+                    cursor.execute(f"ALTER TABLE {referencing} DROP CONSTRAINT {quote(name)}")
+
+                index_names = _index_signatures(cursor, table)
+                shadow_index_names = _index_signatures(cursor, shadow)
+                cursor.execute(f"DROP TABLE {table}")
+                cursor.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+                for signature, name in shadow_index_names.items():
+                    if signature in index_names:
+                        cursor.execute(f"ALTER INDEX {quote(name)} RENAME TO {quote(index_names[signature])}")
+
+                for referencing, name, definition in foreign_keys:
+                    cursor.execute(f"ALTER TABLE {referencing} ADD CONSTRAINT {quote(name)} {definition}")
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", [table_name])
+
+    logger.info(f"Swapped {len(df)} rows into {table_name}, retaining {retained} referenced rows.")
+    return len(df), retained
@@ -0,0 +1,168 @@
+import io
+import logging
+import multiprocessing
+import resource
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import openpyxl
+import pandas as pd
+import investment.constants as constants
+
+logger = logging.getLogger(__name__)
+
+
+def _header_names(header):
+    """Lower-case header names, naming blanks and numbering duplicates the way pandas.read_excel does."""
+    names = []
+    seen = {}
+    for i, value in enumerate(header):
+        name = f"unnamed: {i}" if value is None else str(value).lower()
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _cell_value(value):
+    """Return whole-number floats as ints, matching the pandas openpyxl reader."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _read_sheet(ws, column_map, skip_rows):
+    """Read the mapped columns of a read-only worksheet into a dataframe with renamed columns."""
+    header_row = skip_rows + 1
+    header = next(ws.iter_rows(min_row=header_row, max_row=header_row, values_only=True), ())
+    names = _header_names(header)
+    missing = [col for col in column_map if col not in names]
+    if missing:
+        raise KeyError(f"Columns {missing} not found in sheet {ws.title}")
+
+    positions = [names.index(col) for col in column_map]
+    rows = []
+    # Stop reading each row at the last column that is needed
+    for row in ws.iter_rows(min_row=header_row + 1, max_col=max(positions) + 1, values_only=True):
+        values = [_cell_value(row[i]) if i < len(row) else None for i in positions]
+        if any(value is not None for value in values):
+            rows.append(values)
+    return pd.DataFrame.from_records(rows, columns=list(column_map.values()))
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process so far in MB (ru_maxrss is reported in KB on Linux)."""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def read_workbook(content, sheet_map, skip_rows):
+    """
+    Open a workbook once in read-only streaming mode and read every mapped sheet in a single pass.
+
+    :param content: The xlsx file as bytes
+    :param sheet_map: Sheet name to column mapping of lower-case workbook header to db column name
+    :param skip_rows: Number of rows above the header row
+    :return: Tuple of (frames, stats). frames maps sheet name to dataframe for every sheet read.
+             stats maps every sheet name to its row count, parse seconds, the process peak memory
+             after parsing it and any error
+    """
+    frames = {}
+    stats = {}
+    # Suppress the openpyxl warning about the workbook having no default style
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=UserWarning)
+        wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            for sheet, column_map in sheet_map.items():
+                start = time.perf_counter()
+                try:
+                    frames[sheet] = _read_sheet(wb[sheet], column_map, skip_rows)
+                    stats[sheet] = {"rows": len(frames[sheet])}
+                except KeyError as e:
+                    stats[sheet] = {"rows": 0, "error": str(e)}
+                stats[sheet]["seconds"] = round(time.perf_counter() - start, 3)
+                stats[sheet]["peak_mb"] = peak_memory_mb()
+                logger.info(f"Parsed sheet {sheet}: {stats[sheet]}")
+        finally:
+            wb.close()
+    return frames, stats
+
+
+def parse_volume_sheet(content, sheet, column_map, skip_rows):
+    """
+    Parse a monthly or weekly volume sheet, adding the average trade size if the sheet has none.
+    Runs in a parse pool worker process.
+
+    :return: Tuple of (dataframe, seconds spent parsing)
+    """
+    start = time.perf_counter()
+    frames, stats = read_workbook(content, {sheet: column_map}, skip_rows)
+    if sheet not in frames:
+        raise KeyError(stats[sheet]["error"])
+    df = frames[sheet]
+    for col in ["gbp_turnover", "number_of_trades", "volume", "avg_trade_size", "avg_spread"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    if "avg_trade_size" not in df.columns:
+        # Calculate average size once column names have been normalised
+        df["avg_trade_size"] = df["gbp_turnover"] / df["number_of_trades"]
+    return df, round(time.perf_counter() - start, 3)
+
+
+def parse_weekly_volume(content):
+    """
+    Parse the weekly ETP volume workbook, dropping duplicate tickers and rows missing any of the figures.
+
+    :return: Tuple of (dataframe, seconds spent parsing)
+    """
+    df, seconds = parse_volume_sheet(
+        content,
+        constants.WEEKLY_ETP_VOLUME_SHEET,
+        constants.WEEKLY_ETP_VOLUME_MAP,
+        constants.WEEKLY_ETP_VOLUME_SKIP_ROWS,
+    )
+    df = df.drop_duplicates(subset=["ticker"])
+    df = df.dropna(subset=["avg_trade_size", "gbp_turnover", "number_of_trades", "avg_spread"])
+    return df, seconds
+
+
+def combine_monthly_volumes(df_equity, df_etp):
+    """
+    Combine the monthly ETP and equity volumes, keeping the ETP row where the LSE lists a ticker in both.
+
+    :return: Tuple of (dataframe, number of duplicates removed)
+    """
+    df = pd.concat([df_etp, df_equity])
+    # Drop duplicates - LSE error
+    len_all = len(df)
+    df = df.drop_duplicates(subset=["ticker"])
+    return df, len_all - len(df)
+
+
+_parse_pool = None
+
+
+def parse_pool():
+    """
+    Process pool for CPU-bound workbook parsing, created on first use and shared by the worker process.
+
+    Workers are started by a forkserver that has already imported this module, so they start quickly and do
+    not inherit the parent's database connections or threads.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        _parse_pool = ProcessPoolExecutor(max_workers=constants.PARSE_WORKERS, mp_context=context)
+    return _parse_pool
+
+
+def reset_parse_pool():
+    """Discard the parse pool after a worker has died so the next call to parse_pool starts a new one."""
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+    _parse_pool = None
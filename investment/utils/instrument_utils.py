@@ -0,0 +1,82 @@
+import logging
+from django.apps import apps
+from django.db import connection, transaction
+from django.utils import timezone
+import investment.constants as constants
+from investment.models import Instrument
+from investment.utils.cache_utils import bump_data_version_on_commit
+from investment.utils.db_utils import unreferenced_conditions
+
+logger = logging.getLogger(__name__)
+
+# Instrument columns copied from every instrument table
+INSTRUMENT_COLUMNS = [
+    "isin",
+    "issuer_name",
+    "instrument_name",
+    "trading_currency",
+    "country_of_incorporation",
+    "lse_market",
+    "start_date",
+]
+
+
+def instrument_sources():
+    """
+    SELECT of every ticker of the instrument tables with its instrument type and INSTRUMENT_COLUMNS. A ticker
+    in more than one table is taken from the first in INSTRUMENT_TYPES.
+    """
+    quote = connection.ops.quote_name
+    column_list = ", ".join(quote(c) for c in INSTRUMENT_COLUMNS)
+    selects = [
+        f"SELECT {priority} AS priority, '{instrument_type}' AS instrument_type, ticker, {column_list} "
+        f"FROM {quote(apps.get_model('investment', model)._meta.db_table)}"
+        for priority, (model, instrument_type) in enumerate(constants.INSTRUMENT_TYPES.items())
+    ]
+    return (
+        f"SELECT DISTINCT ON (ticker) ticker, instrument_type, {column_list} "
+        f"FROM ({' UNION ALL '.join(selects)}) s ORDER BY ticker, priority"
+    )
+
+
+def refresh_instruments():
+    """
+    Rebuild the instrument master from Equity, Etp and Bond.
+
+    One transaction of an INSERT ... ON CONFLICT that only rewrites rows whose values changed, and a DELETE
+    of tickers no longer in any instrument table. Tickers still held in the portfolio are kept.
+
+    :return: Tuple of (inserted, updated, deleted) row counts
+    """
+    quote = connection.ops.quote_name
+    table = quote(Instrument._meta.db_table)
+    columns = ["instrument_type"] + INSTRUMENT_COLUMNS
+    column_list = ", ".join(quote(c) for c in columns)
+    updates = ", ".join(f"{quote(c)} = EXCLUDED.{quote(c)}" for c in columns + ["last_updated"])
+    current = ", ".join(f"i.{quote(c)}" for c in columns)
+    incoming = ", ".join(f"EXCLUDED.{quote(c)}" for c in columns)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH merged AS ("
+            f"INSERT INTO {table} AS i (ticker, {column_list}, last_updated) "
+            f"SELECT ticker, {column_list}, %s FROM ({instrument_sources()}) sources "
+            f"ON CONFLICT (ticker) DO UPDATE SET {updates} "
+            f"WHERE ({current}) IS DISTINCT FROM ({incoming}) "
+            f"RETURNING (xmax = 0) AS inserted"
+            f") SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged",
+            [timezone.now()],
+        )
+        inserted, updated = cursor.fetchone()
+        conditions = [
+            f"NOT EXISTS (SELECT 1 FROM {quote(apps.get_model('investment', model)._meta.db_table)} s "
+            f"WHERE s.ticker = i.ticker)"
+            for model in constants.INSTRUMENT_TYPES
+        ] + unreferenced_conditions(Instrument, "i")
+        cursor.execute(f"DELETE FROM {table} i WHERE {' AND '.join(conditions)}")
+        deleted = cursor.rowcount
+        # The portfolio reads its currencies from here
+        bump_data_version_on_commit()
+
+    logger.info(f"Refreshed instruments: {inserted} inserted, {updated} updated, {deleted} deleted.")
+    return inserted, updated, deleted
@@ -0,0 +1,245 @@
+import math
+from decimal import ROUND_HALF_EVEN, Decimal
+from functools import partial
+from json.encoder import encode_basestring
+import numpy as np
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+class FastPathUnsupported(ValueError):
+    """A value or field the fast path cannot render exactly as DRF would, so the caller falls back to DRF."""
+
+
+def fast_json_applies(request):
+    """True when the response would be rendered by DRF's JSONRenderer with its default compact output."""
+    renderer = getattr(request, "accepted_renderer", None)
+    return (
+        type(renderer) is JSONRenderer
+        and renderer.compact
+        and not renderer.ensure_ascii
+        and "indent" not in (request.accepted_media_type or "")
+    )
+
+
+def _null_mask(values):
+    return np.equal(np.array(values, dtype=object), None)
+
+
+def string_column(values):
+    """CharField: str() of each value, JSON escaped."""
+    return ["null" if v is None else encode_basestring(str(v)) for v in values]
+
+
+def string_values(values):
+    """CharField values as the str() the string column writes, or None."""
+    return [None if v is None else str(v) for v in values]
+
+
+def _integers(values):
+    """int() of each value, which truncates floats towards zero, and the null mask."""
+    nulls = _null_mask(values)
+    # None becomes NaN here and is put back from the mask
+    numbers = np.array(values, dtype=float)
+    finite = np.isfinite(numbers)
+    # int() raises on NaN and inf, and ints past 2**53 are not exact as floats
+    if (~finite & ~nulls).any() or (np.abs(numbers[finite]) >= 2 ** 53).any():
+        raise FastPathUnsupported("Integer column has a value outside the fast path")
+    return np.trunc(np.where(nulls, 0, numbers)).astype(np.int64).tolist(), nulls.tolist()
+
+
+def integer_column(values):
+    """IntegerField: int() of each value, which truncates floats towards zero."""
+    ints, nulls = _integers(values)
+    return ["null" if null else str(i) for i, null in zip(ints, nulls)]
+
+
+def integer_values(values):
+    """IntegerField values as the ints the integer column writes, or None."""
+    ints, nulls = _integers(values)
+    return [None if null else i for i, null in zip(ints, nulls)]
+
+
+def _decimal_units(values, max_digits, decimal_places):
+    """
+    Decimal(str(value)) quantized with ROUND_HALF_EVEN, counted in units of the last decimal place.
+    Returns the values as floats, their units, the null mask and the NaN mask.
+
+    The value is scaled and rounded as a float column. A float equal to a decimal tie, such as 2.675, rounds
+    the way its shortest repr does, so values whose scaled fraction is close to .5 are rounded again exactly
+    with Decimal.
+    """
+    nulls = _null_mask(values)
+    numbers = np.array(values, dtype=float)
+    nans = np.isnan(numbers) & ~nulls
+    numbers = np.where(nulls | nans, 0.0, numbers)
+    if np.isinf(numbers).any():
+        raise FastPathUnsupported("Decimal column has an infinite value")
+
+    scale = 10 ** decimal_places
+    scaled = numbers * scale
+    units = np.rint(scaled)
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-4
+    exponent = Decimal(1).scaleb(-decimal_places)
+    for i in np.flatnonzero(near_tie).tolist():
+        units[i] = int(Decimal(repr(values[i])).quantize(exponent, rounding=ROUND_HALF_EVEN).scaleb(decimal_places))
+    # Decimal.quantize raises when the result has more digits than max_digits
+    if (np.abs(units) >= 10 ** max_digits).any():
+        raise FastPathUnsupported("Decimal column has a value with more than max_digits digits")
+    return numbers, units, nulls, nans
+
+
+def decimal_column(values, max_digits, decimal_places):
+    """DecimalField with coerce_to_string: Decimal(str(value)) quantized with ROUND_HALF_EVEN, as a JSON string."""
+    numbers, units, nulls, nans = _decimal_units(values, max_digits, decimal_places)
+    scale = 10 ** decimal_places
+    whole, fraction = np.divmod(np.abs(units).astype(np.int64), scale)
+    # The sign comes from the value, so -0.001 renders as "-0.00" like Decimal does
+    signs = np.where(np.signbit(numbers), "-", "")
+    fragments = []
+    for sign, w, f, null, nan in zip(
+        signs.tolist(), whole.tolist(), fraction.tolist(), nulls.tolist(), nans.tolist()
+    ):
+        if null:
+            fragments.append("null")
+        elif nan:
+            fragments.append('"NaN"')
+        elif decimal_places:
+            fragments.append(f'"{sign}{w}.{f:0{decimal_places}d}"')
+        else:
+            fragments.append(f'"{sign}{w}"')
+    return fragments
+
+
+def decimal_values(values, max_digits, decimal_places):
+    """
+    DecimalField values as numbers rather than strings: the float nearest the string the decimal column
+    writes, which a units count below 2**53 divided by a power of ten always gives, or None.
+    """
+    numbers, units, nulls, nans = _decimal_units(values, max_digits, decimal_places)
+    # -0.0 where the string is "-0.00"
+    floats = np.copysign(units / 10 ** decimal_places, numbers).tolist()
+    return [None if null else math.nan if nan else f for f, null, nan in zip(floats, nulls.tolist(), nans.tolist())]
+
+
+def literal_column(values):
+    """BooleanField, or SerializerMethodField, values that are True, False or None."""
+    literals = {True: "true", False: "false", None: "null"}
+    try:
+        return [literals[v] for v in values]
+    except (KeyError, TypeError):
+        raise FastPathUnsupported("Method field returned something other than a bool or None")
+
+
+def literal_values(values):
+    """BooleanField, or SerializerMethodField, values, checked as the literal column checks them."""
+    literal_column(values)
+    return list(values)
+
+
+# Column encoder to the function giving the same column as values rather than JSON fragments
+VALUE_CONVERTERS = {
+    string_column: string_values,
+    integer_column: integer_values,
+    decimal_column: decimal_values,
+    literal_column: literal_values,
+}
+
+
+def serializer_sources(serializer):
+    """The attribute each non-method field of the serializer reads, in field order."""
+    return [
+        field.source for field in serializer.fields.values() if not isinstance(field, serializers.SerializerMethodField)
+    ]
+
+
+def column_encoders(serializer):
+    """
+    (name, type, encode) for each serializer field, where encode turns a column of values into JSON fragments
+    and type is the column type named in columnar schemas. Method fields have encode None and take their
+    values from the caller.
+
+    Raises FastPathUnsupported for fields the column encoders cannot render exactly as DRF would.
+    """
+    encoders = []
+    for name, field in serializer.fields.items():
+        if isinstance(field, serializers.SerializerMethodField):
+            encoders.append((name, "boolean", None))
+        elif isinstance(field, serializers.BooleanField):
+            encoders.append((name, "boolean", literal_column))
+        elif isinstance(field, serializers.DecimalField):
+            coerce_to_string = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+            if not coerce_to_string or field.localize or getattr(field, "normalize_output", False) or field.rounding:
+                raise FastPathUnsupported(f"Unsupported DecimalField options on {name}")
+            encode = partial(decimal_column, max_digits=field.max_digits, decimal_places=field.decimal_places)
+            encoders.append((name, "decimal", encode))
+        elif isinstance(field, serializers.IntegerField):
+            encoders.append((name, "integer", integer_column))
+        elif isinstance(field, serializers.CharField):
+            encoders.append((name, "string", string_column))
+        else:
+            raise FastPathUnsupported(f"Unsupported field type {type(field).__name__} on {name}")
+    return encoders
+
+
+def encoded_columns(encoders, rows, method_columns=None):
+    """
+    Yield the JSON fragments of each column in turn, so a caller can stream one column while the next is
+    still to be encoded.
+
+    :param encoders: column_encoders(serializer)
+    :param rows: Tuples of values in serializer_sources(serializer) order
+    :param method_columns: Dict of method field name to its list of values, one per row, if there are any
+    """
+    sources = iter(list(zip(*rows)) if rows else [() for _, _, encode in encoders if encode])
+    for name, _, encode in encoders:
+        yield literal_column(method_columns[name]) if encode is None else encode(next(sources))
+
+
+def _value_converter(encode):
+    if isinstance(encode, partial):
+        return partial(VALUE_CONVERTERS[encode.func], *encode.args, **encode.keywords)
+    return VALUE_CONVERTERS[encode]
+
+
+def value_columns(encoders, rows, method_columns=None):
+    """
+    As encoded_columns, but yield each column as a list of values, with the same conversions, for formats
+    that encode values themselves. Decimals are numbers here.
+    """
+    sources = iter(list(zip(*rows)) if rows else [() for _, _, encode in encoders if encode])
+    for name, _, encode in encoders:
+        if encode is None:
+            yield literal_values(method_columns[name])
+        else:
+            yield _value_converter(encode)(next(sources))
+
+
+def serializer_json(serializer, rows, method_columns=None):
+    """
+    Render rows as the JSON list DRF would produce for serializer(many=True) and JSONRenderer.
+
+    Each field is converted as a whole column instead of field by field per row, then the rows are joined
+    from the pre-encoded fragments. Supports CharField, IntegerField, BooleanField, DecimalField with
+    coerce_to_string and SerializerMethodField returning bools, and raises FastPathUnsupported for anything else.
+
+    :param serializer: Serializer instance whose fields define the output
+    :param rows: Tuples of values in serializer_sources(serializer) order
+    :param method_columns: Dict of method field name to its list of values, one per row, if there are any
+    :return: str of JSON
+    """
+    encoders = column_encoders(serializer)
+    fragments = [
+        [f"{key}:{value}" for value in column]
+        for key, column in zip(
+            (encode_basestring(name) for name, _, _ in encoders), encoded_columns(encoders, rows, method_columns)
+        )
+    ]
+    body = "[" + ",".join("{" + ",".join(row) + "}" for row in zip(*fragments)) + "]"
+    # JSONRenderer escapes these so the output is also valid javascript
+    return escape_separators(body)
+
+
+def escape_separators(text):
+    """Escape U+2028 and U+2029 as JSONRenderer does."""
+    return text.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+import requests
+from django.conf import settings
+import investment.constants as constants
+from requests.exceptions import Timeout, RequestException, HTTPError
+
+logger = logging.getLogger(__name__)
+
+
+def months_between_dates(date1, date2):
+    """Calculate the month diff to attach to instrument url."""
+    # Ensure date1 is earlier than date2
+    if date1 > date2:
+        date1, date2 = date2, date1
+
+    # Calculate the difference in years and months
+    years_diff = date2.year - date1.year
+    months_diff = date2.month - date1.month
+
+    # Convert years and months to total months
+    total_months = years_diff * 12 + months_diff
+
+    return total_months
+
+
+def previous_friday(day, weeks_ago=0):
+    """The most recent Friday on or before day, moved back weeks_ago weeks."""
+    last_friday = day - timedelta(days=(day.weekday() - 4) % 7)
+    return last_friday - timedelta(weeks=weeks_ago)
+
+
+def previous_month(day):
+    """The first day of the month before the month of day."""
+    return (day.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+
+def month_end(period):
+    """The last day of the month of period."""
+    return (period.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+def instrument_report_url(period):
+    """Instrument workbooks are numbered by months since the first one was published."""
+    return f"{constants.INSTRUMENT_BASE_URL}{months_between_dates(constants.INSTRUMENT_START_DATE.date(), period)}.xlsx"
+
+
+def monthly_equity_report_url(period):
+    return f"{constants.MONTHLY_EQUITY_BASE_URL}{period.strftime('%B')}%20{period.year}.xlsx"
+
+
+def monthly_etp_report_url(period):
+    return f"{constants.MONTHLY_ETP_BASE_URL}{period.strftime('%B')}%20{period.year}.xlsx"
+
+
+def weekly_report_url(period):
+    return f"{constants.WEEKLY_BASE_URL}{period.day}%20{period.strftime('%B')}%20{period.year}.xlsx"
+
+
+def fetch_with_retry(url, retries=3, timeout=10, headers=None):
+    for attempt in range(retries):
+        try:
+            response = requests.get(url, timeout=timeout, headers=headers)
+            response.raise_for_status()  # Raise HTTPError for bad responses (e.g., 4xx and 5xx)
+            return response
+        except HTTPError as e:
+            if response.status_code == 404:
+                # Return the response so that the calling function knows it's a 404
+                logger.warning(f"404 Not Found: {url}")
+                return response
+            else:
+                logger.error(f"HTTPError encountered: {e} (Status Code: {response.status_code})")
+                break  # Stop retrying for other HTTP errors
+        except Timeout:
+            logger.warning(f"Attempt {attempt + 1} for {url} timed out. Retrying...")
+            time.sleep(2 ** attempt)  # Exponential backoff
+        except RequestException as e:
+            logger.error(f"Request failed: {e}")
+            break  # Stop retrying for other request exceptions
+
+    logger.error(f"All retry attempts failed for {url}.")
+    return None  # Explicitly return None if no successful response
+
+
+@dataclass
+class ReportFetch:
+    """Result of fetching a report through the ReportCache. Has the status_code and content of a response."""
+    url: str
+    status_code: int
+    content: bytes = None
+    # The report is byte-for-byte the one that was last loaded into the db
+    unchanged: bool = False
+
+
+class ReportCache:
+    """
+    Persistent on-disk cache of London Stock Exchange report downloads keyed by URL.
+
+    Each report is stored with its ETag and Last-Modified headers. Refetches send If-None-Match and
+    If-Modified-Since so an unchanged report costs a 304 instead of a full download. Once a report has
+    been loaded into the db, call mark_processed so later fetches of the same bytes come back unchanged.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or settings.LSE_REPORT_CACHE_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.stats = {"hits": 0, "misses": 0, "bytes_saved": 0}
+        # Reports may be fetched from several threads at once
+        self._stats_lock = threading.Lock()
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.directory / f"{key}.xlsx", self.directory / f"{key}.json"
+
+    def _read_meta(self, url):
+        body_path, meta_path = self._paths(url)
+        if not (body_path.exists() and meta_path.exists()):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _write(self, path, data, mode="wb"):
+        # Write to a temporary file and rename so readers never see a partial file
+        tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+        with open(tmp_path, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def fetch(self, url):
+        """Fetch a report, revalidating any cached copy. Failed requests return status 502."""
+        body_path, meta_path = self._paths(url)
+        meta = self._read_meta(url)
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = fetch_with_retry(url, headers=headers)
+        if response is None:
+            return ReportFetch(url=url, status_code=502)
+
+        if response.status_code == 304 and meta:
+            with self._stats_lock:
+                self.stats["hits"] += 1
+                self.stats["bytes_saved"] += meta["size"]
+            logger.info(f"Report not modified, using cached copy: {url}")
+            return ReportFetch(
+                url=url,
+                status_code=200,
+                content=body_path.read_bytes(),
+                unchanged=meta.get("processed_sha256") == meta["sha256"],
+            )
+
+        if response.status_code != 200:
+            return ReportFetch(url=url, status_code=response.status_code)
+
+        with self._stats_lock:
+            self.stats["misses"] += 1
+        content = response.content
+        sha256 = hashlib.sha256(content).hexdigest()
+        new_meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": len(content),
+            "sha256": sha256,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+            # Servers that ignore conditional requests still send the same bytes for an unchanged report
+            "processed_sha256": meta.get("processed_sha256") if meta else None,
+        }
+        self._write(body_path, content)
+        self._write(meta_path, json.dumps(new_meta), mode="w")
+        return ReportFetch(url=url, status_code=200, content=content, unchanged=new_meta["processed_sha256"] == sha256)
+
+    def mark_processed(self, url):
+        """Record that the cached copy of a report has been loaded into the db."""
+        meta = self._read_meta(url)
+        if meta:
+            meta["processed_sha256"] = meta["sha256"]
+            self._write(self._paths(url)[1], json.dumps(meta), mode="w")
+
+
+class ReportLocator:
+    """
+    Find the newest published London Stock Exchange report of a kind without downloading it.
+
+    Candidate URLs are probed concurrently with HEAD requests and the newest available one wins. The URL that
+    resolved for each period is remembered on disk so later runs only probe periods newer than it.
+    """
+
+    # Report kind to (url builder, number of candidate periods to probe)
+    kinds = {
+        "instrument": (instrument_report_url, constants.LOCATOR_MONTHLY_CANDIDATES),
+        "monthly": (monthly_equity_report_url, constants.LOCATOR_MONTHLY_CANDIDATES),
+        "weekly": (weekly_report_url, constants.LOCATOR_WEEKLY_CANDIDATES),
+    }
+
+    def __init__(self, directory=None, today=None):
+        self.path = Path(directory or settings.LSE_REPORT_CACHE_DIR) / "locator.json"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.today = today or date.today()
+
+    def candidates(self, kind, count):
+        """Candidate periods for a report kind, newest first."""
+        if kind == "instrument":
+            # This month's workbook, then the one before
+            periods = [self.today.replace(day=1)]
+        elif kind == "monthly":
+            # Monthly statistics are published for the previous complete month
+            periods = [previous_month(self.today)]
+        else:
+            periods = [previous_friday(self.today)]
+        while len(periods) < count:
+            if kind == "weekly":
+                periods.append(periods[-1] - timedelta(weeks=1))
+            else:
+                periods.append(previous_month(periods[-1]))
+        return periods
+
+    def probe(self, url):
+        """Whether a report exists at url. Servers that do not support HEAD are assumed to have it."""
+        try:
+            response = requests.head(url, timeout=constants.LOCATOR_PROBE_TIMEOUT, allow_redirects=True)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"HEAD probe failed for {url}: {e}")
+            return False
+        logger.debug(f"HEAD {url}: {response.status_code}")
+        return response.status_code == 200 or response.status_code in (405, 501)
+
+    def _read_resolved(self):
+        if not self.path.exists():
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _write_resolved(self, resolved):
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(resolved, f)
+        os.replace(tmp_path, self.path)
+
+    def locate(self, kind):
+        """
+        Resolve the newest available report of a kind.
+
+        :param kind: One of "instrument", "monthly" or "weekly"
+        :return: Tuple of (url, period) or (None, None) if no candidate is available
+        """
+        url_for, count = self.kinds[kind]
+        periods = self.candidates(kind, count)
+        resolved = self._read_resolved()
+        # Forget periods that have dropped out of the candidate window
+        known = {period: url for period, url in resolved.get(kind, {}).items() if period >= periods[-1].isoformat()}
+        latest_known = max(known, default=None)
+        # Periods at or before the newest one already resolved do not need probing
+        to_probe = [period for period in periods if latest_known is None or period.isoformat() > latest_known]
+
+        if to_probe:
+            urls = [url_for(period) for period in to_probe]
+            with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+                available = list(executor.map(self.probe, urls))
+            for period, url, ok in zip(to_probe, urls, available):
+                if ok:
+                    known[period.isoformat()] = url
+                    resolved[kind] = known
+                    self._write_resolved(resolved)
+                    logger.info(f"Located {kind} report for {period}: {url}")
+                    return url, period
+
+        if latest_known is not None:
+            logger.info(f"Using previously located {kind} report for {latest_known}")
+            return known[latest_known], date.fromisoformat(latest_known)
+        logger.error(f"No {kind} report found for periods {[str(period) for period in periods]}")
+        return None, None
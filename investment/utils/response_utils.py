@@ -1,18 +1,20 @@
 from django.http import JsonResponse
 
-def json_response(message, status_txt, status):
+def json_response(message, status_txt, status, data=None):
     """
     Creates a standardized JSON response for use across multiple views.
 
     :param message: The message to include in the response
     :param status_txt: The status text ('success', 'error', etc.)
     :param status: The HTTP status code for the response
+    :param data: Optional dictionary of extra keys to include in the response
     :return: A JsonResponse object
     """
     return JsonResponse(
         {
             "message": message,
             "status_txt": status_txt,
+            **(data or {}),
         },
         status=status,
     )
@@ -0,0 +1,193 @@
+import logging
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+import investment.constants as constants
+from investment.utils.cache_utils import bump_data_version_on_commit
+from investment.models import (
+    CurrentInvestment,
+    Instrument,
+    ManualMeta,
+    MonthlyVolume,
+    Screener,
+    ScreenerTombstone,
+    TradingView,
+    Watchlist,
+    WeeklyVolume,
+    sort_keys,
+)
+
+logger = logging.getLogger(__name__)
+
+# Screener column to the source column it is copied from. The aliases are joined in refresh_screener
+SCREENER_SOURCES = {
+    "ticker": "tv.ticker",
+    "description": "tv.description",
+    "technical_rating": "tv.technical_rating",
+    "oscillators_rating": "tv.oscillators_rating",
+    "moving_avg_rating": "tv.moving_avg_rating",
+    "price": "tv.price",
+    "perf_weekly": "tv.perf_weekly",
+    "perf_monthly": "tv.perf_monthly",
+    "perf_3m": "tv.perf_3m",
+    "perf_ytd": "tv.perf_ytd",
+    "perf_6m": "tv.perf_6m",
+    "vol_1w": "tv.vol_1w",
+    "vol_1m": "tv.vol_1m",
+    "asset_class": "mm.asset_class",
+    # ManualMeta's geography foreign keys hold the names
+    "country": "mm.country_id",
+    "region": "mm.region_id",
+    "sub_region": "mm.sub_region_id",
+    "objective": "mm.objective",
+    "hedge_ccy": "mm.hedge_ccy",
+    "trading_currency": "ins.trading_currency",
+    "turnover_monthly": "mv.gbp_turnover",
+    "num_trades_monthly": "mv.number_of_trades",
+    "volume_monthly": "mv.volume",
+    "avg_trade_size_monthly": "mv.avg_trade_size",
+    "turnover_weekly": "wv.gbp_turnover",
+    "num_trades_weekly": "wv.number_of_trades",
+    "avg_spread": "wv.avg_spread",
+    "avg_trade_size_weekly": "wv.avg_trade_size",
+}
+
+
+def screener_queryset():
+    """Every screener row in the default order, with the watchlist and portfolio flags, in one query."""
+    # Metadata, volumes and currency are joined into the screener table after each ingest
+    return Screener.objects.order_by(*sort_keys(constants.SCREENER_ORDERING)).annotate(
+        on_watchlist=Exists(Watchlist.objects.filter(id=OuterRef("ticker"))),
+        in_portfolio=Exists(CurrentInvestment.objects.filter(ticker_id=OuterRef("ticker"))),
+    )
+
+
+def _publish_on_commit():
+    """Once the screener change commits, move the data version on and write the workers' snapshot file."""
+    # Imported here as the snapshot is built from screener_queryset
+    from investment.utils.snapshot_utils import publish_screener_snapshot
+
+    bump_data_version_on_commit()
+    transaction.on_commit(publish_screener_snapshot)
+
+
+def _lock_and_next_version(cursor):
+    """
+    Take the screener's transaction-level advisory lock and return the next change version. Versions are
+    handed out under the lock, so they commit in the order they were taken.
+    """
+    quote = connection.ops.quote_name
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [Screener._meta.db_table])
+    cursor.execute(
+        f"SELECT GREATEST("
+        f"(SELECT COALESCE(MAX(change_version), 0) FROM {quote(Screener._meta.db_table)}), "
+        f"(SELECT COALESCE(MAX(change_version), 0) FROM {quote(ScreenerTombstone._meta.db_table)})) + 1"
+    )
+    return cursor.fetchone()[0]
+
+
+def current_screener_version():
+    """The latest change version of any screener row or tombstone, for clients to sync from."""
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT GREATEST("
+            f"(SELECT COALESCE(MAX(change_version), 0) FROM {quote(Screener._meta.db_table)}), "
+            f"(SELECT COALESCE(MAX(change_version), 0) FROM {quote(ScreenerTombstone._meta.db_table)}))"
+        )
+        return cursor.fetchone()[0]
+
+
+def refresh_screener(tickers=None):
+    """
+    Rebuild the screener table from TradingView, ManualMeta, the volume tables and the instrument master.
+
+    Runs as one transaction of set-based statements: an INSERT ... ON CONFLICT that only rewrites rows whose
+    values changed, and a DELETE of tickers that have left TradingView, which leaves a tombstone. Rows that
+    are written and tombstones get a new change version for delta sync. Readers keep seeing the previous
+    contents until it commits. Concurrent rebuilds are serialised with a transaction-level advisory lock.
+
+    :param tickers: Only rebuild the rows of these tickers, for a change to a few rows of a source table.
+        Defaults to every row
+    :return: Tuple of (inserted, updated, deleted) row counts
+    """
+    quote = connection.ops.quote_name
+    table = quote(Screener._meta.db_table)
+    tombstones = quote(ScreenerTombstone._meta.db_table)
+    columns = list(SCREENER_SOURCES)
+    column_list = ", ".join(quote(c) for c in columns)
+    source_list = ", ".join(SCREENER_SOURCES.values())
+    changed = [c for c in columns if c != "ticker"]
+    updates = ", ".join(f"{quote(c)} = EXCLUDED.{quote(c)}" for c in changed + ["last_updated", "change_version"])
+    current = ", ".join(f"s.{quote(c)}" for c in changed)
+    incoming = ", ".join(f"EXCLUDED.{quote(c)}" for c in changed)
+    scoped = tickers is not None
+    scope_params = [list(tickers)] if scoped else []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        version = _lock_and_next_version(cursor)
+        cursor.execute(
+            f"WITH merged AS ("
+            f"INSERT INTO {table} AS s ({column_list}, last_updated, change_version) "
+            f"SELECT {source_list}, %s, %s "
+            f"FROM {quote(TradingView._meta.db_table)} tv "
+            f"LEFT JOIN {quote(ManualMeta._meta.db_table)} mm ON mm.ticker = tv.ticker "
+            f"LEFT JOIN {quote(MonthlyVolume._meta.db_table)} mv ON mv.ticker = tv.ticker "
+            f"LEFT JOIN {quote(WeeklyVolume._meta.db_table)} wv ON wv.ticker = tv.ticker "
+            f"LEFT JOIN {quote(Instrument._meta.db_table)} ins ON ins.ticker = tv.ticker "
+            f"{'WHERE tv.ticker = ANY(%s) ' if scoped else ''}"
+            f"ON CONFLICT (ticker) DO UPDATE SET {updates} "
+            f"WHERE ({current}) IS DISTINCT FROM ({incoming}) "
+            f"RETURNING (xmax = 0) AS inserted"
+            f") SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged",
+            [timezone.now(), version, *scope_params],
+        )
+        inserted, updated = cursor.fetchone()
+        cursor.execute(
+            f"WITH removed AS ("
+            f"DELETE FROM {table} s WHERE NOT EXISTS "
+            f"(SELECT 1 FROM {quote(TradingView._meta.db_table)} tv WHERE tv.ticker = s.ticker) "
+            f"{'AND s.ticker = ANY(%s) ' if scoped else ''}"
+            f"RETURNING s.ticker"
+            f"), marked AS ("
+            f"INSERT INTO {tombstones} (ticker, change_version) SELECT ticker, %s FROM removed "
+            f"ON CONFLICT (ticker) DO UPDATE SET change_version = EXCLUDED.change_version"
+            f") SELECT count(*) FROM removed",
+            [*scope_params, version],
+        )
+        deleted = cursor.fetchone()[0]
+        # A ticker that has come back is no longer deleted
+        if inserted:
+            cursor.execute(
+                f"DELETE FROM {tombstones} t USING {table} s WHERE s.ticker = t.ticker AND s.change_version = %s",
+                [version],
+            )
+        if scoped:
+            # As for touch_screener, workers rebuild the snapshot when they next need it
+            bump_data_version_on_commit()
+        else:
+            # The screener is rebuilt after every ingest, so this is where cached responses and snapshots go stale
+            _publish_on_commit()
+
+    logger.info(f"Refreshed screener: {inserted} inserted, {updated} updated, {deleted} deleted (version {version}).")
+    return inserted, updated, deleted
+
+
+def touch_screener(tickers):
+    """
+    Give the screener rows of tickers a new change version, for changes that alter a row's output without
+    changing the table, like the watchlist and portfolio flags.
+    """
+    tickers = list(tickers)
+    if not tickers:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        version = _lock_and_next_version(cursor)
+        cursor.execute(
+            f"UPDATE {connection.ops.quote_name(Screener._meta.db_table)} SET change_version = %s "
+            f"WHERE ticker = ANY(%s)",
+            [version, tickers],
+        )
+        # Only flags changed, so the snapshot is left for workers to rebuild when they next need it, rather
+        # than rebuilt here in the request that changed one row
+        bump_data_version_on_commit()
@@ -0,0 +1,263 @@
+import logging
+import re
+import threading
+import time
+from functools import partial, reduce
+from operator import or_
+from django.apps import apps
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import transaction
+from django.db.models import CharField, F, Q, Value
+from django.db.models.functions import Greatest
+import numpy as np
+import investment.constants as constants
+from investment.models import instrument_search_vector
+from investment.utils.cache_utils import state_cache
+
+logger = logging.getLogger(__name__)
+
+# Match kinds in the order their results are ranked
+KINDS = ("ticker", "isin", "name")
+SEPARATORS = re.compile(r"[\W_]+")
+# Words of a full text query. Nothing else reaches the tsquery, so its operators cannot be injected
+SEARCH_TERM = re.compile(r"[^\W_]+")
+
+
+def normalise(text):
+    """Lower case with each run of spaces and punctuation as one space, so "all world" finds "All-World"."""
+    return SEPARATORS.sub(" ", str(text).lower()).strip()
+
+
+def _version_key(source):
+    return f"investment:autocomplete_version:{source}"
+
+
+def bump_autocomplete(sources):
+    """Start a new version of the autocomplete segments of sources, so every worker rebuilds just those."""
+    version = str(time.time_ns())
+    state_cache.set_many({_version_key(source): version for source in sources}, timeout=None)
+    logger.debug(f"Autocomplete version of {', '.join(sources)} bumped to {version}")
+
+
+def bump_autocomplete_on_commit(sources):
+    """Bump the autocomplete segments of sources once the current transaction commits."""
+    transaction.on_commit(partial(bump_autocomplete, list(sources)))
+
+
+def autocomplete_versions():
+    """The current version of each autocomplete segment, shared by every worker through the state cache."""
+    keys = {_version_key(source): source for source in constants.AUTOCOMPLETE_SOURCES}
+    versions = state_cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        state_cache.add(key, str(time.time_ns()), timeout=None)
+        versions[key] = state_cache.get(key)
+    return {source: versions[key] for key, source in keys.items()}
+
+
+class PrefixSegment:
+    """
+    The autocomplete keys of one instrument table as sorted fixed-width byte arrays, searched with bisect.
+
+    Each kind of key is a NumPy "S" array, which takes AUTOCOMPLETE_KEY_WIDTH bytes a key instead of a
+    Python string each, alongside an int32 array of the entry each key belongs to. Every key that starts
+    with a prefix lies between searchsorted(prefix) and searchsorted(prefix + b"\\xff"), as 0xff never occurs
+    in UTF-8.
+    """
+
+    def __init__(self, source, version, entries, keys):
+        self.source = source
+        self.version = version
+        # (ticker, isin, names) per entry, with the result named by the first name
+        self.entries = entries
+        width = constants.AUTOCOMPLETE_KEY_WIDTH
+        self.keys = {}
+        for kind in KINDS:
+            values = np.array([key.encode()[:width] for key, _ in keys[kind]], dtype=f"S{width}")
+            rows = np.fromiter((row for _, row in keys[kind]), dtype=np.int32, count=len(keys[kind]))
+            order = np.argsort(values, kind="stable")
+            self.keys[kind] = (values[order], rows[order])
+
+    @classmethod
+    def build(cls, source, version):
+        """Read every ticker, isin and name of the source table."""
+        spec = constants.AUTOCOMPLETE_SOURCES[source]
+        isin_fields = [spec["isin"]] if spec["isin"] else []
+        values = apps.get_model("investment", source).objects.values_list(
+            "ticker", *isin_fields, *spec["names"]
+        )
+        entries, keys = [], {kind: [] for kind in KINDS}
+        for ticker, *fields in values.iterator(chunk_size=5000):
+            isin = fields[0] if isin_fields else None
+            names = [name for name in fields[len(isin_fields):] if name]
+            row = len(entries)
+            entries.append((ticker, isin, tuple(names)))
+            keys["ticker"].append((normalise(ticker), row))
+            if isin:
+                keys["isin"].append((normalise(isin), row))
+            # Every word of every name, running on to the end of the name, so "all world" finds "FTSE All World"
+            suffixes = set()
+            for name in map(normalise, names):
+                suffixes.update(name[start:] for start, char in enumerate(" " + name) if char == " ")
+            keys["name"].extend((suffix, row) for suffix in suffixes)
+        return cls(source, version, entries, keys)
+
+    @staticmethod
+    def texts(kind, entry):
+        ticker, isin, names = entry
+        return {"ticker": [ticker], "isin": [isin or ""], "name": names}[kind]
+
+    def matches(self, kind, query, limit, seen):
+        """
+        Up to limit (key, entry) pairs of kind whose key starts with query, in key order, skipping tickers in
+        seen and repeats of an entry.
+
+        :param query: normalise()d query
+        """
+        values, rows = self.keys[kind]
+        prefix = query.encode()[: constants.AUTOCOMPLETE_KEY_WIDTH]
+        start = np.searchsorted(values, prefix, side="left")
+        end = np.searchsorted(values, prefix + b"\xff", side="left")
+        # Keys are cut to the key width, so a longer query is checked against the entry itself
+        truncated = len(query.encode()) > constants.AUTOCOMPLETE_KEY_WIDTH
+        found, rows_found = [], set()
+        for i in range(start, end):
+            row = int(rows[i])
+            entry = self.entries[row]
+            if row in rows_found or entry[0] in seen:
+                continue
+            if truncated and not any(query in normalise(text) for text in self.texts(kind, entry)):
+                continue
+            rows_found.add(row)
+            found.append((values[i], entry))
+            if len(found) == limit:
+                break
+        return found
+
+
+_segments = {}
+_segments_lock = threading.Lock()
+
+
+def autocomplete_segments():
+    """
+    This worker's segments for the current versions. A segment whose version has moved on is rebuilt on its
+    own, so loading one instrument table leaves the others' segments in place. Threads asking meanwhile wait
+    for the rebuild.
+    """
+    global _segments
+    versions = autocomplete_versions()
+    segments = _segments
+    if all(source in segments and segments[source].version == v for source, v in versions.items()):
+        return segments
+    with _segments_lock:
+        segments = dict(_segments)
+        for source, version in versions.items():
+            if source not in segments or segments[source].version != version:
+                start = time.perf_counter()
+                segments[source] = PrefixSegment.build(source, version)
+                logger.info(
+                    f"Built {source} autocomplete segment of {len(segments[source].entries)} entries "
+                    f"in {time.perf_counter() - start:.3f}s"
+                )
+        # Swapped in whole so readers never see a mix of segments being replaced
+        _segments = segments
+        return segments
+
+
+def autocomplete(query, limit=constants.AUTOCOMPLETE_DEFAULT_LIMIT):
+    """
+    Instruments whose ticker, isin or any word of a name starts with query.
+
+    Ticker matches come first, then isin and then name matches, each in key order. A ticker found in
+    several tables, or by several keys, is only listed once at its best match.
+
+    :param query: Text typed so far
+    :param limit: Most results to return
+    :return: List of {"ticker", "isin", "name", "source"} dicts
+    """
+    query = normalise(query)
+    if not query:
+        return []
+    segments = autocomplete_segments()
+    results, seen = [], set()
+    for kind in KINDS:
+        candidates = []
+        for source, segment in segments.items():
+            candidates.extend((key, source, entry) for key, entry in segment.matches(kind, query, limit, seen))
+        candidates.sort(key=lambda candidate: candidate[0])
+        for _, source, (ticker, isin, names) in candidates:
+            if ticker in seen:
+                continue
+            seen.add(ticker)
+            name = names[0].strip() if names else ""
+            results.append({"ticker": ticker, "isin": isin, "name": name, "source": source})
+            if len(results) == limit:
+                return results
+    return results
+
+
+def _search_rows(source, queryset, rank):
+    """
+    Matching rows of one instrument table with the columns every part of the search union selects, in the
+    same order.
+    """
+    fields = constants.INSTRUMENT_SEARCH_FIELDS[source]
+    return queryset.annotate(
+        # Only Equity has a sector
+        sector=F("icb_super_sector") if "icb_super_sector" in fields else Value(None, CharField()),
+        source=Value(source, CharField()),
+        rank=rank,
+    ).values("ticker", "isin", "issuer_name", "instrument_name", "sector", "source", "rank")
+
+
+def instrument_search(query, match_all=True):
+    """
+    Equity, Bond and Etp rows matching a full text query, best match first.
+
+    Each word of the query matches any word of the searched fields that starts with it, so partial words
+    still match. Rows are ranked with ts_rank_cd on the weighted INSTRUMENT_SEARCH_FIELDS. The filter is on
+    the same expression as each table's GIN index, so only matching rows are read whatever the table size.
+
+    :param query: Text to search for
+    :param match_all: Require every word to match, otherwise any of them
+    :return: Union queryset of dicts with ticker, isin, issuer_name, instrument_name, sector, source and rank,
+        or None if the query has no words
+    """
+    terms = [f"{term}:*" for term in SEARCH_TERM.findall(query.lower())]
+    if not terms:
+        return None
+    search_query = SearchQuery(
+        (" & " if match_all else " | ").join(terms), search_type="raw", config=constants.INSTRUMENT_SEARCH_CONFIG
+    )
+    querysets = []
+    for source in constants.INSTRUMENT_SEARCH_FIELDS:
+        vector = instrument_search_vector(source)
+        queryset = apps.get_model("investment", source).objects.annotate(search=vector).filter(search=search_query)
+        querysets.append(_search_rows(source, queryset, SearchRank(vector, search_query, cover_density=True)))
+    first, *others = querysets
+    return first.union(*others, all=True).order_by("-rank", "source", "ticker")
+
+
+def fuzzy_instrument_search(query):
+    """
+    Equity, Bond and Etp rows with an issuer or instrument name containing words similar to the query, best
+    match first, for queries with a typo that full text search finds nothing for.
+
+    Rows match on pg_trgm word similarity above pg_trgm.word_similarity_threshold, through the %> operator
+    that each name's trigram GIN index serves, and are ranked by the better similarity of the two names.
+
+    :param query: Text to search for
+    :return: Union queryset as instrument_search returns, or None if the query has no words
+    """
+    query = " ".join(SEARCH_TERM.findall(query.lower()))
+    if not query:
+        return None
+    fields = constants.INSTRUMENT_TRIGRAM_FIELDS
+    similar = reduce(or_, [Q(**{f"{field}__trigram_word_similar": query}) for field in fields])
+    rank = Greatest(*[TrigramWordSimilarity(query, field) for field in fields])
+    querysets = [
+        _search_rows(source, apps.get_model("investment", source).objects.filter(similar), rank)
+        for source in constants.INSTRUMENT_SEARCH_FIELDS
+    ]
+    first, *others = querysets
+    return first.union(*others, all=True).order_by("-rank", "source", "ticker")
@@ -0,0 +1,284 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from json.encoder import encode_basestring
+from pathlib import Path
+from django.conf import settings
+import numpy as np
+import pandas as pd
+import investment.constants as constants
+from investment.serializers import TradingviewObjectiveSerializer
+from investment.utils.cache_utils import get_data_version
+from investment.utils.json_utils import column_encoders, encoded_columns, escape_separators, serializer_sources
+from investment.utils.screener_utils import screener_queryset
+
+logger = logging.getLogger(__name__)
+
+# File layout: MAGIC, the header length as a little-endian uint64, the JSON header, then every array and
+# blob at an 8-byte aligned offset given in the header
+MAGIC = b"SCRSNAP1"
+ALIGN = 8
+
+
+def _encode_strings(strings):
+    """
+    Comma-joined UTF-8 blob of strings and the byte offset each one starts at, with one more offset past
+    the end. String i is blob[starts[i]:starts[i + 1] - 1], and strings i to j, already separated by commas,
+    are blob[starts[i]:starts[j + 1] - 1].
+    """
+    encoded = [s.encode() for s in strings]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    starts = np.concatenate([[0], np.cumsum(lengths + 1)]).astype(np.int64)
+    return b",".join(encoded), starts
+
+
+def encode_screener_snapshot(version, serializer, rows, exact_fields, numeric_fields):
+    """
+    Encode the screener as snapshot file bytes.
+
+    Every row is encoded to JSON once, both as a complete object and as one fragment per column, so a
+    response is only a selection and a join. Exact filter fields are stored as category codes and numeric
+    fields as float64 with NaN for NULL.
+
+    :param version: Data version the rows were read at
+    :param serializer: Serializer instance whose fields define the output
+    :param rows: Every row as values_list tuples in serializer_sources(serializer) order, in default order
+    :param exact_fields: Fields filtered by exact match
+    :param numeric_fields: Fields filtered by threshold or sorted on
+    :return: bytes
+    """
+    sources = serializer_sources(serializer)
+    columns = dict(zip(sources, zip(*rows))) if rows else {source: () for source in sources}
+    arrays, blobs, categories = {}, {}, {}
+    for field in exact_fields:
+        # NULL is -1 so it never matches
+        codes, uniques = pd.factorize(np.array(columns[field], dtype=object))
+        arrays[f"codes:{field}"] = codes.astype(np.int64)
+        categories[field] = uniques.tolist()
+    for field in numeric_fields:
+        arrays[f"numbers:{field}"] = np.array(columns[field], dtype=np.float64)
+
+    encoders = column_encoders(serializer)
+    # U+2028 and U+2029 are escaped here so the joined output needs no further pass
+    fragments = [[escape_separators(value) for value in column] for column in encoded_columns(encoders, rows)]
+    for i, column in enumerate(fragments):
+        blobs[f"column:{i}"], arrays[f"column_starts:{i}"] = _encode_strings(column)
+    keys = [encode_basestring(name) for name, _, _ in encoders]
+    blobs["rows"], arrays["row_starts"] = _encode_strings(
+        ["{" + ",".join(f"{key}:{value}" for key, value in zip(keys, row)) + "}" for row in zip(*fragments)]
+    )
+
+    # Lay out the sections after the header, then write the header with their offsets
+    sections, layout, offset = [], {"arrays": {}, "blobs": {}}, 0
+    for name, array in arrays.items():
+        layout["arrays"][name] = {"dtype": array.dtype.str, "offset": offset, "count": len(array)}
+        sections.append(array.tobytes())
+        offset += -(-len(sections[-1]) // ALIGN) * ALIGN
+    for name, blob in blobs.items():
+        layout["blobs"][name] = {"offset": offset, "length": len(blob)}
+        sections.append(blob)
+        offset += -(-len(blob) // ALIGN) * ALIGN
+    header = json.dumps({
+        "version": version,
+        "size": len(rows),
+        "schema": [{"name": name, "type": kind} for name, kind, _ in encoders],
+        "categories": categories,
+        **layout,
+    }).encode()
+    prefix = MAGIC + struct.pack("<Q", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % ALIGN)
+    return prefix + b"".join(section + b"\0" * (-len(section) % ALIGN) for section in sections)
+
+
+class ScreenerSnapshot:
+    """
+    The whole screener as NumPy columns, for filtering, sorting and top-N without a query.
+
+    Reads a buffer laid out by encode_screener_snapshot. Opened from a file the buffer is a read-only
+    memory map, so the arrays are views onto pages shared by every worker that maps the same file rather
+    than copies. Rows are in the screener's default order, which makes a row's position the tie-breaker for
+    any other ordering.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        if bytes(buffer[: len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a screener snapshot")
+        (header_length,) = struct.unpack_from("<Q", buffer, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(buffer[start : start + header_length]))
+        base = start + header_length + (-(start + header_length) % ALIGN)
+
+        self.version = header["version"]
+        self.size = header["size"]
+        self.schema = header["schema"]
+        self.arrays = {
+            name: np.frombuffer(buffer, dtype=spec["dtype"], count=spec["count"], offset=base + spec["offset"])
+            for name, spec in header["arrays"].items()
+        }
+        self.blob_offsets = {name: base + spec["offset"] for name, spec in header["blobs"].items()}
+        self.lookups = {
+            field: {value: code for code, value in enumerate(values)} for field, values in header["categories"].items()
+        }
+
+    @classmethod
+    def open(cls, path):
+        """Map a snapshot file, or None if there is none."""
+        try:
+            with open(path, "rb") as f:
+                return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            return None
+
+    def select(self, exact=None, thresholds=None, ordering=None, limit=None):
+        """
+        Positions of the matching rows in output order.
+
+        :param exact: Dict of field to the values it may equal
+        :param thresholds: List of (field, "gte" or "lte", value). NULLs never match, as in SQL
+        :param ordering: List of (field, descending) on numeric fields, with NULLs last either way and the
+            default order breaking ties
+        :param limit: Keep only the first limit rows
+        :return: Array of row positions
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for field, values in (exact or {}).items():
+            lookup = self.lookups[field]
+            mask &= np.isin(self.arrays[f"codes:{field}"], [lookup[value] for value in values if value in lookup])
+        for field, op, value in thresholds or []:
+            numbers = self.arrays[f"numbers:{field}"]
+            mask &= numbers >= value if op == "gte" else numbers <= value
+        positions = np.flatnonzero(mask)
+
+        if ordering:
+            # lexsort sorts on the last key first and puts NaN last, negated or not
+            keys = [positions]
+            for field, descending in reversed(ordering):
+                numbers = self.arrays[f"numbers:{field}"][positions]
+                keys.append(-numbers if descending else numbers)
+            positions = positions[np.lexsort(keys)]
+        if limit is not None:
+            positions = positions[:limit]
+        return positions
+
+    def _join(self, blob, starts, positions):
+        """The strings at positions joined by commas, copied out of the buffer one run of neighbours at a time."""
+        if not len(positions):
+            return b""
+        offset = self.blob_offsets[blob]
+        breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+        firsts = positions[np.concatenate([[0], breaks])]
+        lasts = positions[np.concatenate([breaks - 1, [len(positions) - 1]])]
+        begins = (offset + starts[firsts]).tolist()
+        ends = (offset + starts[lasts + 1] - 1).tolist()
+        return b",".join(self.buffer[begin:end] for begin, end in zip(begins, ends))
+
+    def json(self, positions):
+        """The selected rows as the JSON list the serializer would produce, as bytes."""
+        return b"[" + self._join("rows", self.arrays["row_starts"], positions) + b"]"
+
+    def columns(self, positions):
+        """The selected rows as JSON array bytes per column, built as they are read."""
+        for i in range(len(self.schema)):
+            yield b"[" + self._join(f"column:{i}", self.arrays[f"column_starts:{i}"], positions) + b"]"
+
+
+def snapshot_path():
+    return Path(settings.SCREENER_SNAPSHOT_DIR) / "screener.snap"
+
+
+@contextmanager
+def _writer_lock():
+    """Exclusive lock across workers, so one of them builds a snapshot while the others wait for it."""
+    path = snapshot_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix(".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _is_current(snapshot, version):
+    """True if snapshot is at version or a later one. Versions are nanosecond timestamps, or None without a cache."""
+    if snapshot is None:
+        return False
+    if snapshot.version is None or version is None:
+        return snapshot.version == version
+    return int(snapshot.version) >= int(version)
+
+
+def write_screener_snapshot():
+    """
+    Build the snapshot of the current screener and data version from the db and publish it, unless the file
+    is already at that version or a later one. The file is written under a temporary name and renamed over
+    the old one, so a reader maps either the old file or the new one in full. Workers that still map the old
+    file keep it until they swap.
+
+    :return: Path of the snapshot
+    """
+    path = snapshot_path()
+    with _writer_lock():
+        # Read under the lock, so a writer that waited behind a newer one does not replace its file
+        version = get_data_version()
+        if _is_current(ScreenerSnapshot.open(path), version):
+            return path
+        start = time.perf_counter()
+        serializer = TradingviewObjectiveSerializer()
+        rows = list(screener_queryset().values_list(*serializer_sources(serializer)))
+        data = encode_screener_snapshot(
+            version, serializer, rows, constants.SCREENER_EXACT_FILTERS, constants.SCREENER_NUMERIC_FIELDS
+        )
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    logger.info(
+        f"Wrote screener snapshot of {len(rows)} rows, {len(data)} bytes, for data version {version} "
+        f"in {time.perf_counter() - start:.3f}s"
+    )
+    return path
+
+
+def publish_screener_snapshot():
+    """on_commit callback for the ingest paths. A failure is logged, as the data itself has been committed."""
+    try:
+        write_screener_snapshot()
+    except Exception as e:
+        logger.error(f"Error writing screener snapshot. {e}")
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def screener_snapshot():
+    """
+    This worker's mapping of the screener snapshot for the current data version.
+
+    The first request after the data version moves on maps the new file, which the ingest that moved it has
+    normally written already. If it has not, for writes that bump the version without going through an
+    ingest, this worker writes it. Threads asking meanwhile wait rather than answer for the new version with
+    the old rows.
+    """
+    global _snapshot
+    version = get_data_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            snapshot = ScreenerSnapshot.open(snapshot_path())
+            if snapshot is None or snapshot.version != version:
+                snapshot = ScreenerSnapshot.open(write_screener_snapshot())
+            # A newer version may have been written meanwhile. It is used until this worker sees that version
+            _snapshot = snapshot
+            logger.info(f"Mapped screener snapshot of {snapshot.size} rows for data version {snapshot.version}")
+        return _snapshot
@@ -0,0 +1,344 @@
+import logging
+import math
+from collections import defaultdict, namedtuple
+from django.db import connection, transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import investment.constants as constants
+from investment.models import Book, CurrentInvestment, Instrument, PositionSnapshot, Trade
+from investment.utils.cache_utils import bump_data_version_on_commit
+from investment.utils.screener_utils import touch_screener
+
+logger = logging.getLogger(__name__)
+
+
+class TradeRejected(ValueError):
+    """A trade that would break the position it is recorded against. Nothing has been written."""
+
+    def __init__(self, message, current_qty=None):
+        super().__init__(message)
+        self.current_qty = current_qty
+
+
+class TradeImportRejected(ValueError):
+    """A batch of trades with rows that cannot be recorded. None of the batch has been written."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len({error['row'] for error in errors})} trade rows rejected")
+        self.errors = errors
+
+
+# A validated row of a trade import, numbered from 1 in the order it was sent
+ImportedTrade = namedtuple("ImportedTrade", ["row", "book", "ticker", "qty", "price", "executed_at"])
+
+ORDER_ERROR = "Trades must be recorded in the order they were executed."
+
+
+def _lock_ledger(cursor, exclusive=False):
+    """
+    Transaction-level advisory lock on the ledger. Trades share it and a snapshot takes it alone, so a
+    snapshot never misses a trade that commits while it is being taken.
+    """
+    function = "pg_advisory_xact_lock" if exclusive else "pg_advisory_xact_lock_shared"
+    cursor.execute(f"SELECT {function}(hashtext(%s))", [Trade._meta.db_table])
+
+
+def apply_trade(qty, avg_px, trade_qty, price):
+    """
+    Position after a trade, at average cost. A buy moves the average price to the cost of the whole position,
+    a sell leaves it as it is and realizes the difference to the sale price.
+
+    :param qty: Quantity held before the trade
+    :param avg_px: Average price of the quantity held
+    :param trade_qty: Positive to buy, negative to sell
+    :param price: Price of the trade
+    :return: Tuple of (qty, avg_px, realized_pnl)
+    """
+    if trade_qty == 0:
+        raise TradeRejected("Trade quantity must not be zero.")
+    total_qty = qty + trade_qty
+    if trade_qty > 0:
+        return total_qty, (qty * avg_px + trade_qty * price) / total_qty, 0.0
+    if total_qty < 0:
+        raise TradeRejected("Cannot sell more shares than you currently own.", current_qty=qty)
+    # A closed position has no average price
+    return total_qty, avg_px if total_qty else 0.0, -trade_qty * (price - avg_px)
+
+
+def _out_of_order(executed_at, last_trade, last_snapshot):
+    """True for a trade dated before the position's last trade, or at or before its last snapshot."""
+    return bool((last_trade and executed_at < last_trade) or (last_snapshot and executed_at <= last_snapshot))
+
+
+def record_trade(book, ticker, qty, price, executed_at=None):
+    """
+    Append a trade to the ledger and move its position on by it, in one transaction.
+
+    The position row is locked while it is read and written, so concurrent trades on one position are applied
+    one after the other. A trade may not be dated before the position's last trade or snapshot, as positions
+    are kept in ledger order and rebuilt from the latest snapshot.
+
+    :param book: Book instance
+    :param ticker: Instrument instance
+    :param qty: Positive to buy, negative to sell
+    :param price: Price of the trade
+    :param executed_at: When the trade was done, defaults to now
+    :return: The Trade
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        _lock_ledger(cursor)
+        executed_at = executed_at or timezone.now()
+        positions = CurrentInvestment.objects.select_for_update()
+        if qty > 0:
+            position, _ = positions.get_or_create(
+                book=book, ticker=ticker, defaults={"qty": 0, "avg_px": 0.0, "current_px": price}
+            )
+        else:
+            position = positions.filter(book=book, ticker=ticker).first()
+            if position is None:
+                raise TradeRejected("Cannot sell a security you do not have a position in.")
+
+        last_trade = Trade.objects.filter(book=book, ticker=ticker).aggregate(at=Max("executed_at"))["at"]
+        last_snapshot = PositionSnapshot.objects.filter(book=book, ticker=ticker).aggregate(
+            at=Max("snapshot_at")
+        )["at"]
+        if _out_of_order(executed_at, last_trade, last_snapshot):
+            raise TradeRejected(ORDER_ERROR)
+
+        position.qty, position.avg_px, realized_pnl = apply_trade(position.qty or 0, position.avg_px, qty, price)
+        position.current_px = price
+        position.save()
+        return Trade.objects.create(
+            book=book, ticker=ticker, qty=qty, price=price, realized_pnl=realized_pnl, executed_at=executed_at
+        )
+
+
+def positions_at(at):
+    """
+    Every position as it stood at a point in time, from the latest snapshot of each position taken by then
+    and the trades executed after it, so only the ledger since the last snapshot is read.
+
+    :param at: Aware datetime
+    :return: Dict of (book, ticker) to (qty, avg_px, realized_pnl)
+    """
+    snapshots = (
+        PositionSnapshot.objects.filter(snapshot_at__lte=at)
+        .order_by("book", "ticker", "-snapshot_at")
+        .distinct("book", "ticker")
+        .values_list("book", "ticker", "qty", "avg_px", "realized_pnl")
+    )
+    positions = {(book, ticker): (qty, avg_px, realized) for book, ticker, qty, avg_px, realized in snapshots}
+
+    since = PositionSnapshot.objects.filter(
+        book=OuterRef("book"), ticker=OuterRef("ticker"), snapshot_at__lte=at
+    ).order_by("-snapshot_at").values("snapshot_at")[:1]
+    trades = (
+        Trade.objects.filter(executed_at__lte=at)
+        .annotate(since=Subquery(since))
+        .filter(Q(since=None) | Q(executed_at__gt=F("since")))
+        .order_by("executed_at", "id")
+        .values_list("book", "ticker", "qty", "price")
+    )
+    for book, ticker, qty, price in trades.iterator(chunk_size=5000):
+        held, avg_px, realized = positions.get((book, ticker), (0, 0.0, 0.0))
+        held, avg_px, realized_pnl = apply_trade(held, avg_px, qty, price)
+        positions[book, ticker] = (held, avg_px, realized + realized_pnl)
+    return positions
+
+
+def snapshot_positions(at=None):
+    """
+    Store every position as it stands at a point in time. Trades are held off while it is taken, so none
+    executed up to then is left out.
+
+    :param at: Aware datetime no later than now, defaults to now
+    :return: Number of positions stored
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        _lock_ledger(cursor, exclusive=True)
+        now = timezone.now()
+        at = at or now
+        if at > now:
+            raise ValueError("Cannot snapshot positions in the future")
+        positions = positions_at(at)
+        PositionSnapshot.objects.bulk_create(
+            [
+                PositionSnapshot(
+                    snapshot_at=at, book_id=book, ticker_id=ticker, qty=qty, avg_px=avg_px, realized_pnl=realized
+                )
+                for (book, ticker), (qty, avg_px, realized) in positions.items()
+            ],
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+    logger.info(f"Snapshot of {len(positions)} positions taken at {at:%Y-%m-%d %H:%M:%S}")
+    return len(positions)
+
+
+def _parse_qty(value):
+    if isinstance(value, bool):
+        raise ValueError
+    number = float(value)
+    if not number.is_integer() or number == 0:
+        raise ValueError
+    return int(number)
+
+
+def _parse_price(value):
+    if isinstance(value, bool):
+        raise ValueError
+    price = float(value)
+    if not math.isfinite(price) or price <= 0:
+        raise ValueError
+    return price
+
+
+def _parse_executed_at(value, default):
+    if value in (None, ""):
+        return default
+    executed_at = parse_datetime(str(value).strip())
+    if executed_at is None:
+        raise ValueError
+    return timezone.make_aware(executed_at) if timezone.is_naive(executed_at) else executed_at
+
+
+def parse_trades(rows):
+    """
+    Validate the rows of a trade import. Each error names the row, numbered from 1, and the field at fault.
+
+    :param rows: Dicts with book, ticker, qty and transaction_px, and optionally executed_at, as in the
+        update-current-investments endpoint. Values may be strings, as read from a CSV
+    :return: Tuple of (list of ImportedTrade, list of {"row", "field", "error"} dicts)
+    """
+    now = timezone.now()
+    trades, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({"row": number, "field": None, "error": "Expected an object with the trade's fields."})
+            continue
+        fields, row_errors = {}, []
+        for field in ("book", "ticker"):
+            fields[field] = str(row.get(field) or "").strip()
+            if not fields[field]:
+                row_errors.append({"row": number, "field": field, "error": "This field is required."})
+        for field, parse, error in (
+            ("qty", _parse_qty, "A whole number of shares other than zero is required."),
+            ("transaction_px", _parse_price, "A positive price is required."),
+            ("executed_at", lambda value: _parse_executed_at(value, now), "Expected an ISO 8601 date and time."),
+        ):
+            try:
+                fields[field] = parse(row.get(field))
+            except (ValueError, TypeError):
+                row_errors.append({"row": number, "field": field, "error": error})
+        if row_errors:
+            errors.extend(row_errors)
+            continue
+        trades.append(
+            ImportedTrade(
+                number, fields["book"], fields["ticker"], fields["qty"], fields["transaction_px"], fields["executed_at"]
+            )
+        )
+    return trades, errors
+
+
+def _latest(model, field, books, tickers):
+    """Latest value of a date field per (book, ticker) of model, for the given books and tickers, in one query."""
+    return {
+        (book, ticker): at
+        for book, ticker, at in model.objects.filter(book__in=books, ticker__in=tickers)
+        .values_list("book", "ticker")
+        .annotate(at=Max(field))
+    }
+
+
+def import_trades(rows):
+    """
+    Record a batch of trades in one transaction, or none of them.
+
+    Books and tickers are each resolved with one query, under the ledger lock. The trades are then applied to
+    their positions in memory, one (book, ticker) at a time in order of execution, so every oversold or out of
+    order row is found. If no row is rejected, the trades are appended to the ledger and the resulting
+    positions written, each with one bulk statement. The positions are locked meanwhile, as in record_trade.
+
+    :param rows: Rows as taken by parse_trades
+    :return: Tuple of (trades recorded, positions written)
+    :raises TradeImportRejected: With the errors of every rejected row
+    """
+    rows = list(rows)
+    if len(rows) > constants.TRADE_IMPORT_MAX_ROWS:
+        raise TradeImportRejected(
+            [{"row": None, "field": None, "error": f"At most {constants.TRADE_IMPORT_MAX_ROWS} trades per import."}]
+        )
+    trades, errors = parse_trades(rows)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        _lock_ledger(cursor)
+        books = {trade.book for trade in trades}
+        tickers = {trade.ticker for trade in trades}
+        known_books = set(Book.objects.filter(name__in=books).values_list("name", flat=True))
+        known_tickers = set(Instrument.objects.filter(ticker__in=tickers).values_list("ticker", flat=True))
+        by_position = defaultdict(list)
+        for trade in trades:
+            if trade.book not in known_books:
+                errors.append({"row": trade.row, "field": "book", "error": f"Book {trade.book} does not exist."})
+            elif trade.ticker not in known_tickers:
+                errors.append(
+                    {"row": trade.row, "field": "ticker", "error": f"Instrument {trade.ticker} does not exist."}
+                )
+            else:
+                by_position[trade.book, trade.ticker].append(trade)
+        books, tickers = {book for book, _ in by_position}, {ticker for _, ticker in by_position}
+
+        # Locks every position of the books and tickers, a superset of the ones traded
+        positions = {
+            (position.book_id, position.ticker_id): position
+            for position in CurrentInvestment.objects.select_for_update().filter(book__in=books, ticker__in=tickers)
+        }
+        last_trades = _latest(Trade, "executed_at", books, tickers)
+        last_snapshots = _latest(PositionSnapshot, "snapshot_at", books, tickers)
+
+        ledger, written = [], []
+        for key, position_trades in by_position.items():
+            position = positions.get(key) or CurrentInvestment(book_id=key[0], ticker_id=key[1], qty=0, avg_px=0.0)
+            qty, avg_px, last_trade = position.qty or 0, position.avg_px, last_trades.get(key)
+            for trade in sorted(position_trades, key=lambda trade: (trade.executed_at, trade.row)):
+                if _out_of_order(trade.executed_at, last_trade, last_snapshots.get(key)):
+                    errors.append({"row": trade.row, "field": "executed_at", "error": ORDER_ERROR})
+                    continue
+                try:
+                    qty_after, avg_px_after, realized_pnl = apply_trade(qty, avg_px, trade.qty, trade.price)
+                except TradeRejected as e:
+                    errors.append({"row": trade.row, "field": "qty", "error": str(e), "current_qty": qty})
+                    continue
+                qty, avg_px, last_trade = qty_after, avg_px_after, trade.executed_at
+                position.current_px = trade.price
+                ledger.append(
+                    Trade(
+                        book_id=trade.book,
+                        ticker_id=trade.ticker,
+                        qty=trade.qty,
+                        price=trade.price,
+                        realized_pnl=realized_pnl,
+                        executed_at=trade.executed_at,
+                    )
+                )
+            position.qty, position.avg_px = qty, avg_px
+            written.append(position)
+        if errors:
+            raise TradeImportRejected(sorted(errors, key=lambda error: error["row"] or 0))
+
+        Trade.objects.bulk_create(ledger, batch_size=5000)
+        CurrentInvestment.objects.bulk_create(
+            written,
+            batch_size=5000,
+            update_conflicts=True,
+            unique_fields=["book", "ticker"],
+            update_fields=["qty", "avg_px", "current_px", "last_updated"],
+        )
+        # Bulk writes send no save signals. Only a new position changes a ticker's screener row, as for save
+        bump_data_version_on_commit()
+        touch_screener({ticker for book, ticker in by_position if (book, ticker) not in positions})
+
+    logger.info(f"Imported {len(ledger)} trades into {len(written)} positions")
+    return len(ledger), len(written)
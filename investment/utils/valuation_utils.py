@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+from django.db import connection
+import numpy as np
+import pandas as pd
+import investment.constants as constants
+from investment.models import CurrentInvestment, Currency, Instrument, ManualMeta, TradingView
+from investment.utils.cache_utils import get_data_version
+
+logger = logging.getLogger(__name__)
+
+# Position columns read from the db, labels first and then the numbers
+LABEL_COLUMNS = ["ticker", "book", "asset_class", "region", "objective", "currency"]
+NUMBER_COLUMNS = ["qty", "avg_px", "price", "gbp_rate"]
+
+
+def load_positions():
+    """
+    Every open position with its price, trading currency, GBP rate and metadata, read with one query of joins
+    and returned as NumPy arrays.
+
+    :return: Dict of column name to array, object arrays for LABEL_COLUMNS and float64 arrays, with NaN for a
+        missing value, for NUMBER_COLUMNS
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT ci.ticker, ci.book, mm.asset_class, mm.region_id, mm.objective, ins.trading_currency, "
+            f"ci.qty, ci.avg_px, tv.price, cur.gbp_value "
+            f"FROM {quote(CurrentInvestment._meta.db_table)} ci "
+            f"LEFT JOIN {quote(Instrument._meta.db_table)} ins ON ins.ticker = ci.ticker "
+            f"LEFT JOIN {quote(TradingView._meta.db_table)} tv ON tv.ticker = ci.ticker "
+            f"LEFT JOIN {quote(Currency._meta.db_table)} cur ON cur.name = ins.trading_currency "
+            f"LEFT JOIN {quote(ManualMeta._meta.db_table)} mm ON mm.ticker = ci.ticker "
+            f"WHERE ci.qty > 0"
+        )
+        rows = cursor.fetchall()
+    columns = list(zip(*rows)) if rows else [()] * (len(LABEL_COLUMNS) + len(NUMBER_COLUMNS))
+    positions = {name: np.array(values, dtype=object) for name, values in zip(LABEL_COLUMNS, columns)}
+    # None becomes NaN
+    positions.update({
+        name: np.array(values, dtype=np.float64) for name, values in zip(NUMBER_COLUMNS, columns[len(LABEL_COLUMNS):])
+    })
+    return positions
+
+
+def _rollup(values, market_value, cost, total):
+    """Market value, cost, unrealized P&L and weight of each distinct value, largest first, from bincounts."""
+    codes, keys = pd.factorize(values, use_na_sentinel=False)
+    count = np.bincount(codes, minlength=len(keys))
+    group_value = np.bincount(codes, weights=market_value, minlength=len(keys))
+    group_cost = np.bincount(codes, weights=cost, minlength=len(keys))
+    order = np.argsort(-group_value, kind="stable")
+    return [
+        _figures(None if pd.isna(key) else key, key_value, key_cost, key_count, total)
+        for key, key_value, key_cost, key_count in zip(
+            keys[order].tolist(), group_value[order].tolist(), group_cost[order].tolist(), count[order].tolist()
+        )
+    ]
+
+
+def _figures(key, market_value, cost, positions, total):
+    return {
+        "key": key,
+        "positions": positions,
+        "market_value": round(market_value, 2),
+        "cost": round(cost, 2),
+        "unrealized_pnl": round(market_value - cost, 2),
+        "unrealized_pnl_pct": round((market_value / cost - 1) * 100, 2) if cost else None,
+        "weight": round(market_value / total, 6) if total else None,
+    }
+
+
+def value_positions(positions, dimensions=constants.VALUATION_DIMENSIONS):
+    """
+    Value positions in GBP and break them down.
+
+    Market value is qty * price * gbp_rate and cost is qty * avg_px * gbp_rate, as avg_px is in the trading
+    currency. Positions without a price or a GBP rate can't be valued, so they are left out of every figure
+    and listed as unpriced.
+
+    :param positions: Arrays as returned by load_positions
+    :param dimensions: Label columns to break the portfolio down by
+    :return: Dict of totals, a list of rollups per dimension and the unpriced tickers
+    """
+    gbp_rate = positions["gbp_rate"]
+    market_value = positions["qty"] * positions["price"] * gbp_rate
+    cost = positions["qty"] * positions["avg_px"] * gbp_rate
+    priced = np.isfinite(market_value) & np.isfinite(cost)
+    market_value, cost = market_value[priced], cost[priced]
+    total = float(market_value.sum())
+
+    totals = _figures(None, total, float(cost.sum()), int(priced.sum()), total)
+    del totals["key"]
+    return {
+        "totals": totals,
+        "breakdowns": {
+            dimension: _rollup(positions[dimension][priced], market_value, cost, total) for dimension in dimensions
+        },
+        "unpriced": positions["ticker"][~priced].tolist(),
+    }
+
+
+_positions = None
+_positions_lock = threading.Lock()
+
+
+def current_positions():
+    """
+    This worker's positions arrays for the current data version, loaded by the first request after the
+    version moves on. Every valuation until the next change is then only the vectorized pass.
+    """
+    global _positions
+    version = get_data_version()
+    loaded = _positions
+    if loaded is not None and loaded[0] == version:
+        return loaded[1]
+    with _positions_lock:
+        if _positions is None or _positions[0] != version:
+            start = time.perf_counter()
+            positions = load_positions()
+            _positions = (version, positions)
+            logger.info(
+                f"Loaded {len(positions['ticker'])} positions for data version {version} "
+                f"in {time.perf_counter() - start:.3f}s"
+            )
+        return _positions[1]
+
+
+def portfolio_valuation(dimensions=constants.VALUATION_DIMENSIONS):
+    """Valuation of the current portfolio. See value_positions."""
+    return value_positions(current_positions(), dimensions)
@@ -6,38 +6,46 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models.functions import Coalesce, Round
+from django.db.models.functions import Round
 from django.http import JsonResponse, HttpResponse
 from django.db import transaction
+from django.apps import apps
 from django.db.models import (
     Subquery,
     OuterRef,
-    CharField,
     FloatField,
-    IntegerField,
     F,
     Q,
     ExpressionWrapper,
-    Value
+    Value,
+    Sum,
+    Avg,
+    Count,
+    Case,
+    When,
 )
 from .models import (
     ManualMeta,
     MonthlyVolume,
+    MonthlyVolumeHistory,
     WeeklyVolume,
+    WeeklyVolumeHistory,
     TradingView,
-    Equity,
-    Etp,
-    Bond,
+    Instrument,
     Watchlist,
     CurrentInvestment,
     Book,
     Currency,
+    ScreenerTombstone,
+    sort_keys,
 )
 from .serializers import (
     TradingviewObjectiveSerializer,
     WatchlistSerializer,
     CurrentInvestmentSerializer,
     BookSerializer,
+    InstrumentSearchSerializer,
+    InstrumentSerializer,
 )
 from datetime import timedelta, date, datetime
 from dateutil.relativedelta import relativedelta
@@ -49,15 +57,64 @@ import io
 import environ
 import logging
 import requests
-import warnings
 import boto3
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from json.encoder import encode_basestring
 from botocore.config import Config
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
 from django.http import HttpResponse, HttpResponseNotFound
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
 from investment.utils.response_utils import json_response
-from requests.exceptions import Timeout, RequestException, HTTPError
-import time
+from investment.pagination import ScreenerPagination, SearchPagination
+from investment.renderers import TABULAR_RENDERER_CLASSES, TabularRenderer, Table, dump_json
+from investment.utils.json_utils import (
+    FastPathUnsupported,
+    fast_json_applies,
+    serializer_json,
+    serializer_sources,
+)
+from investment.utils.cache_utils import (
+    CACHED_VIEWS,
+    cached_response,
+    get_data_version,
+    response_cache_stats,
+)
+from investment.utils.db_utils import upsert_dataframe, copy_merge_dataframe, swap_dataframe
+from investment.utils.instrument_utils import refresh_instruments
+from investment.utils.trade_utils import TradeImportRejected, TradeRejected, import_trades, record_trade
+from investment.utils.valuation_utils import portfolio_valuation
+from investment.utils.search_utils import (
+    autocomplete,
+    bump_autocomplete_on_commit,
+    fuzzy_instrument_search,
+    instrument_search,
+)
+from investment.utils.snapshot_utils import screener_snapshot
+from investment.utils.screener_utils import (
+    current_screener_version,
+    refresh_screener,
+    screener_queryset,
+    touch_screener,
+)
+from investment.utils.excel_utils import (
+    read_workbook,
+    parse_volume_sheet,
+    parse_weekly_volume,
+    combine_monthly_volumes,
+    parse_pool,
+    reset_parse_pool,
+)
+from investment.utils.report_utils import (
+    ReportCache,
+    ReportLocator,
+    month_end,
+    monthly_equity_report_url,
+    monthly_etp_report_url,
+)
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 # Get an instance of environ and fetch AWS credentials
@@ -70,31 +127,6 @@ AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")
 
 
 
-def fetch_with_retry(url, retries=3, timeout=10):
-    for attempt in range(retries):
-        try:
-            response = requests.get(url, timeout=timeout)
-            response.raise_for_status()  # Raise HTTPError for bad responses (e.g., 4xx and 5xx)
-            return response
-        except HTTPError as e:
-            if response.status_code == 404:
-                # Return the response so that the calling function knows it's a 404
-                print(f"404 Not Found: {url}")
-                return response
-            else:
-                print(f"HTTPError encountered: {e} (Status Code: {response.status_code})")
-                break  # Stop retrying for other HTTP errors
-        except Timeout:
-            print(f"Attempt {attempt + 1} timed out. Retrying...")
-            time.sleep(2 ** attempt)  # Exponential backoff
-        except RequestException as e:
-            print(f"Request failed: {e}")
-            break  # Stop retrying for other request exceptions
-
-    print("All retry attempts failed.")
-    return None  # Explicitly return None if no successful response
-
-
 def test_s3_connection(bucket_name):
     logger.info("Entered test_s3_connection.. Creating boto3.client object...")
     s3 = boto3.client(
@@ -189,47 +221,15 @@ def upload_tradingview_csv_to_db(file):
                 # Send for formatting
                 df = format_df(df=df_tv)
 
-                # Convert DataFrame to a list of dictionaries
-                dicts = df.to_dict("records")
-
-                # Fetch existing tickers to determine which rows need updates vs. creates
-                existing_tickers = set(
-                    TradingView.objects.filter(
-                        ticker__in=[row["ticker"] for row in dicts]
-                    ).values_list("ticker", flat=True)
-                )
-
-                new_objs = []
-                update_objs = []
-
-                for row in dicts:
-                    if row["ticker"] in existing_tickers:
-                        update_objs.append(TradingView(**row))
-                    else:
-                        new_objs.append(TradingView(**row))
-
-                logger.debug(f"Prepared {len(new_objs)} new objects and {len(update_objs)} updates for the database.")
-
-                # Using Django's atomic transaction to ensure data integrity
-                with transaction.atomic():
-                    # Bulk create new objects
-                    TradingView.objects.bulk_create(
-                        new_objs, ignore_conflicts=True
-                    )
-                    logger.info(f"Bulk created {len(new_objs)} new records.")
-
-                    # Bulk update existing objects
-                    if update_objs:
-                        for obj in update_objs:
-                            TradingView.objects.filter(ticker=obj.ticker).update(
-                                **{field: getattr(obj, field) for field in df.columns}
-                            )
-                        logger.info(f"Bulk updated {len(update_objs)} existing records.")
+                # Write the whole frame with set-based upserts
+                inserted, updated = upsert_dataframe(TradingView, df)
+                refresh_screener()
+                bump_autocomplete_on_commit(["TradingView"])
 
-                log_str = "TradingView Updated"
+                log_str = f"TradingView Updated. {inserted} inserted, {updated} updated."
                 status_txt = "success"
                 status = 200
-                return json_response(log_str, status_txt, status)
+                return json_response(log_str, status_txt, status, {"inserted": inserted, "updated": updated})
 
             else:
                 logger.warning("No new rows found in the TradingView CSV.")
@@ -298,194 +298,179 @@ class TradingViewCSVUploadAPIView(APIView):
             # Send for formatting
             df = format_df(df=df_tv)
 
-            # Convert DataFrame to a list of dictionaries
-            dicts = df.to_dict("records")
+            # Write the whole frame with set-based upserts
+            inserted, updated = upsert_dataframe(TradingView, df)
+            refresh_screener()
+            bump_autocomplete_on_commit(["TradingView"])
 
-            # Fetch existing tickers to determine which rows need updates vs. creates
-            existing_tickers = set(
-                TradingView.objects.filter(
-                    ticker__in=[row["ticker"] for row in dicts]
-                ).values_list("ticker", flat=True)
+            return Response(
+                {"message": "TradingView Updated", "inserted": inserted, "updated": updated},
+                status=status.HTTP_200_OK,
             )
 
-            new_objs = []
-            update_objs = []
-
-            for row in dicts:
-                if row["ticker"] in existing_tickers:
-                    update_objs.append(TradingView(**row))
-                else:
-                    new_objs.append(TradingView(**row))
-
-            logger.debug(f"Prepared {len(new_objs)} new objects and {len(update_objs)} updates for the database.")
-
-            # Using Django's atomic transaction to ensure data integrity
-            with transaction.atomic():
-                # Bulk create new objects
-                TradingView.objects.bulk_create(
-                    new_objs, ignore_conflicts=True
-                )
-                logger.info(f"Bulk created {len(new_objs)} new records.")
-
-                # Bulk update existing objects
-                if update_objs:
-                    for obj in update_objs:
-                        TradingView.objects.filter(ticker=obj.ticker).update(
-                            **{field: getattr(obj, field) for field in df.columns}
-                        )
-                    logger.info(f"Bulk updated {len(update_objs)} existing records.")
-
-            return Response({"message": "TradingView Updated"}, status=status.HTTP_200_OK)
-
         else:
             logger.warning("No new rows found in the TradingView CSV.")
             return Response({"message": "New TradingView csv not found."}, status=status.HTTP_204_NO_CONTENT)
 
 
-class TradingviewObjectiveViewSet(viewsets.ModelViewSet):
+@method_decorator(gzip_page, name="dispatch")
+class TradingviewObjectiveViewSet(viewsets.ReadOnlyModelViewSet):
     # permission_classes = [IsAuthenticated]
     serializer_class = TradingviewObjectiveSerializer
-
-    def get_queryset(self):
-        # Subquery to fetch fields from ManualMeta
-        subquery_mm = ManualMeta.objects.filter(ticker=OuterRef("ticker")).values(
-            "asset_class",
-            "country__name",
-            "sub_region__name",
-            "region__name",
-            "objective",
-            "hedge_ccy",
-        )[:1]
-
-        # Subquery to fetch fields from Monthly Volume
-        subquery_mv = (
-            MonthlyVolume.objects.filter(ticker=OuterRef("ticker"))
-            .values("gbp_turnover", "number_of_trades", "volume", "avg_trade_size")
-            .annotate(
-                turnover_monthly=F("gbp_turnover"),
-                num_trades_monthly=F("number_of_trades"),
-                volume_monthly=F("volume"),
-                avg_trade_size_monthly=F("avg_trade_size"),
-            )
-            .values(
-                "turnover_monthly",
-                "num_trades_monthly",
-                "volume_monthly",
-                "avg_trade_size_monthly",
-            )[:1]
-        )
-
-        # Subquery to fetch fields from Weekly Volume
-        subquery_wv = (
-            WeeklyVolume.objects.filter(ticker=OuterRef("ticker"))
-            .values("gbp_turnover", "number_of_trades", "avg_spread", "avg_trade_size")
-            .annotate(
-                turnover_weekly=F("gbp_turnover"),
-                num_trades_weekly=F("number_of_trades"),
-                avg_trade_size_weekly=F("avg_trade_size"),
-            )
-            .values(
-                "turnover_weekly",
-                "num_trades_weekly",
-                "avg_spread",
-                "avg_trade_size_weekly",
-            )[:1]
-        )
-
-        # Get trading_currency from Etp and Equity table
-        equity_query = Equity.objects.filter(ticker=OuterRef("ticker")).values(
-            "trading_currency"
-        )[:1]
-        etp_query = Etp.objects.filter(ticker=OuterRef("ticker")).values(
-            "trading_currency"
-        )[:1]
-
-        # Combine the individual querysets using union
-        combined_query = equity_query.union(etp_query)
-
-        # Use the combined queryset in a subquery for annotation to TradingView
-        subquery_trading_currency = combined_query.values("trading_currency")[:1]
-
-        # Main query for TradingView with the subquery
-        queryset = TradingView.objects.annotate(
-            asset_class=Subquery(
-                subquery_mm.values("asset_class"), output_field=CharField()
-            ),
-            country=Subquery(
-                subquery_mm.values("country__name"), output_field=CharField()
-            ),
-            region=Subquery(
-                subquery_mm.values("region__name"), output_field=CharField()
-            ),
-            sub_region=Subquery(
-                subquery_mm.values("sub_region__name"), output_field=CharField()
-            ),
-            objective=Subquery(
-                subquery_mm.values("objective"), output_field=CharField()
-            ),
-            hedge_ccy=Subquery(
-                subquery_mm.values("hedge_ccy"), output_field=CharField()
-            ),
-            turnover_monthly=Subquery(
-                subquery_mv.values("turnover_monthly"), output_field=FloatField()
-            ),
-            num_trades_monthly=Subquery(
-                subquery_mv.values("num_trades_monthly"), output_field=IntegerField()
-            ),
-            volume_monthly=Subquery(
-                subquery_mv.values("volume_monthly"), output_field=FloatField()
-            ),
-            avg_trade_size_monthly=Subquery(
-                subquery_mv.values("avg_trade_size_monthly"), output_field=FloatField()
-            ),
-            turnover_weekly=Subquery(
-                subquery_wv.values("turnover_weekly"), output_field=FloatField()
-            ),
-            num_trades_weekly=Subquery(
-                subquery_wv.values("num_trades_weekly"), output_field=IntegerField()
-            ),
-            avg_spread=Subquery(
-                subquery_wv.values("avg_spread"), output_field=FloatField()
-            ),
-            avg_trade_size_weekly=Subquery(
-                subquery_wv.values("avg_trade_size_weekly"), output_field=FloatField()
-            ),
-            trading_currency=Subquery(
-                subquery_trading_currency, output_field=CharField()
-            ),
-        ).order_by("asset_class", "region", "country", "objective")
-
-        # Caching watchlist and portfolio checks
-        tickers = queryset.values_list("ticker", flat=True)
-        watchlist = set(
-            Watchlist.objects.filter(id__in=tickers).values_list("id", flat=True)
-        )
-        portfolio = set(
-            CurrentInvestment.objects.filter(ticker__in=tickers).values_list(
-                "ticker", flat=True
-            )
-        )
-
-        self.request.watchlist_cache = watchlist
-        self.request.portfolio_cache = portfolio
-
+    renderer_classes = TABULAR_RENDERER_CLASSES
+    # Only paginates when the request has a cursor or page_size param
+    pagination_class = ScreenerPagination
+
+    # Query params matched exactly. A comma separated list matches any of its values
+    exact_filters = constants.SCREENER_EXACT_FILTERS
+    # Query param to numeric field lookup
+    threshold_filters = {
+        "min_turnover_monthly": "turnover_monthly__gte",
+        "min_turnover_weekly": "turnover_weekly__gte",
+        "min_num_trades_weekly": "num_trades_weekly__gte",
+        "max_avg_spread": "avg_spread__lte",
+    }
+    # Numeric fields the ordering param accepts, each optionally prefixed with - for descending
+    ordering_fields = constants.SCREENER_NUMERIC_FIELDS
+    # Unpaginated JSON and columnar requests are answered from the worker's in-memory snapshot
+    use_snapshot = True
+
+    def screener_params(self):
+        """
+        The filter, ordering and limit query params, validated.
+
+        :return: Tuple of (exact, thresholds, ordering, limit). exact is a dict of field to allowed values,
+            thresholds a list of (field, "gte" or "lte", value) and ordering a list of (field, descending)
+        """
+        params = self.request.query_params
+        exact = {field: params[field].split(",") for field in self.exact_filters if params.get(field)}
+        thresholds = []
+        for param, lookup in self.threshold_filters.items():
+            if params.get(param):
+                try:
+                    thresholds.append((*lookup.split("__"), float(params[param])))
+                except ValueError:
+                    raise ValidationError({param: "Must be a number."})
+        ordering = []
+        for field in filter(None, params.get("ordering", "").split(",")):
+            if field.lstrip("-") not in self.ordering_fields:
+                raise ValidationError({"ordering": f"Can only order by {', '.join(self.ordering_fields)}."})
+            ordering.append((field.lstrip("-"), field.startswith("-")))
+        limit = None
+        if params.get("limit"):
+            try:
+                limit = int(params["limit"])
+            except ValueError:
+                raise ValidationError({"limit": "Must be an integer."})
+            if limit < 1:
+                raise ValidationError({"limit": "Must be at least 1."})
+        # The cursor is a position in the default order
+        if (ordering or limit) and self.paginator.is_requested(self.request):
+            raise ValidationError({"ordering": "ordering and limit cannot be combined with cursor pagination."})
+        return exact, thresholds, ordering, limit
+
+    def filter_queryset(self, queryset):
+        exact, thresholds, ordering, limit = self.screener_params()
+        for field, values in exact.items():
+            queryset = queryset.filter(**{f"{field}__in": values})
+        for field, op, value in thresholds:
+            queryset = queryset.filter(**{f"{field}__{op}": value})
+        if ordering:
+            # NULLs last either way, then the default order to break ties
+            order = [
+                F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+                for field, descending in ordering
+            ]
+            queryset = queryset.order_by(*order, *sort_keys(self.pagination_class.ordering))
+        if limit:
+            queryset = queryset[:limit]
         return queryset
 
+    @cached_response("screener")
+    def list(self, request, *args, **kwargs):
+        if "since" in request.query_params:
+            return self.changes(request)
+        # Plain JSON and the columnar formats are written straight from the column values instead of through
+        # the serializer
+        try:
+            tabular = isinstance(request.accepted_renderer, TabularRenderer)
+            paginated = self.paginator.is_requested(request)
+            # The snapshot holds JSON, so renderers that pack values themselves read the rows instead
+            from_json = fast_json_applies(request) or (tabular and not request.accepted_renderer.needs_values)
+            if self.use_snapshot and from_json and not paginated:
+                return self.snapshot_list(request)
+            if fast_json_applies(request):
+                return self.fast_list(request)
+            if tabular:
+                return self.tabular_list(request)
+        except FastPathUnsupported as e:
+            logger.info(f"Screener fast path not used. {e}")
+        return super().list(request, *args, **kwargs)
+
+    def snapshot_list(self, request):
+        """The same bytes as fast_list and tabular_list, selected from this worker's snapshot."""
+        exact, thresholds, ordering, limit = self.screener_params()
+        snapshot = screener_snapshot()
+        positions = snapshot.select(exact, thresholds, ordering, limit)
+        if fast_json_applies(request):
+            return HttpResponse(snapshot.json(positions), content_type="application/json")
+        table = Table(schema=snapshot.schema, columns=snapshot.columns(positions))
+        return request.accepted_renderer.streaming_response(table)
+
+    def changes(self, request):
+        """
+        Delta sync: the rows upserted and the tickers deleted since a change version, and the version to ask
+        from next time. since=0 returns every row. Filters and pagination are not applied.
+        """
+        try:
+            since = int(request.query_params["since"])
+        except ValueError:
+            raise ValidationError({"since": "Must be an integer."})
+        # Read the version first, so a change committed after it is sent again next time rather than missed
+        version = current_screener_version()
+        queryset = self.get_queryset().filter(change_version__gt=since)
+        tombstones = ScreenerTombstone.objects.filter(change_version__gt=since).order_by("ticker")
+        deleted = list(tombstones.values_list("ticker", flat=True))
+        if fast_json_applies(request):
+            try:
+                serializer = self.get_serializer()
+                upserted = serializer_json(serializer, list(queryset.values_list(*serializer_sources(serializer))))
+                body = f'{{"version":{version},"upserted":{upserted},"deleted":{dump_json(deleted)}}}'
+                return HttpResponse(body.encode(), content_type="application/json")
+            except FastPathUnsupported as e:
+                logger.info(f"Screener fast path not used. {e}")
+        upserted = self.get_serializer(queryset, many=True).data
+        return Response({"version": version, "upserted": upserted, "deleted": deleted})
+
+    def values_page(self, request):
+        """
+        The filtered page, or every row when not paginated, as values_list rows in serializer field order,
+        and the next page link.
+        """
+        serializer = self.get_serializer()
+        # Named rows so the paginator can read the cursor columns off the last row
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*serializer_sources(serializer), named=True)
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
+        next_link = self.paginator.get_next_link() if page is not None else None
+        return serializer, rows, page is not None, next_link
+
+    def fast_list(self, request):
+        """The same bytes as list() renders with JSONRenderer, built from values_list rows."""
+        serializer, rows, paginated, next_link = self.values_page(request)
+        body = serializer_json(serializer, rows)
+        if paginated:
+            body = f'{{"next":{"null" if next_link is None else encode_basestring(next_link)},"results":{body}}}'
+        return HttpResponse(body.encode(), content_type="application/json")
+
+    def tabular_list(self, request):
+        """One array per column, streamed by the columnar JSON or MessagePack renderer."""
+        serializer, rows, _, next_link = self.values_page(request)
+        table = Table.from_rows(serializer, rows, next_link=next_link)
+        return request.accepted_renderer.streaming_response(table)
 
-def months_between_dates(date1, date2):
-    """Calculate the month diff to attach to instrument url."""
-    # Ensure date1 is earlier than date2
-    if date1 > date2:
-        date1, date2 = date2, date1
-
-    # Calculate the difference in years and months
-    years_diff = date2.year - date1.year
-    months_diff = date2.month - date1.month
-
-    # Convert years and months to total months
-    total_months = years_diff * 12 + months_diff
-
-    return total_months
+    def get_queryset(self):
+        return screener_queryset()
 
 
 def format_df(df):
@@ -512,23 +497,14 @@ class InstrumentUploadView(APIView):
     def get(self, request):
         """Fetch the latest instrument sheet from the London Stock Exchange website."""
         print("Fetching instruments....")
-        # This is the date of the first spreadsheet on the LSE server
-        start_date = constants.INSTRUMENT_START_DATE
-        current_date = datetime.today()
-
-        # Get the month prefix for url and build full url
-        url_tail = months_between_dates(start_date, current_date)
-        base_url = constants.INSTRUMENT_BASE_URL
-        url = f"{base_url}{url_tail}.xlsx"
-
-        # Try and fetch the url
-        res = requests.get(url)
-        # If status 404 the get previous month
-        if res.status_code == 404:
-            url_tail = url_tail - 1
-            url = f"{base_url}{url_tail}.xlsx"
-        # Try and fetch the either this month or last month
-        res = requests.get(url)
+        # Find this month's or last month's workbook without downloading either
+        url, period = ReportLocator().locate("instrument")
+        if url is None:
+            return json_response("No instrument workbook found for this month or last month.", "error", 404)
+
+        # Fetch the url, revalidating any cached copy
+        cache = ReportCache()
+        res = cache.fetch(url)
         print("Fetching: ", {url})
         print("res.staus.code: ", res.status_code)
         if res.status_code == requests.codes.ok:
@@ -536,139 +512,78 @@ class InstrumentUploadView(APIView):
                 f"Instrument URL successfully fetched. Status Code: {res.status_code}"
             )
             logger.info(log_str)
-            # This will ensure that only the first iteration clears the table, every other df is appended
-            etp_table_cleared = False
-            # Try to read to dataframe and suppress the warning about no default style
-            warnings.simplefilter("ignore", category=UserWarning)
+            # Nothing to do if this report has already been loaded
+            if res.unchanged:
+                log_str = f"Instrument file unchanged since last upload."
+                return json_response(log_str, "success", 200, {"report_cache": cache.stats})
+            # Read every sheet in one pass over the workbook
+            try:
+                sheets, sheet_stats = read_workbook(
+                    res.content, constants.INSTRUMENT_SHEET_MAP, constants.INSTRUMENT_SKIP_ROWS
+                )
+            except Exception as e:
+                log_str = f"Error reading instrument workbook. {e}"
+                return json_response(log_str, "error", 500)
+            # Sheets that share a table (ETFs, ETCs and ETNs) are collected and loaded together
+            frames = {}
+            failed_models = set()
+            num_duplicates = 0
             for i in constants.INSTRUMENT_SHEET_MAP:
+                model = constants.INSTRUMENT_MODEL_MAP[i]["model"]
+                if i not in sheets:
+                    failed_models.add(model)
+                    log_str = f"Error importing data. {sheet_stats[i]['error']}"
+                    status_txt = "error"
+                    status = res.status_code
+                    continue
+                df = sheets[i]
+                # Check that df is not empty before sending for formatting
+                if len(df) > 0:
+                    # Drop duplicates - LSE error
+                    len_all_etfs = len(df)
+                    df = df.drop_duplicates(subset=["ticker"])
+                    num_duplicates += len_all_etfs - len(df)
+                    frames.setdefault(model, []).append(format_df(df=df))
+                else:
+                    failed_models.add(model)
+                    log_str = f"Instrument dataframe is empty."
+                    status_txt = "error"
+                    status = res.status_code
+
+            # Never replace a table from a partial set of its sheets as the missing rows would be deleted
+            loaded = {}
+            for model, model_frames in frames.items():
+                if model in failed_models:
+                    logger.error(f"Skipping {model} load as one of its sheets could not be read.")
+                    continue
+                df = pd.concat(model_frames)
+                len_all = len(df)
+                df = df.drop_duplicates(subset=["ticker"])
+                num_duplicates += len_all - len(df)
                 try:
-                    df = pd.read_excel(
-                        io.BytesIO(res.content),
-                        engine="openpyxl",
-                        skiprows=constants.INSTRUMENT_SKIP_ROWS,
-                        sheet_name=i,
-                    )
-                    # Restore warnings to their default behavior
-                    warnings.resetwarnings()
-                    # Map column names to lower case as there is no standard in workbook e.g. Start Date, Start date
-                    df.columns = map(str.lower, df.columns)
-                    # Rename columns with correct column names for insertion to db
-                    df = df.rename(columns=constants.INSTRUMENT_SHEET_MAP[i])
-                    # Fetch the columns we need from the mapping and filter the df to include only the columns needed in db
-                    columns = constants.INSTRUMENT_SHEET_MAP[i].values()
-                    df = df[columns]
-                    # Check that df is not empty and get table name before sending for formatting
-                    if len(df) > 0:
-                        model = constants.INSTRUMENT_MODEL_MAP[i]["model"]
-                        # Drop duplicates - LSE error
-                        len_all_etfs = len(df)
-                        df = df.drop_duplicates(subset=["ticker"])
-                        num_duplicates = len_all_etfs - len(df)
-                        df = format_df(df=df)
-                        row_iter = df.iterrows()
-                        # Can't figure out how to make this dynamic yet
-                        if model == "Equity":
-                            objs = [
-                                Equity(
-                                    ticker=row["ticker"],
-                                    issuer_name=row["issuer_name"],
-                                    instrument_name=row["instrument_name"],
-                                    isin=row["isin"],
-                                    mifir_identifier_code=row["mifir_identifier_code"],
-                                    icb_industry=row["icb_industry"],
-                                    icb_super_sector=row["icb_super_sector"],
-                                    country_of_incorporation=row[
-                                        "country_of_incorporation"
-                                    ],
-                                    start_date=row["start_date"],
-                                    trading_currency=row["trading_currency"],
-                                    mkt_cap_mm=row["mkt_cap_mm"],
-                                    lse_market=row["lse_market"],
-                                    fca_listing_category=row["fca_listing_category"],
-                                    market_segment_code=row["market_segment_code"],
-                                    market_sector_code=row["market_sector_code"],
-                                )
-                                for index, row in row_iter
-                            ]
-
-                        if model == "Bond":
-                            objs = [
-                                Bond(
-                                    ticker=row["ticker"],
-                                    issuer_name=row["issuer_name"],
-                                    instrument_name=row["instrument_name"],
-                                    isin=row["isin"],
-                                    mifir_identifier_code=row["mifir_identifier_code"],
-                                    mifir_sub_class_code=row["mifir_sub_class_code"],
-                                    mifir_sub_class_name=row["mifir_sub_class_name"],
-                                    start_date=row["start_date"],
-                                    maturity_date=row["maturity_date"],
-                                    coupon_interest_rate=row["coupon_interest_rate"],
-                                    country_of_incorporation=row[
-                                        "country_of_incorporation"
-                                    ],
-                                    trading_currency=row["trading_currency"],
-                                    lse_market=row["lse_market"],
-                                    fca_listing_category=row["fca_listing_category"],
-                                    market_segment_code=row["market_segment_code"],
-                                    market_sector_code=row["market_sector_code"],
-                                )
-                                for index, row in row_iter
-                            ]
-
-                        if model == "Etp":
-                            objs = [
-                                Etp(
-                                    ticker=row["ticker"],
-                                    issuer_name=row["issuer_name"],
-                                    instrument_name=row["instrument_name"],
-                                    isin=row["isin"],
-                                    mifir_identifier_code=row["mifir_identifier_code"],
-                                    start_date=row["start_date"],
-                                    country_of_incorporation=row[
-                                        "country_of_incorporation"
-                                    ],
-                                    trading_currency=row["trading_currency"],
-                                    lse_market=row["lse_market"],
-                                    fca_listing_category=row["fca_listing_category"],
-                                    market_segment_code=row["market_segment_code"],
-                                    market_sector_code=row["market_sector_code"],
-                                )
-                                for index, row in row_iter
-                            ]
-                        try:
-                            match model:
-                                case "Etp":
-                                    # Check if etp table has been cleared
-                                    if etp_table_cleared == False:
-                                        Etp.objects.all().delete()
-                                        etp_table_cleared = True
-                                        Etp.objects.bulk_create(objs)
-                                    else:
-                                        Etp.objects.bulk_create(objs)
-                                case "Equity":
-                                    # Clear equity table before reinserting
-                                    Equity.objects.all().delete()
-                                    Equity.objects.bulk_create(objs)
-                                case "Bond":
-                                    # Clear bond table before reinserting
-                                    Bond.objects.all().delete()
-                                    Bond.objects.bulk_create(objs)
-                            log_str = f"Instrument file uploaded. {num_duplicates} duplicates removed."
-                            status_txt = "success"
-                            status = 200
-                        except Exception as e:
-                            log_str = f"Error importing data. {e}"
-                            status_txt = "error"
-                            status = res.status_code
-                    else:
-                        log_str = f"Instrument dataframe is empty."
-                        status_txt = "error"
-                        status = res.status_code
+                    # Load a shadow copy and swap it in so readers never see a partial table
+                    rows, retained = swap_dataframe(apps.get_model("investment", model), df)
+                    loaded[model] = {"rows": rows, "retained": retained}
                 except Exception as e:
+                    failed_models.add(model)
                     log_str = f"Error importing data. {e}"
                     status_txt = "error"
                     status = res.status_code
+
+            if loaded:
+                # The screener takes trading currencies from the instrument master
+                refresh_instruments()
+                refresh_screener()
+                bump_autocomplete_on_commit(loaded)
+            if not failed_models:
+                cache.mark_processed(url)
+                log_str = f"Instrument file uploaded. {num_duplicates} duplicates removed."
+                status_txt = "success"
+                status = 200
+            return json_response(
+                log_str, status_txt, status,
+                {"loaded": loaded, "sheets": sheet_stats, "report_cache": cache.stats},
+            )
         else:
             print("Oh my god an error!: ")
             status_txt = "error"
@@ -680,256 +595,169 @@ class MonthlyVolumesUploadView(APIView):
     # permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # Get the last month's date by taking the first day of this month and subtracting one day
-        today = date.today()
-        first_day_of_this_month = today.replace(day=1)
-        last_month_date = first_day_of_this_month - timedelta(days=1)
-        year = last_month_date.strftime("%Y")
-        last_month_name = last_month_date.strftime("%B")
-        last_month = ""
-        # Construct the equity URL for the last month
-        equity_url_tail = f"{last_month_name}%20{year}.xlsx"
-        equity_url_base_url = constants.MONTHLY_EQUITY_BASE_URL
-        equity_url = f"{equity_url_base_url}{equity_url_tail}"
-        # Try and fetch the url
+        """Fetch the latest monthly equity and ETP trading statistics, downloading and parsing both at once."""
+        timings = {}
+        start = time.perf_counter()
+        # Find the latest month with published statistics without downloading any workbooks
+        period = ReportLocator().locate("monthly")[1]
+        timings["resolve"] = round(time.perf_counter() - start, 3)
+        if period is None:
+            return json_response("No monthly volume workbook found for the last two months.", "error", 404)
+        last_month = period.strftime("%B")
+        # The ETP workbook is published for the same month as the equity workbook
+        equity_url = monthly_equity_report_url(period)
+        etp_url = monthly_etp_report_url(period)
+
+        # Fetch both workbooks at once, revalidating any cached copies
+        start = time.perf_counter()
+        cache = ReportCache()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            res, etp_res = executor.map(cache.fetch, [equity_url, etp_url])
+        timings["download"] = round(time.perf_counter() - start, 3)
+        for name, response in [("Equity", res), ("ETP", etp_res)]:
+            if response.status_code != requests.codes.ok:
+                log_str = f"{name} Monthly Volume URL get request failed. Error Code: {response.status_code}"
+                return json_response(log_str, "error", response.status_code, {"timings": timings})
+        log_str = f"Monthly volume URLs successfully fetched. Status Code: {res.status_code}"
+        logger.info(log_str)
+        # Nothing to do if both reports have already been loaded
+        if res.unchanged and etp_res.unchanged:
+            log_str = f"Monthly volume files for {last_month} unchanged since last upload."
+            return json_response(log_str, "success", 200, {"report_cache": cache.stats, "timings": timings})
+
+        # Parse both workbooks in separate processes as openpyxl parsing holds the GIL
+        start = time.perf_counter()
         try:
-            # Attempt to fetch data for the last month
-            res = requests.get(equity_url)
-            if res.status_code != 200:
-                # If not successful, attempt the month before last
-                first_day_of_last_month = last_month_date.replace(day=1)
-                previous_month_date = first_day_of_last_month - timedelta(days=1)
-                prev_year = previous_month_date.strftime("%Y")
-                prev_month_name = previous_month_date.strftime("%B")
-                last_month = prev_month_name
-
-                # Construct the URL for the month before last
-                equity_url_tail = f"{prev_month_name}%20{prev_year}.xlsx"
-                equity_url = f"{equity_url_base_url}{equity_url_tail}"
-
-                # Attempt to fetch the data for the month before last
-                res = requests.get(equity_url)
-
-            # If still not successful, raise an exception to handle in except block
-            if res.status_code != 200:
-                raise Exception("Failed to fetch data for both months.")
-            # If successful
-            if res.status_code == requests.codes.ok:
-                last_month = last_month_name
-                log_str = f"Monthly volume URL successfully fetched. Status Code: {res.status_code}"
-                logger.info(log_str)
-                try:
-                    df = pd.read_excel(
-                        io.BytesIO(res.content),
-                        engine="openpyxl",
-                        skiprows=constants.MONTHLY_EQUITY_VOLUME_SKIP_ROWS,
-                        sheet_name=constants.MONTHLY_EQUITY_SHEET,
-                    )
-                    # Map column names to lower case as there is no standard in workbook e.g. Start Date, Start date
-                    df.columns = map(str.lower, df.columns)
-                    # Rename columns with correct column names for insertion to db
-                    df = df.rename(columns=constants.MONTHLY_EQUITY_VOLUME_MAP)
-                    # Fetch the columns we need from the mapping and filter the df to include only the columns needed in db
-                    columns = constants.MONTHLY_EQUITY_VOLUME_MAP.values()
-                    df = df[columns]
-
-                    # Calculate average size once column names have been normalised
-                    df = df.assign(
-                        avg_trade_size=lambda x: (x["gbp_turnover"] / x["number_of_trades"])
-                    )
-                    # Check that df is not empty and run for ETPs
-                    if len(df) > 0:
-                        df_equity = df
-                        # Construct etp url
-                        etp_url_tail = f"{last_month}%20{year}.xlsx"
-                        etp_url_base_url = constants.MONTHLY_ETP_BASE_URL
-                        etp_url = f"{etp_url_base_url}{etp_url_tail}"
-
-                        # Try and fetch the url
-                        res = requests.get(etp_url)
-                        if res.status_code == requests.codes.ok:
-                            log_str = f"Monthly volume URL successfully fetched. Status Code: {res.status_code}"
-                            logger.info(log_str)
-                            try:
-                                df = pd.read_excel(
-                                    io.BytesIO(res.content),
-                                    engine="openpyxl",
-                                    skiprows=constants.MONTHLY_ETP_VOLUME_SKIP_ROWS,
-                                    sheet_name=constants.MONTHLY_ETP_SHEET,
-                                )
-                                # Map column names to lower case as there is no standard in workbook e.g. Start Date, Start date
-                                df.columns = map(str.lower, df.columns)
-                                # Rename columns with correct column names for insertion to db
-                                df = df.rename(columns=constants.MONTHLY_ETP_VOLUME_MAP)
-                                # Fetch the columns we need from the mapping and filter the df to include only the columns needed in db
-                                columns = constants.MONTHLY_ETP_VOLUME_MAP.values()
-                                df = df[columns]
-                                # Calculate average size once column names have been normalised
-                                df = df.assign(
-                                    avg_trade_size=lambda x: (
-                                        x["gbp_turnover"] / x["number_of_trades"]
-                                    )
-                                )
-                                # Check that df is not empty and send df to ETP function
-                                if len(df) > 0:
-                                    df = pd.concat([df, df_equity])
-                                    # Drop duplicates - LSE error
-                                    len_all_etfs = len(df)
-                                    df = df.drop_duplicates(subset=["ticker"])
-                                    num_duplicates = len_all_etfs - len(df)
-                                    df = format_df(df=df)
-                                    row_iter = df.iterrows()
-                                    # Can't figure out how to make this dynamic yet
-                                    objs = [
-                                        MonthlyVolume(
-                                            ticker=row["ticker"],
-                                            isin=row["isin"],
-                                            gbp_turnover=row["gbp_turnover"],
-                                            number_of_trades=row["number_of_trades"],
-                                            avg_trade_size=row["avg_trade_size"],
-                                            volume=row["volume"],
-                                        )
-                                        for index, row in row_iter
-                                    ]
-                                    try:
-                                        MonthlyVolume.objects.all().delete()
-                                        MonthlyVolume.objects.bulk_create(objs)
-                                        log_str = f"File for {last_month} uploaded. {num_duplicates} duplicates removed."
-                                        status_txt = "success"
-                                        status = 200
-                                        return json_response(log_str, status_txt, status)
-                                    except Exception as e:
-                                        log_str = f"Error importing data. {e}"
-                                        status_txt = "error"
-                                        status = res.status_code
-                                        return json_response(log_str, status_txt, status)
-                                else:
-                                    log_str = f"Monthly dataframe is empty."
-                                    status_txt = "error"
-                                    status = res.status_code
-                                    return json_response(log_str, status_txt, status)
-
-                            except Exception as Argument:
-                                log_str = f"Error while reading Equity Monthly Volume workbook. Error is: {Argument}"
-                                status_txt = "error"
-                                status = res.status_code
-                                return json_response(log_str, status_txt, status)
-                        else:
-                            log_str = f"Equity Monthly Volume URL get request failed. Error Code: {res.status_code}"
-                            status_txt = "error"
-                            status = res.status_code
-                        return json_response(log_str, status_txt, status)
-                    else:
-                        log_str = f"Equity Monthly Volume dataframe is empty."
-                        status_txt = "error"
-                        status = res.status_code
-                        return json_response(log_str, status_txt, status)
-                except Exception as Argument:
-                    log_str = f"Error while reading Equity Monthly Volume workbook. Error is: {Argument}"
-                    status_txt = "error"
-                    status = res.status_code
-                    return json_response(log_str, status_txt, status)
-            else:
-                log_str = f"Equity Monthly Volume URL get request failed. Error Code: {res.status_code}"
-                status_txt = "error"
-                status = res.status_code
-                return json_response(log_str, status_txt, status)
+            pool = parse_pool()
+            equity_future = pool.submit(
+                parse_volume_sheet,
+                res.content,
+                constants.MONTHLY_EQUITY_SHEET,
+                constants.MONTHLY_EQUITY_VOLUME_MAP,
+                constants.MONTHLY_EQUITY_VOLUME_SKIP_ROWS,
+            )
+            etp_future = pool.submit(
+                parse_volume_sheet,
+                etp_res.content,
+                constants.MONTHLY_ETP_SHEET,
+                constants.MONTHLY_ETP_VOLUME_MAP,
+                constants.MONTHLY_ETP_VOLUME_SKIP_ROWS,
+            )
+            df_equity, timings["parse_equity"] = equity_future.result()
+            df_etp, timings["parse_etp"] = etp_future.result()
+        except BrokenProcessPool as Argument:
+            reset_parse_pool()
+            log_str = f"Monthly Volume parse worker failed. Error is: {Argument}"
+            return json_response(log_str, "error", 500, {"timings": timings})
+        except Exception as Argument:
+            log_str = f"Error while reading Monthly Volume workbooks. Error is: {Argument}"
+            return json_response(log_str, "error", 500, {"timings": timings})
+        timings["parse"] = round(time.perf_counter() - start, 3)
+
+        # Check that neither df is empty before combining
+        if len(df_equity) == 0 or len(df_etp) == 0:
+            log_str = f"{'Equity' if len(df_equity) == 0 else 'ETP'} Monthly Volume dataframe is empty."
+            return json_response(log_str, "error", 500, {"timings": timings})
+        df, num_duplicates = combine_monthly_volumes(df_equity, df_etp)
+        df = format_df(df=df)
+
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                # Replace the table contents in one COPY and merge
+                inserted, updated, deleted = copy_merge_dataframe(MonthlyVolume, df)
+                # Keep the month in the history table, replacing any earlier load of the same month
+                copy_merge_dataframe(
+                    MonthlyVolumeHistory,
+                    df.assign(period_end=month_end(period)),
+                    conflict_fields=("ticker", "period_end"),
+                    prune=False,
+                )
+                refresh_screener()
         except Exception as e:
-            # Handle exceptions and unsuccessful requests
-            status = res.status_code if 'res' in locals() else 500  # Default to 500 if no response is available
-            log_str = "Unable to fetch Monthly Volumes"
-            status_txt = "error"
-            status = res.status_code
-            return json_response(log_str, status_txt, status)
+            log_str = f"Error importing data. {e}"
+            return json_response(log_str, "error", 500, {"timings": timings})
+        timings["load"] = round(time.perf_counter() - start, 3)
+        cache.mark_processed(equity_url)
+        cache.mark_processed(etp_url)
+        log_str = f"File for {last_month} uploaded. {num_duplicates} duplicates removed."
+        logger.info(f"{log_str} Timings: {timings}")
+        return json_response(
+            log_str, "success", 200,
+            {
+                "inserted": inserted,
+                "updated": updated,
+                "deleted": deleted,
+                "report_cache": cache.stats,
+                "timings": timings,
+            },
+        )
 
 class WeeklyVolumesUploadView(APIView):
     # permission_classes = [IsAuthenticated]
 
-    def previous_friday(self, date, weeks_ago=0):
-        logger.debug(f"Calculating previous Friday for date: {date} with weeks_ago: {weeks_ago}")
-        last_friday = date - timedelta(days=(date.weekday() - 4) % 7)
-        previous_friday = last_friday - timedelta(weeks=weeks_ago)
-        logger.debug(f"Previous Friday calculated as: {previous_friday}")
-        return previous_friday
-
-    def construct_weekly_url_tail(self, date, weeks_ago=0):
-        last_friday = self.previous_friday(date, weeks_ago)
-        url_tail = f"{last_friday.day}%20{last_friday.strftime('%B')}%20{last_friday.year}.xlsx"
-        logger.debug(f"Constructed URL tail: {url_tail} for date: {date} and weeks_ago: {weeks_ago}")
-        return url_tail
-
-    def fetch_weekly_volume(self, weeks_ago=0):
-        url_tail = self.construct_weekly_url_tail(datetime.now(), weeks_ago)
-        url = f"{constants.WEEKLY_BASE_URL}{url_tail}"
-        logger.info(f"Fetching URL: {url}")
-        response = fetch_with_retry(url)
-        logger.debug(f"Response status for URL '{url}': {response.status_code}")
-        return response, url_tail
-
     def get(self, request):
         logger.info("WeeklyVolumesUploadView GET request received.")
 
-        # Initial fetch attempt
-        response, url_tail = self.fetch_weekly_volume()
+        # Find the latest Friday with a published workbook without downloading any
+        url, period = ReportLocator().locate("weekly")
+        if url is None:
+            logger.error("No weekly volume workbook found for recent Fridays.")
+            return Response({'message': "No weekly volume workbook found for recent Fridays."}, status=404)
+        url_tail = url.removeprefix(constants.WEEKLY_BASE_URL)
 
-        # Retry logic if not found (404)
-        if response.status_code == 404:
-            logger.warning("Received 404. Trying to fetch previous week's data.")
-            response, url_tail = self.fetch_weekly_volume(weeks_ago=1)
+        # Fetch the workbook, revalidating any cached copy
+        cache = ReportCache()
+        logger.info(f"Fetching URL: {url}")
+        response = cache.fetch(url)
+        logger.debug(f"Response status for URL '{url}': {response.status_code}")
 
         if response.status_code == requests.codes.ok:
             logger.info(f"Successfully fetched data for URL tail: {url_tail}")
-            try:
-                # Load the Excel file content into a DataFrame
-                df = pd.read_excel(
-                    io.BytesIO(response.content),
-                    engine="openpyxl",
-                    skiprows=constants.WEEKLY_ETP_VOLUME_SKIP_ROWS,
-                    sheet_name=constants.WEEKLY_ETP_VOLUME_SHEET,
+            clean_url_tail = url_tail.replace("%20", " ").replace(".xlsx", "")
+            # Nothing to do if this report has already been loaded
+            if response.unchanged:
+                logger.info(f"File for {clean_url_tail} unchanged since last upload.")
+                return Response(
+                    {
+                        'message': f"File for {clean_url_tail} unchanged since last upload.",
+                        'report_cache': cache.stats,
+                    },
+                    status=status.HTTP_200_OK,
                 )
-                logger.debug(f"DataFrame loaded with {len(df)} rows from {url_tail}")
-
-                # Standardize columns and check for required columns
-                df.columns = map(str.lower, df.columns)
-                df = df.rename(columns=constants.WEEKLY_ETP_VOLUME_MAP)
-                required_columns = constants.WEEKLY_ETP_VOLUME_MAP.values()
-                df = df[required_columns]
-                initial_count = len(df)
-                logger.debug(f"DataFrame columns after renaming: {df.columns.tolist()}")
-
-                # Drop duplicates and handle missing values in critical columns
-                df = df.drop_duplicates(subset=["ticker"])
-                logger.info(f"Dropped {initial_count - len(df)} duplicate rows. Rows remaining: {len(df)}")
-
-                columns_to_check = ["avg_trade_size", "gbp_turnover", "number_of_trades", "avg_spread"]
-                df[columns_to_check] = df[columns_to_check].replace("", pd.NA)
-                df = df.dropna(subset=columns_to_check)
-                logger.info(f"Dropped rows with empty critical fields. Rows remaining after cleanup: {len(df)}")
+            try:
+                # Parse the workbook, dropping duplicate tickers and rows with empty critical fields
+                df, seconds = parse_weekly_volume(response.content)
+                logger.info(f"Parsed {len(df)} rows from {url_tail} in {seconds}s")
 
                 if df.empty:
                     logger.warning("Equity Weekly Volume dataframe is empty after processing.")
                     return json_response("Equity Weekly Volume dataframe is empty.", "error", status.HTTP_204_NO_CONTENT)
 
-                # Prepare data for database insertion
-                objs = [
-                    WeeklyVolume(
-                        ticker=row["ticker"],
-                        isin=row["isin"],
-                        avg_trade_size=row["avg_trade_size"] or None,
-                        gbp_turnover=row["gbp_turnover"] or None,
-                        number_of_trades=row["number_of_trades"] or None,
-                        avg_spread=row["avg_spread"] or None,
+                # Replace the table contents in one COPY and merge
+                with transaction.atomic():
+                    inserted, updated, deleted = copy_merge_dataframe(WeeklyVolume, df)
+                    # Keep the week in the history table, replacing any earlier load of the same week
+                    copy_merge_dataframe(
+                        WeeklyVolumeHistory,
+                        df.assign(period_end=period),
+                        conflict_fields=("ticker", "period_end"),
+                        prune=False,
                     )
-                    for _, row in df.iterrows()
-                ]
-
-                # Clear existing records and insert new data
-                WeeklyVolume.objects.all().delete()
-                WeeklyVolume.objects.bulk_create(objs)
-                clean_url_tail = url_tail.replace("%20", " ").replace(".xlsx", "")
+                    refresh_screener()
+                cache.mark_processed(response.url)
                 logger.info(f"File for {clean_url_tail} uploaded successfully with {len(df)} records.")
 
-                return Response({'message': f"File for {clean_url_tail} uploaded successfully."}, status=status.HTTP_200_OK)
+                return Response(
+                    {
+                        'message': f"File for {clean_url_tail} uploaded successfully.",
+                        'inserted': inserted,
+                        'updated': updated,
+                        'deleted': deleted,
+                        'report_cache': cache.stats,
+                    },
+                    status=status.HTTP_200_OK,
+                )
 
             except Exception as e:
                 logger.error(f"Error processing Excel file: {str(e)}", exc_info=True)
@@ -939,6 +767,72 @@ class WeeklyVolumesUploadView(APIView):
             return Response({'message': f"URL request failed. Error Code: {response.status_code}"}, status=response.status_code)
 
 
+class VolumeTrendView(APIView):
+    # permission_classes = [IsAuthenticated]
+
+    # Period name to (history model, trend fields, default number of periods, most periods, 20 years)
+    periods = {
+        "monthly": (MonthlyVolumeHistory, ["gbp_turnover", "number_of_trades", "avg_trade_size"], 12, 240),
+        "weekly": (
+            WeeklyVolumeHistory, ["gbp_turnover", "number_of_trades", "avg_trade_size", "avg_spread"], 26, 1040
+        ),
+    }
+
+    def get(self, request):
+        """
+        Turnover, trade count and spread history for a ticker, or summed across every ticker with an objective.
+
+        Query params: ticker or objective, period (monthly or weekly, default monthly) and periods (how many
+        periods back to go, at most 20 years).
+        """
+        ticker = request.query_params.get("ticker")
+        objective = request.query_params.get("objective")
+        period = request.query_params.get("period", "monthly")
+        if bool(ticker) == bool(objective):
+            raise ValidationError({"detail": "Provide exactly one of ticker or objective."})
+        if period not in self.periods:
+            raise ValidationError({"period": f"Must be one of {list(self.periods)}."})
+        model, fields, default_periods, max_periods = self.periods[period]
+        try:
+            num_periods = int(request.query_params.get("periods", default_periods))
+        except ValueError:
+            raise ValidationError({"periods": "Must be an integer."})
+        # Fewer than one period is an empty trend and too many overflow the date arithmetic
+        if not 1 <= num_periods <= max_periods:
+            raise ValidationError({"periods": f"Must be between 1 and {max_periods}."})
+
+        # Both filters are served by an index: the (ticker, period_end) constraint or the period_end BRIN
+        if period == "monthly":
+            start = date.today() - relativedelta(months=num_periods)
+        else:
+            start = date.today() - timedelta(weeks=num_periods)
+        queryset = model.objects.filter(period_end__gt=start).order_by("period_end")
+
+        if ticker:
+            trend = queryset.filter(ticker=ticker).values("period_end", *fields)
+        else:
+            # Aggregate across the objective in the database, averaging the per ticker ratios
+            aggregates = {
+                field: Avg(field) if field in ("avg_trade_size", "avg_spread") else Sum(field)
+                for field in fields
+            }
+            trend = (
+                queryset.filter(ticker__in=ManualMeta.objects.filter(objective=objective).values("ticker"))
+                .values("period_end")
+                .annotate(tickers=Count("ticker"), **aggregates)
+            )
+
+        return Response(
+            {
+                "ticker": ticker,
+                "objective": objective,
+                "period": period,
+                "trend": list(trend),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class TradingViewDownloadView(APIView):
     # permission_classes = [IsAuthenticated]
 
@@ -990,47 +884,15 @@ class TradingViewDownloadView(APIView):
                 # Send for formatting
                 df = format_df(df=df_tv)
 
-                # Convert DataFrame to a list of dictionaries
-                dicts = df.to_dict("records")
-
-                # Fetch existing tickers to determine which rows need updates vs. creates
-                existing_tickers = set(
-                    TradingView.objects.filter(
-                        ticker__in=[row["ticker"] for row in dicts]
-                    ).values_list("ticker", flat=True)
-                )
-
-                new_objs = []
-                update_objs = []
-
-                for row in dicts:
-                    if row["ticker"] in existing_tickers:
-                        update_objs.append(TradingView(**row))
-                    else:
-                        new_objs.append(TradingView(**row))
-
-                logger.debug(f"Prepared {len(new_objs)} new objects and {len(update_objs)} updates for the database.")
-
-                # Using Django's atomic transaction to ensure data integrity
-                with transaction.atomic():
-                    # Bulk create new objects
-                    TradingView.objects.bulk_create(
-                        new_objs, ignore_conflicts=True
-                    )
-                    logger.info(f"Bulk created {len(new_objs)} new records.")
+                # Write the whole frame with set-based upserts
+                inserted, updated = upsert_dataframe(TradingView, df)
+                refresh_screener()
+                bump_autocomplete_on_commit(["TradingView"])
 
-                    # Bulk update existing objects
-                    if update_objs:
-                        for obj in update_objs:
-                            TradingView.objects.filter(ticker=obj.ticker).update(
-                                **{field: getattr(obj, field) for field in df.columns}
-                            )
-                        logger.info(f"Bulk updated {len(update_objs)} existing records.")
-
-                log_str = "TradingView Updated"
+                log_str = f"TradingView Updated. {inserted} inserted, {updated} updated."
                 status_txt = "success"
                 status = 200
-                return json_response(log_str, status_txt, status)
+                return json_response(log_str, status_txt, status, {"inserted": inserted, "updated": updated})
 
             else:
                 logger.warning("No new rows found in the TradingView CSV.")
@@ -1127,6 +989,8 @@ class WatchlistBulkUploadView(APIView):
 
             if watchlist_objects:
                 Watchlist.objects.bulk_create(watchlist_objects)
+                # bulk_create sends no save signals
+                touch_screener(valid_tickers)
                 logger.info(f"Successfully uploaded {len(watchlist_objects)} new tickers to the Watchlist.")
                 log_str = f"Successfully uploaded {len(watchlist_objects)} tickers to the Watchlist."
                 status_txt = "success"
@@ -1261,30 +1125,19 @@ class GetPresignedUrlView(APIView):
 
 
 # View to fetch data
+@method_decorator(gzip_page, name="dispatch")
 class CurrentInvestmentDetailView(APIView):
     # permission_classes = [IsAuthenticated]
+    renderer_classes = TABULAR_RENDERER_CLASSES
 
+    @cached_response("current_investments")
     def get(self, request):
         try:
             # Filter out investments with qty = 0 before performing annotations
             investments = CurrentInvestment.objects.filter(qty__gt=0)
 
-            # Subqueries for fetching trading_currency from Etp and Equity models
-            trading_currency_etp_subquery = Subquery(
-                Etp.objects.filter(ticker=OuterRef("ticker")).values("trading_currency")[:1]
-            )
-            trading_currency_equity_subquery = Subquery(
-                Equity.objects.filter(ticker=OuterRef("ticker")).values("trading_currency")[:1]
-            )
-
-            # Annotate investments with trading_currency (ETP first, then Equity)
-            investments = investments.annotate(
-                trading_currency=Coalesce(
-                    trading_currency_etp_subquery,
-                    trading_currency_equity_subquery,
-                    output_field=CharField(),
-                )
-            )
+            # Trading currency from the instrument master, joined through the ticker foreign key
+            investments = investments.annotate(trading_currency=F("ticker__trading_currency"))
 
             # Subquery to fetch the price from TradingView model
             price_subquery = Subquery(
@@ -1337,6 +1190,11 @@ class CurrentInvestmentDetailView(APIView):
             # Serialize the data
             serializer = CurrentInvestmentSerializer(investments, many=True)
 
+            # Columnar and MessagePack responses are streamed a column at a time
+            if isinstance(request.accepted_renderer, TabularRenderer):
+                table = Table.from_data(serializer.data, serializer.child.fields)
+                return request.accepted_renderer.streaming_response(table)
+
             # Return the response
             return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -1345,6 +1203,25 @@ class CurrentInvestmentDetailView(APIView):
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class PortfolioValuationView(APIView):
+    # permission_classes = [IsAuthenticated]
+
+    @cached_response("valuation")
+    def get(self, request):
+        """
+        GBP market value, cost, unrealized P&L and weights of the portfolio, in total and broken down by each of
+        ?dimensions=, a comma separated list that defaults to all of VALUATION_DIMENSIONS.
+        """
+        dimensions = request.query_params.get("dimensions")
+        dimensions = dimensions.split(",") if dimensions else constants.VALUATION_DIMENSIONS
+        unknown = set(dimensions) - set(constants.VALUATION_DIMENSIONS)
+        if unknown:
+            raise ValidationError(
+                {"dimensions": f"Can only break down by {', '.join(constants.VALUATION_DIMENSIONS)}."}
+            )
+        return Response(portfolio_valuation(dimensions), status=status.HTTP_200_OK)
+
+
 class UpdateCurrentInvestmentView(APIView):
     # permission_classes = [IsAuthenticated]
 
@@ -1367,52 +1244,19 @@ class UpdateCurrentInvestmentView(APIView):
 
         # Validate and fetch the foreign key objects
         try:
-            etp = Etp.objects.get(ticker=ticker)
+            instrument = Instrument.objects.get(ticker=ticker)
             book_obj = Book.objects.get(name=book)
-        except (Etp.DoesNotExist, Book.DoesNotExist) as e:
+        except (Instrument.DoesNotExist, Book.DoesNotExist) as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Retrieve the existing investment if it exists
-        investment = CurrentInvestment.objects.filter(ticker=etp, book=book_obj).first()
-
-        # Validate conditions for selling securities
-        if qty < 0:  # Selling shares
-            if not investment:  # No existing investment found
-                return Response(
-                    {"error": "Cannot sell a security you do not have a position in."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            elif investment.qty + qty < 0:  # Trying to sell more shares than owned
-                return Response(
-                    {
-                        "error": "Cannot sell more shares than you currently own.",
-                        "current_qty": investment.qty,
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-        # Handle existing or new investment creation
+        # The trade is written to the ledger and the position moved on by it together
         try:
-            if not investment:
-                # Creating a new investment
-                investment = CurrentInvestment.objects.create(
-                    ticker=etp,
-                    book=book_obj,
-                    qty=qty if qty > 0 else 0,
-                    avg_px=transaction_px,
-                    current_px=transaction_px,
-                )
-            else:
-                # Updating an existing investment
-                total_qty = investment.qty + qty
-                new_avg_px = (
-                    (investment.qty * investment.avg_px) + (qty * transaction_px)
-                ) / total_qty if total_qty != 0 else 0
-                investment.qty = total_qty
-                investment.avg_px = new_avg_px
-                investment.current_px = transaction_px
-                investment.save()
-
+            record_trade(book_obj, instrument, qty, transaction_px)
+        except TradeRejected as e:
+            error = {"error": str(e)}
+            if e.current_qty is not None:
+                error["current_qty"] = e.current_qty
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -1515,52 +1359,19 @@ class UpdateCurrentInvestmentView(APIView):
 
         # Validate and fetch the foreign key objects
         try:
-            etp = Etp.objects.get(ticker=ticker)
+            instrument = Instrument.objects.get(ticker=ticker)
             book_obj = Book.objects.get(name=book)
-        except (Etp.DoesNotExist, Book.DoesNotExist) as e:
+        except (Instrument.DoesNotExist, Book.DoesNotExist) as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Retrieve the existing investment if it exists
-        investment = CurrentInvestment.objects.filter(ticker=etp, book=book_obj).first()
-
-        # Validate conditions for selling securities
-        if qty < 0:  # Selling shares
-            if not investment:  # No existing investment found
-                return Response(
-                    {"error": "Cannot sell a security you do not have a position in."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            elif investment.qty + qty < 0:  # Trying to sell more shares than owned
-                return Response(
-                    {
-                        "error": "Cannot sell more shares than you currently own.",
-                        "current_qty": investment.qty,
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-        # Handle existing or new investment creation
+        # The trade is written to the ledger and the position moved on by it together
         try:
-            if not investment:
-                # Creating a new investment
-                investment = CurrentInvestment.objects.create(
-                    ticker=etp,
-                    book=book_obj,
-                    qty=qty if qty > 0 else 0,
-                    avg_px=transaction_px,
-                    current_px=transaction_px,
-                )
-            else:
-                # Updating an existing investment
-                total_qty = investment.qty + qty
-                new_avg_px = (
-                    (investment.qty * investment.avg_px) + (qty * transaction_px)
-                ) / total_qty if total_qty != 0 else 0
-                investment.qty = total_qty
-                investment.avg_px = new_avg_px
-                investment.current_px = transaction_px
-                investment.save()
-
+            record_trade(book_obj, instrument, qty, transaction_px)
+        except TradeRejected as e:
+            error = {"error": str(e)}
+            if e.current_qty is not None:
+                error["current_qty"] = e.current_qty
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -1571,8 +1382,47 @@ class UpdateCurrentInvestmentView(APIView):
             status=status.HTTP_200_OK,
         )
 
+
+class TradeImportView(APIView):
+    """
+    Record a batch of trades, sent as a JSON array or as a CSV file in "file", with the fields of
+    update-current-investments and an optional executed_at. The whole batch is recorded or, if any row is
+    rejected, none of it, with an error per rejected row.
+    """
+
+    def post(self, request):
+        file = request.FILES.get('file')
+        if file:
+            try:
+                rows = list(csv.DictReader(io.StringIO(file.read().decode("utf-8-sig"))))
+            except UnicodeDecodeError as e:
+                logger.error(f"Failed to read trades CSV: {e}")
+                return Response({"message": f"Failed to read CSV: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            return Response(
+                {"message": "Expected a JSON array of trades or a CSV file"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            trades, positions = import_trades(rows)
+        except TradeImportRejected as e:
+            logger.warning(f"Trade import of {len(rows)} rows rejected: {e}")
+            return Response({"message": str(e), "errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {
+                "message": f"Imported {trades} trades into {positions} positions",
+                "trades": trades,
+                "positions": positions,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class BookAPIView(APIView):
 
+    @cached_response("books")
     def get(self, request):
         # Retrieve all current investments
         books = Book.objects.all()
@@ -1582,6 +1432,70 @@ class BookAPIView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class ResponseCacheStatsView(APIView):
+    # permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Hit rate of the read endpoint response cache and the current data version."""
+        return Response(
+            {"data_version": get_data_version(), "views": response_cache_stats(CACHED_VIEWS)},
+            status=status.HTTP_200_OK,
+        )
+
+
+class AutocompleteView(APIView):
+    # permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Instruments whose ticker, ISIN or a word of their name starts with ?q=, from the in-memory prefix index."""
+        try:
+            limit = int(request.query_params.get("limit", constants.AUTOCOMPLETE_DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({"limit": "Must be an integer."})
+        if not 1 <= limit <= constants.AUTOCOMPLETE_MAX_LIMIT:
+            raise ValidationError({"limit": f"Must be between 1 and {constants.AUTOCOMPLETE_MAX_LIMIT}."})
+        return Response(autocomplete(request.query_params.get("q", ""), limit), status=status.HTTP_200_OK)
+
+
+class InstrumentSearchView(generics.ListAPIView):
+    """
+    Ranked full text search of equities, bonds and ETPs by issuer name, instrument name and sector, with
+    ?q= and numbered pages. If no instrument matches every word, those matching any of them are returned,
+    and if none matches any, those with a name similar to the query, so a misspelt name is still found.
+    """
+    # permission_classes = [IsAuthenticated]
+    serializer_class = InstrumentSearchSerializer
+    pagination_class = SearchPagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get("q", "")
+        queryset = instrument_search(query)
+        if queryset is None:
+            raise ValidationError({"q": "Must contain at least one word."})
+        if not queryset.exists():
+            queryset = instrument_search(query, match_all=False)
+        if not queryset.exists():
+            queryset = fuzzy_instrument_search(query)
+        return queryset
+
+
+class InstrumentDetailView(APIView):
+    # permission_classes = [IsAuthenticated]
+
+    def get(self, request, key):
+        """
+        Instrument master rows for a ticker or an ISIN. An ISIN can have a line per trading currency, so the
+        response is a list, with the ticker's own row first.
+        """
+        instruments = Instrument.objects.filter(Q(ticker=key) | Q(isin=key.upper())).order_by(
+            Case(When(ticker=key, then=Value(0)), default=Value(1)), "ticker"
+        )
+        serializer = InstrumentSerializer(instruments, many=True)
+        if not serializer.data:
+            return Response({"error": f"No instrument with ticker or ISIN {key}."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 class TestAPIView(APIView):
 # permission_classes = [IsAuthenticated]
     def previous_friday(self, date, weeks_ago=0):